@@ -20,8 +20,16 @@ login_manager = LoginManager()
 jwt = JWTManager()
 scheduler = BackgroundScheduler(daemon=True)
 
-def create_app():
-    """Tạo và cấu hình ứng dụng Flask"""
+def create_app(start_tasks=None, web=True):
+    """Tạo và cấu hình ứng dụng Flask
+    
+    Args:
+        start_tasks (bool, optional): Chạy các tác vụ nền (thu thập, cảnh báo)
+            trong process này. Mặc định theo MONITORING_EMBEDDED; process web
+            đặt False khi đã có process collector.py riêng.
+        web (bool): Đăng ký các blueprint giao diện và API; process
+            collector.py chỉ cần database và cấu hình nên đặt False.
+    """
     # Tạo ứng dụng Flask
     app = Flask(__name__)
     
@@ -41,7 +49,15 @@ def create_app():
     
     # Tạo các bảng database nếu chưa tồn tại
     with app.app_context():
+        # SQLite: pragma hiệu năng khi kết nối và cổng ghi tuần tự
+        from mik.app.database.engine import configure_engine
+        configure_engine(db.engine, app.config)
+        
         db.create_all()
+        
+        # Bảng đã có từ phiên bản trước không được create_all() thêm index mới
+        from mik.app.database.schema import ensure_indexes
+        ensure_indexes()
     
     # Các hàm tiện ích cho template
     @app.context_processor
@@ -51,7 +67,29 @@ def create_app():
             'app_version': app.config.get('APP_VERSION', '1.0.0')
         }
     
-    # Đăng ký các blueprint
+    if web:
+        register_blueprints(app)
+    
+    if start_tasks is None:
+        start_tasks = app.config.get('MONITORING_EMBEDDED', True)
+    
+    if start_tasks:
+        # Khởi động các tác vụ nền
+        from mik.app.tasks.monitoring import initialize_monitoring_tasks
+        from mik.app.tasks.alerts import initialize_alert_tasks
+        
+        with app.app_context():
+            initialize_monitoring_tasks()
+            initialize_alert_tasks()
+        
+        # Đảm bảo scheduler chạy
+        if not scheduler.running:
+            scheduler.start()
+    
+    return app
+
+def register_blueprints(app):
+    """Đăng ký các blueprint"""
     from mik.app.main.routes import init_app as init_main
     init_main(app)
     
@@ -72,17 +110,3 @@ def create_app():
     
     from mik.app.api.qrcodes import qrcode_bp
     app.register_blueprint(qrcode_bp)
-    
-    # Khởi động các tác vụ nền
-    from mik.app.tasks.monitoring import initialize_monitoring_tasks
-    from mik.app.tasks.alerts import initialize_alert_tasks
-    
-    with app.app_context():
-        initialize_monitoring_tasks()
-        initialize_alert_tasks()
-    
-    # Đảm bảo scheduler chạy
-    if not scheduler.running:
-        scheduler.start()
-    
-    return app
\ No newline at end of file
@@ -14,15 +14,30 @@ from mik.app.database.crud import (
     update_alert_rule, delete_alert_rule
 )
 from mik.app.core.mikrotik import (
-    get_device_metrics, get_device_clients, get_interface_traffic
+    get_device_metrics, get_device_clients, get_interface_traffic,
+    get_device_snapshot, get_connection_pool_stats, get_single_flight_stats, ALL_SNAPSHOT_SECTIONS,
+    get_circuit_breaker_states, reset_circuit_breaker
 )
 from mik.app.core.vpn import get_vpn_stats
+from mik.app.core.collector import get_collector_stats
+from mik.app.core.sharding import get_sharding_stats
+from mik.app.core.adaptive import get_adaptive_stats
+from mik.app.core.alerts import get_alert_stats
+from mik.app.database.ingest import get_ingest_stats
+from mik.app.database.rollups import metric_rollups, tier_name, get_rollup_stats
+from mik.app.database.chunks import metric_chunks
+from mik.app.database.series import get_series_stats
+from mik.app.database.engine import get_write_gate_stats
 from mik.app.utils.security import sanitize_input
 from mik.app.utils.time_series import resample_time_series
 
 logger = logging.getLogger('mikrotik_monitor.api.monitoring')
 bp = Blueprint('monitoring', __name__, url_prefix='/monitoring')
 
+def state_max_age():
+    """Seconds the latest stored state may be old (?max_age=, 0 reads the router)"""
+    return request.args.get('max_age', current_app.config.get('STATE_MAX_AGE', 0), type=float)
+
 @bp.route('/api/devices/<int:device_id>/metrics', methods=['GET'])
 @jwt_required()
 def get_device_metrics_route(device_id):
@@ -39,7 +54,7 @@ def get_device_metrics_route(device_id):
         return jsonify({"error": "Device not found"}), 404
     
     # Get metrics
-    metrics = get_device_metrics(device)
+    metrics = get_device_metrics(device, max_age=state_max_age())
     return jsonify(metrics), 200
 
 @bp.route('/api/devices/<int:device_id>/metrics/history', methods=['GET'])
@@ -67,6 +82,28 @@ def get_metrics_history(device_id):
     end_time = datetime.utcnow()
     start_time = end_time - timedelta(hours=hours)
     
+    resolution = None
+    if current_app.config.get('METRICS_ROLLUPS') and interval_minutes > 0:
+        # Tier thô nhất vẫn đủ chi tiết cho khoảng cách điểm được yêu cầu
+        resolution = metric_rollups.choose(interval_minutes * 60, start_time)
+    
+    if resolution:
+        metrics = rollup_history(device_id, resolution, metric_type, metric_name,
+                                 start_time, end_time, interval_minutes)
+    else:
+        metrics = raw_history(device_id, metric_type, metric_name, start_time, end_time, interval_minutes)
+    
+    return jsonify({
+        "device_id": device_id,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+        "interval_minutes": interval_minutes,
+        "resolution": tier_name(resolution) if resolution else 'raw',
+        "metrics": metrics
+    }), 200
+
+def raw_history(device_id, metric_type, metric_name, start_time, end_time, interval_minutes):
+    """Raw metrics of a time range, resampled to interval_minutes when positive"""
     # Get metrics from database
     metrics = get_metrics_for_device(
         device_id=device_id,
@@ -79,14 +116,28 @@ def get_metrics_history(device_id):
     # Resample metrics if needed
     if interval_minutes > 0 and len(metrics) > 0:
         metrics = resample_time_series(metrics, interval_minutes=interval_minutes)
-    
-    return jsonify({
-        "device_id": device_id,
-        "start_time": start_time.isoformat(),
-        "end_time": end_time.isoformat(),
-        "interval_minutes": interval_minutes,
-        "metrics": metrics
-    }), 200
+    return metrics
+
+def rollup_history(device_id, resolution, metric_type, metric_name, start_time, end_time, interval_minutes):
+    """Rollup points of a time range, with raw metrics for the part before the first bucket
+    
+    Rollups only exist from the time METRICS_ROLLUPS was enabled; older
+    history is still served, resampled from the raw metrics.
+    """
+    points = metric_rollups.query(
+        device_id, resolution,
+        metric_type=metric_type,
+        metric_name=metric_name,
+        start_time=start_time,
+        end_time=end_time,
+        interval_seconds=interval_minutes * 60
+    )
+    covered_from = datetime.fromisoformat(points[0]['timestamp']) if points else end_time
+    if covered_from <= start_time:
+        return points
+    raw = raw_history(device_id, metric_type, metric_name, start_time,
+                      covered_from - timedelta(microseconds=1), interval_minutes)
+    return raw + points
 
 @bp.route('/api/devices/<int:device_id>/clients', methods=['GET'])
 @jwt_required()
@@ -104,7 +155,7 @@ def get_clients_route(device_id):
         return jsonify({"error": "Device not found"}), 404
     
     # Get clients
-    clients = get_device_clients(device)
+    clients = get_device_clients(device, max_age=state_max_age())
     return jsonify(clients), 200
 
 @bp.route('/api/devices/<int:device_id>/traffic', methods=['GET'])
@@ -126,9 +177,33 @@ def get_traffic_route(device_id):
     interface_name = request.args.get('interface')
     
     # Get traffic data
-    traffic = get_interface_traffic(device, interface_name=interface_name)
+    traffic = get_interface_traffic(device, interface_name=interface_name, max_age=state_max_age())
     return jsonify(traffic), 200
 
+@bp.route('/api/devices/<int:device_id>/snapshot', methods=['GET'])
+@jwt_required()
+def get_snapshot_route(device_id):
+    """Get several tables of a device read in one API session"""
+    # Get user
+    identity = get_jwt_identity()
+    user = get_user_by_id(identity)
+    if not user:
+        return jsonify({"error": "Unauthorized access"}), 403
+    
+    # Get device
+    device = get_device_by_id(device_id)
+    if not device:
+        return jsonify({"error": "Device not found"}), 404
+    
+    # Get query parameters (?sections=resource,interfaces)
+    sections = request.args.get('sections')
+    sections = [s.strip() for s in sections.split(',') if s.strip()] if sections else None
+    if sections and any(s not in ALL_SNAPSHOT_SECTIONS for s in sections):
+        return jsonify({"error": f"Valid sections are: {', '.join(ALL_SNAPSHOT_SECTIONS)}"}), 400
+    
+    snapshot = get_device_snapshot(device, sections)
+    return jsonify(snapshot), 200
+
 @bp.route('/api/dashboard', methods=['GET'])
 @jwt_required()
 def get_dashboard_metrics():
@@ -361,4 +436,92 @@ def get_vpn_route(device_id):
     
     # Get VPN data
     vpn_data = get_vpn_stats(device)
-    return jsonify(vpn_data), 200
\ No newline at end of file
+    return jsonify(vpn_data), 200
+
+@bp.route('/api/connection-pool', methods=['GET'])
+@jwt_required()
+def get_connection_pool_route():
+    """Get RouterOS connection pool statistics"""
+    # Get user
+    identity = get_jwt_identity()
+    user = get_user_by_id(identity)
+    if not user:
+        return jsonify({"error": "Unauthorized access"}), 403
+    
+    stats = get_connection_pool_stats()
+    # Số lần đọc đồng thời giống nhau được gộp thành một lần gọi router
+    stats['single_flight'] = get_single_flight_stats()
+    return jsonify(stats), 200
+
+@bp.route('/api/collector', methods=['GET'])
+@jwt_required()
+def get_collector_route():
+    """Get metrics collection cycle statistics (duration, lag, overruns)"""
+    # Get user
+    identity = get_jwt_identity()
+    user = get_user_by_id(identity)
+    if not user:
+        return jsonify({"error": "Unauthorized access"}), 403
+    
+    stats = get_collector_stats()
+    if current_app.config.get('COLLECTOR_SHARDING'):
+        # Lease của mọi node, kể cả khi process web không tự thu thập
+        stats['sharding'] = get_sharding_stats()
+    
+    if current_app.config.get('MONITORING_ADAPTIVE'):
+        stats['adaptive'] = get_adaptive_stats()
+    
+    # Đánh giá rule cảnh báo trên các mẫu thu thập
+    stats['alerts'] = get_alert_stats()
+    
+    if current_app.config.get('INGEST_WRITE_BEHIND'):
+        stats['ingest'] = get_ingest_stats()
+    
+    if current_app.config.get('METRICS_ROLLUPS'):
+        stats['rollups'] = get_rollup_stats()
+    
+    chunks = metric_chunks()
+    if chunks:
+        stats['chunks'] = chunks.stats()
+    
+    if current_app.config.get('METRICS_STORAGE') == 'series':
+        stats['series'] = get_series_stats()
+    
+    if (current_app.config.get('SQLITE_TUNING') and current_app.config.get('SQLITE_WRITE_GATE')
+            and current_app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')):
+        stats['sqlite_write_gate'] = get_write_gate_stats()
+    
+    return jsonify(stats), 200
+
+@bp.route('/api/circuit-breakers', methods=['GET'])
+@jwt_required()
+def get_circuit_breakers_route():
+    """Get devices whose circuit breaker recorded failures (quarantined devices)"""
+    # Get user
+    identity = get_jwt_identity()
+    user = get_user_by_id(identity)
+    if not user:
+        return jsonify({"error": "Unauthorized access"}), 403
+    
+    states = get_circuit_breaker_states()
+    return jsonify({
+        "devices": states,
+        "open_count": sum(1 for state in states.values() if state['state'] != 'closed'),
+        "timestamp": datetime.utcnow().isoformat()
+    }), 200
+
+@bp.route('/api/circuit-breakers/<int:device_id>/reset', methods=['POST'])
+@jwt_required()
+def reset_circuit_breaker_route(device_id):
+    """Close the circuit breaker of a device so it is polled again immediately"""
+    # Get user
+    identity = get_jwt_identity()
+    user = get_user_by_id(identity)
+    
+    # Chỉ admin và operator có thể reset circuit breaker
+    if not user or (user.role != 'admin' and user.role != 'operator'):
+        return jsonify({"error": "Unauthorized access"}), 403
+    
+    reset_circuit_breaker(device_id)
+    logger.info(f"Circuit breaker reset by user {user.username} for device ID {device_id}")
+    return jsonify({"message": "Circuit breaker reset"}), 200
\ No newline at end of file
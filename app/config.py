@@ -26,6 +26,15 @@ class Config:
         "pool_pre_ping": True,
     }
     
+    # SQLite: WAL, các pragma hiệu năng và cổng ghi tuần tự (không áp dụng cho database khác)
+    SQLITE_TUNING = os.environ.get("SQLITE_TUNING", "1") == "1"
+    SQLITE_WRITE_GATE = os.environ.get("SQLITE_WRITE_GATE", "1") == "1"
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", "30000"))  # ms
+    SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", "-65536"))  # Số âm: KiB (64 MB)
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", "268435456"))  # byte
+    
     # Cấu hình JWT
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
     if not JWT_SECRET_KEY:
@@ -48,12 +57,81 @@ class Config:
     
     # Cấu hình quản lý thiết bị
     MONITORING_INTERVAL = int(os.environ.get("MONITORING_INTERVAL", "60"))  # giây
-    ALERT_CHECK_INTERVAL = int(os.environ.get("ALERT_CHECK_INTERVAL", "30"))  # giây
+    ALERT_CHECK_INTERVAL = int(os.environ.get("ALERT_CHECK_INTERVAL", "30"))  # giây, chu kỳ nạp lại rule cảnh báo
+    # Cách đánh giá rule: index (theo từng mẫu) hoặc vectorized (mảng NumPy, một lượt cho cả fleet)
+    ALERT_ENGINE = os.environ.get("ALERT_ENGINE", "index")
+    ALERT_EVALUATION_INTERVAL = float(os.environ.get("ALERT_EVALUATION_INTERVAL", "5"))  # giây, chỉ dùng với vectorized
+    ALERT_WINDOW_MAX_POINTS = int(os.environ.get("ALERT_WINDOW_MAX_POINTS", "1440"))  # Số mẫu tối đa mỗi cửa sổ duration
+    
+    # Cấu hình bộ thu thập
+    MONITORING_ASYNC = os.environ.get("MONITORING_ASYNC", "0") == "1"  # Dùng client asyncio
+    COLLECTOR_CONCURRENCY = int(os.environ.get("COLLECTOR_CONCURRENCY", "200"))  # Số thiết bị poll đồng thời
+    COLLECTOR_WORKERS = int(os.environ.get("COLLECTOR_WORKERS", "50"))  # Số worker của bộ thu thập đồng bộ
+    COLLECTOR_SPREAD = float(os.environ.get("COLLECTOR_SPREAD", "0.8"))  # Phần chu kỳ dùng để dàn đều thiết bị
+    MONITORING_INTERFACE_TYPES = os.environ.get("MONITORING_INTERFACE_TYPES", "ether,wlan,bridge").split(",")  # Interface được lưu tốc độ
+    MONITORING_SUBSCRIPTIONS = os.environ.get("MONITORING_SUBSCRIPTIONS", "0") == "1"  # Theo dõi thay đổi bằng listen
+    SUBSCRIPTION_RETRY_INTERVAL = int(os.environ.get("SUBSCRIPTION_RETRY_INTERVAL", "30"))  # giây
+    
+    # Tuổi tối đa (giây) của trạng thái mới nhất trong bộ nhớ mà API xem trực tiếp được dùng
+    # thay vì đọc router; ghi đè bằng tham số max_age, 0 = luôn đọc router
+    STATE_MAX_AGE = float(os.environ.get("STATE_MAX_AGE", "90"))
+    
+    # Cấu hình chia thiết bị cho nhiều bộ thu thập (xem collector.py)
+    MONITORING_EMBEDDED = os.environ.get("MONITORING_EMBEDDED", "1") == "1"  # Chạy tác vụ nền trong process web
+    COLLECTOR_SHARDING = os.environ.get("COLLECTOR_SHARDING", "0") == "1"  # Chia thiết bị bằng lease trong database
+    COLLECTOR_SHARDS = int(os.environ.get("COLLECTOR_SHARDS", "64"))  # Không đổi khi các node đang chạy
+    COLLECTOR_LEASE_TTL = int(os.environ.get("COLLECTOR_LEASE_TTL", "30"))  # giây
+    COLLECTOR_NODE_ID = os.environ.get("COLLECTOR_NODE_ID")  # Mặc định <hostname>-<pid>
+    
+    # Cấu hình chu kỳ poll thích ứng theo từng thiết bị
+    MONITORING_ADAPTIVE = os.environ.get("MONITORING_ADAPTIVE", "0") == "1"
+    ADAPTIVE_MIN_INTERVAL = int(os.environ.get("ADAPTIVE_MIN_INTERVAL", "15"))  # giây, cũng là nhịp của tác vụ thu thập
+    ADAPTIVE_MAX_INTERVAL = int(os.environ.get("ADAPTIVE_MAX_INTERVAL", "300"))  # giây
+    # Chu kỳ dài nhất của thiết bị có rule cảnh báo: tải tăng đột ngột không báo trước qua ngưỡng,
+    # nên chỉ thiết bị không có rule mới được giãn tới ADAPTIVE_MAX_INTERVAL
+    ADAPTIVE_RULE_MAX_INTERVAL = int(os.environ.get("ADAPTIVE_RULE_MAX_INTERVAL", str(MONITORING_INTERVAL)))  # giây
+    ADAPTIVE_THRESHOLD_MARGIN = float(os.environ.get("ADAPTIVE_THRESHOLD_MARGIN", "0.1"))  # Khoảng cách tương đối tới ngưỡng cảnh báo
+    
+    # Cấu hình ghi metrics theo lô bằng luồng riêng
+    INGEST_WRITE_BEHIND = os.environ.get("INGEST_WRITE_BEHIND", "0") == "1"
+    INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "5000"))  # Số dòng mỗi lần INSERT
+    INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "2"))  # giây
+    INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "500000"))  # Số dòng tối đa trong hàng đợi
+    
+    # Chia bảng metrics theo thời gian: none, day hoặc week
+    METRICS_PARTITIONING = os.environ.get("METRICS_PARTITIONING", "none")
+    
+    # Cách lưu điểm metrics: rows (mỗi giá trị một dòng), series (dòng chỉ có series_id số nguyên,
+    # tên metric nằm trong bảng metric_series) hoặc chunks (chuỗi nén Gorilla)
+    METRICS_STORAGE = os.environ.get("METRICS_STORAGE", "rows")
+    CHUNK_SECONDS = int(os.environ.get("CHUNK_SECONDS", "7200"))  # Độ dài thời gian của một chunk
+    CHUNK_FLUSH_INTERVAL = int(os.environ.get("CHUNK_FLUSH_INTERVAL", "60"))  # giây
+    
+    # Bảng tổng hợp theo bucket 1m/5m/1h/1d cho biểu đồ lịch sử
+    METRICS_ROLLUPS = os.environ.get("METRICS_ROLLUPS", "0") == "1"
+    ROLLUP_FLUSH_INTERVAL = int(os.environ.get("ROLLUP_FLUSH_INTERVAL", "60"))  # giây
+    ROLLUP_RETENTION = os.environ.get("ROLLUP_RETENTION", "1m=7d,5m=30d,1h=730d,1d=3650d")  # Thời gian giữ mỗi tier
     
     # Cấu hình kết nối MikroTik
     MIKROTIK_CONNECTION_TIMEOUT = int(os.environ.get("MIKROTIK_CONNECTION_TIMEOUT", "10"))
     MIKROTIK_COMMAND_TIMEOUT = int(os.environ.get("MIKROTIK_COMMAND_TIMEOUT", "15"))
     
+    # Gộp các lần đọc router giống nhau đang chạy đồng thời thành một lần gọi
+    SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "1") == "1"
+    
+    # Cấu hình circuit breaker cho thiết bị không truy cập được
+    BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "2"))  # Số lần lỗi liên tiếp
+    BREAKER_BASE_BACKOFF = int(os.environ.get("BREAKER_BASE_BACKOFF", "60"))  # giây
+    BREAKER_MAX_BACKOFF = int(os.environ.get("BREAKER_MAX_BACKOFF", "3600"))  # giây
+    
+    # Số mật khẩu thiết bị đã giải mã được giữ trong bộ nhớ (0 = tắt)
+    CREDENTIAL_CACHE_SIZE = int(os.environ.get("CREDENTIAL_CACHE_SIZE", "0"))
+    
+    # Cấu hình pool kết nối MikroTik
+    MIKROTIK_POOL_MAX_PER_DEVICE = int(os.environ.get("MIKROTIK_POOL_MAX_PER_DEVICE", "2"))
+    MIKROTIK_POOL_IDLE_TIMEOUT = int(os.environ.get("MIKROTIK_POOL_IDLE_TIMEOUT", "300"))  # giây
+    MIKROTIK_POOL_HEALTH_CHECK_AFTER = int(os.environ.get("MIKROTIK_POOL_HEALTH_CHECK_AFTER", "30"))  # giây
+    
     # Cấu hình email cho thông báo
     MAIL_SERVER = os.environ.get("MAIL_SERVER")
     MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
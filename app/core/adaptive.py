@@ -0,0 +1,258 @@
+"""
+Chu kỳ poll thích ứng cho từng thiết bị theo mức biến động của metrics và ngưỡng cảnh báo
+"""
+
+import time
+import logging
+import threading
+
+from mik.app.config import Config
+from mik.app.core.windows import CONDITIONS, parse_rule_metric, sample_value
+
+logger = logging.getLogger('mikrotik_monitor.adaptive')
+
+# Metrics dạng phần trăm được theo dõi: (nhóm, tên) -> thang đo
+PERCENT_METRICS = {
+    ('cpu', 'load'): 100.0,
+    ('memory', 'usage'): 100.0,
+    ('disk', 'usage'): 100.0,
+}
+
+# Tốc độ interface nhỏ hơn các mức này được coi là nhàn rỗi
+RATE_FLOORS = {'bps': 1e6, 'pps': 1e3}
+
+# Thay đổi tương đối của tốc độ interface được chia cho hệ số này, để
+# dao động 50% traffic tương đương 10 điểm phần trăm CPU
+RATE_DAMPING = 5.0
+
+
+def tracked_values(sample):
+    """Metrics used to measure volatility: percentages and interface rates"""
+    values = {}
+    for (metric_type, metric_name) in PERCENT_METRICS:
+        value = sample.get(metric_type, {}).get(metric_name)
+        if isinstance(value, (int, float)):
+            values[(metric_type, metric_name)] = float(value)
+    for key, value in sample.get('interface', {}).items():
+        values[('interface', key)] = float(value)
+    return values
+
+
+def volatility(previous, current):
+    """Largest normalized change between two sets of tracked values
+
+    Percentages change by points/100; interface rates by their relative
+    change (against at least an idle floor) divided by RATE_DAMPING.
+    """
+    score = 0.0
+    for key, value in current.items():
+        old = previous.get(key)
+        if old is None:
+            continue
+        scale = PERCENT_METRICS.get(key)
+        if scale is None:
+            floor = RATE_FLOORS['pps' if key[1].endswith('pps') else 'bps']
+            scale = max(abs(old), abs(value), floor) * RATE_DAMPING
+        score = max(score, abs(value - old) / scale)
+    return score
+
+
+class _DeviceState:
+    __slots__ = ('interval', 'scheduled_at', 'values', 'reason')
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.scheduled_at = None
+        self.values = {}
+        self.reason = 'initial'
+
+
+class AdaptivePolling:
+    """Per-device polling interval between a floor and a ceiling
+
+    The collection job ticks every 'floor' seconds and only polls devices
+    that are due. After each sample a device's interval is:
+
+    - set to the floor while a metric with an alert rule is within
+      'margin' of its threshold or already past it,
+    - halved when the sample changed by at least 'volatile',
+    - multiplied by 1.5 when it changed by at most 'stable',
+    - reset to the base interval when the poll failed,
+
+    and kept otherwise. Devices with alert rules never back off beyond
+    'rule_ceiling': a burst that is not preceded by a rise towards the
+    threshold is only caught by polling, so stretching their interval
+    trades missed and late alerts for fewer polls.
+    """
+
+    def __init__(self, base=None, floor=None, ceiling=None, volatile=0.1, stable=0.02,
+                 margin=None, rule_ceiling=None, clock=time.monotonic):
+        """
+        Args:
+            base (float, optional): Starting interval. Default Config.MONITORING_INTERVAL.
+            floor (float, optional): Shortest interval (also the tick).
+                Default Config.ADAPTIVE_MIN_INTERVAL.
+            ceiling (float, optional): Longest interval.
+                Default Config.ADAPTIVE_MAX_INTERVAL.
+            volatile (float): Volatility at which polling speeds up
+            stable (float): Volatility at or below which polling slows down
+            margin (float, optional): Relative distance to an alert
+                threshold counted as near. Default Config.ADAPTIVE_THRESHOLD_MARGIN.
+            rule_ceiling (float, optional): Longest interval of devices with
+                alert rules. Default Config.ADAPTIVE_RULE_MAX_INTERVAL.
+        """
+        self.floor = floor or Config.ADAPTIVE_MIN_INTERVAL
+        self.ceiling = max(self.floor, ceiling or Config.ADAPTIVE_MAX_INTERVAL)
+        self.base = min(max(base or Config.MONITORING_INTERVAL, self.floor), self.ceiling)
+        self.volatile = volatile
+        self.stable = stable
+        self.margin = Config.ADAPTIVE_THRESHOLD_MARGIN if margin is None else margin
+        self.rule_ceiling = min(max(self.floor, rule_ceiling or Config.ADAPTIVE_RULE_MAX_INTERVAL), self.ceiling)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._thresholds = {}
+        self._totals = {'ticks': 0, 'polls': 0, 'deferred': 0}
+
+    def set_rules(self, rules):
+        """Replace the alert thresholds used to detect devices near an alert
+
+        Args:
+            rules (iterable): Enabled alert rules, as objects or dictionaries
+                with device_id, metric, condition and threshold
+        """
+        thresholds = {}
+        for rule in rules:
+            get = rule.get if isinstance(rule, dict) else lambda key: getattr(rule, key, None)
+            if get('threshold') is None:
+                continue
+            # Rule có duration ghi hàm tổng hợp trước tên metric ('max:cpu_load'), mẫu chỉ có cpu_load
+            _, metric = parse_rule_metric(get('metric'))
+            thresholds.setdefault(get('device_id'), []).append(
+                (metric, get('condition'), float(get('threshold'))))
+        with self._lock:
+            self._thresholds = thresholds
+            # Thiết bị vừa có rule không chờ hết chu kỳ đã giãn trước đó
+            for device_id in thresholds:
+                state = self._devices.get(device_id)
+                if state is not None:
+                    state.interval = min(state.interval, self.rule_ceiling)
+
+    def due(self, devices, now=None):
+        """Devices whose interval has elapsed; they are marked as scheduled
+
+        A device is due half a tick early so that an interval which is a
+        multiple of the tick is kept exactly.
+        """
+        now = self._clock() if now is None else now
+        due = []
+        with self._lock:
+            for device in devices:
+                state = self._devices.get(device.id)
+                if state is None:
+                    state = self._devices[device.id] = _DeviceState(self.base)
+                if state.scheduled_at is None or now - state.scheduled_at >= state.interval - self.floor / 2:
+                    state.scheduled_at = now
+                    due.append(device)
+            self._totals['ticks'] += 1
+            self._totals['polls'] += len(due)
+            self._totals['deferred'] += len(devices) - len(due)
+        return due
+
+    def observe(self, device_id, sample):
+        """Adjust a device's interval from its latest sample
+
+        Args:
+            device_id (int): Device ID
+            sample (dict): Collected metrics, including 'interface' rates
+
+        Returns:
+            New interval in seconds
+        """
+        online = sample.get('status') == 'online'
+        values = tracked_values(sample) if online else {}
+        near = online and self._near_threshold(device_id, sample)
+
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = _DeviceState(self.base)
+
+            if not online:
+                interval, reason = self.base, 'offline'
+            elif near:
+                interval, reason = self.floor, 'threshold'
+            else:
+                score = volatility(state.values, values)
+                if not state.values:
+                    interval, reason = state.interval, 'initial'
+                elif score >= self.volatile:
+                    interval, reason = state.interval / 2, 'volatile'
+                elif score <= self.stable:
+                    interval, reason = state.interval * 1.5, 'stable'
+                else:
+                    interval, reason = state.interval, 'steady'
+
+            ceiling = self.rule_ceiling if device_id in self._thresholds else self.ceiling
+            state.interval = min(max(interval, self.floor), ceiling)
+            state.values = values
+            state.reason = reason
+            return state.interval
+
+    def _near_threshold(self, device_id, sample):
+        with self._lock:
+            thresholds = self._thresholds.get(device_id, ())
+        for metric, condition, threshold in thresholds:
+            value = sample_value(sample, metric)
+            if value is None:
+                continue
+            compare = CONDITIONS.get(condition)
+            if compare is not None and compare(value, threshold):
+                return True
+            if abs(value - threshold) <= self.margin * max(abs(threshold), 1.0):
+                return True
+        return False
+
+    def interval(self, device_id):
+        with self._lock:
+            state = self._devices.get(device_id)
+            return state.interval if state else self.base
+
+    def forget(self, device_id):
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def stats(self):
+        """Interval distribution and poll counters since start"""
+        with self._lock:
+            intervals = [state.interval for state in self._devices.values()]
+            reasons = {}
+            for state in self._devices.values():
+                reasons[state.reason] = reasons.get(state.reason, 0) + 1
+            stats = dict(self._totals)
+        stats.update({
+            'devices': len(intervals),
+            'floor': self.floor,
+            'ceiling': self.ceiling,
+            'rule_ceiling': self.rule_ceiling,
+            'base': self.base,
+            'min_interval': min(intervals, default=0),
+            'avg_interval': sum(intervals) / len(intervals) if intervals else 0,
+            'max_interval': max(intervals, default=0),
+            'at_floor': sum(1 for interval in intervals if interval <= self.floor),
+            'at_ceiling': sum(1 for interval in intervals if interval >= self.ceiling),
+            'reasons': reasons,
+            # Số poll mỗi giây so với poll cố định theo chu kỳ gốc
+            'poll_rate': sum(1 / interval for interval in intervals),
+            'base_poll_rate': len(intervals) / self.base
+        })
+        return stats
+
+
+# Bộ điều chỉnh dùng chung cho toàn bộ process
+adaptive_polling = AdaptivePolling()
+
+
+def get_adaptive_stats():
+    """Get adaptive polling statistics"""
+    return adaptive_polling.stats()
@@ -1,100 +1,381 @@
+import time
 import logging
 import smtplib
+import threading
 import requests
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime
-from app.database.crud import (
+from datetime import datetime, timedelta, timezone
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from mik.app.config import Config
+from mik.app.database.crud import (
     get_all_alert_rules,
+    get_alert_rule_changes,
+    get_metrics_for_device,
     create_alert,
-    get_device_by_id,
     get_settings
 )
-from app.core.mikrotik import get_device_metrics
+from mik.app.core import rule_engine
+from mik.app.core.windows import (
+    WindowStore, CONDITIONS, sample_value, parse_rule_metric, metric_candidates
+)
 
 # Configure logger
-logger = logging.getLogger(__name__)
+logger = logging.getLogger('mikrotik_monitor.alerts')
 
-def check_alerts():
-    """Check all alert rules and trigger alerts if needed"""
-    try:
-        # Get all enabled alert rules
-        rules = get_all_alert_rules(enabled_only=True)
+# Thông tin thiết bị cần cho nội dung cảnh báo, giữ lại giữa lúc nhận mẫu và lúc đánh giá
+DeviceRef = namedtuple('DeviceRef', ['id', 'name', 'ip_address'])
+
+class IndexedRule:
+    """Alert rule fields needed to evaluate it and send notifications
+    
+    'series' is the metric read from samples and 'aggregate' the function
+    applied over 'duration' seconds ('max:cpu_load' -> max of cpu_load;
+    avg without a prefix). Rules without a duration use the latest value.
+    """
+    
+    FIELDS = ('id', 'name', 'device_id', 'metric', 'condition', 'threshold', 'duration',
+              'notify_email', 'notify_telegram', 'email_recipients', 'message_template')
+    
+    __slots__ = FIELDS + ('aggregate', 'series')
+    
+    def __init__(self, rule):
+        # get_all_alert_rules() trả về dict, các chỗ khác có thể truyền đối tượng AlertRule
+        get = rule.get if isinstance(rule, dict) else lambda key: getattr(rule, key, None)
+        for field in self.FIELDS:
+            setattr(self, field, get(field))
+        self.threshold = float(self.threshold)
+        self.duration = int(self.duration or 0)
+        self.aggregate, self.series = parse_rule_metric(self.metric)
+
+class RuleIndex:
+    """Enabled alert rules grouped by device and metric
+    
+    Replaced as a whole by set_rules(), so readers never see a half-built
+    index.
+    """
+    
+    def __init__(self):
+        self._rules = {}
+        self._count = 0
+    
+    def set_rules(self, rules):
+        """Rebuild the index
         
-        # Get application settings
-        settings = get_settings()
+        Args:
+            rules (iterable): Enabled alert rules, as dictionaries or objects
         
+        Returns:
+            Number of rules indexed (rules with an unknown condition are skipped)
+        """
+        index = {}
+        count = 0
         for rule in rules:
-            try:
-                # Skip rules for non-existent devices
-                device = get_device_by_id(rule.device_id)
-                if not device:
-                    logger.warning(f"Alert rule {rule.id} references non-existent device {rule.device_id}")
-                    continue
-                
-                # Get current metrics
-                metrics = get_device_metrics(device)
-                
-                # Skip offline devices
-                if not metrics.get('online', False):
-                    logger.debug(f"Device {device.name} is offline, skipping alert check")
-                    continue
-                
-                # Get metric value based on rule
-                metric_value = None
-                
-                if rule.metric == 'cpu_load':
-                    metric_value = metrics.get('cpu_load', 0)
-                elif rule.metric == 'memory_usage':
-                    metric_value = metrics.get('memory_usage', 0)
-                elif rule.metric == 'disk_usage':
-                    metric_value = metrics.get('disk_usage', 0)
-                # Add more metrics as needed
-                
-                if metric_value is None:
-                    logger.warning(f"Metric {rule.metric} not available for device {device.name}")
+            rule = IndexedRule(rule)
+            if rule.condition not in CONDITIONS:
+                logger.warning(f"Alert rule {rule.id} has unknown condition {rule.condition!r}")
+                continue
+            index.setdefault(rule.device_id, {}).setdefault(rule.series, []).append(rule)
+            count += 1
+        self._rules, self._count = index, count
+        return count
+    
+    def for_device(self, device_id):
+        """Rules of a device as {series metric: [rules]}"""
+        return self._rules.get(device_id, {})
+    
+    def rules(self):
+        """Every indexed rule"""
+        return [rule for metrics in self._rules.values() for rules in metrics.values() for rule in rules]
+    
+    def stats(self):
+        rules = self._rules
+        return {
+            'rules': self._count,
+            'devices': len(rules),
+            'metrics': sum(len(metrics) for metrics in rules.values())
+        }
+
+def evaluate_sample(rules_by_metric, sample, windows=None, device_id=None, now=None):
+    """Rules of one device whose condition holds for a collected sample
+    
+    Each metric is read from the sample once for all of its rules. Rules
+    with a duration compare the aggregate of their sliding window instead,
+    and are skipped until the window spans the whole duration.
+    
+    Args:
+        rules_by_metric (dict): {series metric: [rules]} from RuleIndex.for_device()
+        sample (dict): Online sample (nested, as built by collect_device_sample)
+        windows (WindowStore, optional): Windows of duration rules; without
+            it every rule uses the latest value
+        device_id (int, optional): Device of the sample (windows only)
+        now (float, optional): Sample time in epoch seconds (windows only)
+    
+    Returns:
+        Tuple (list of (rule, value) that triggered, number of rules evaluated)
+    """
+    triggered = []
+    evaluated = 0
+    for metric, rules in rules_by_metric.items():
+        value = sample_value(sample, metric)
+        if value is None:
+            continue
+        pushed = set()
+        for rule in rules:
+            rule_value = value
+            if rule.duration and windows is not None:
+                # Mỗi cửa sổ (series, duration) chỉ nhận mẫu một lần dù có nhiều rule dùng chung
+                if rule.duration not in pushed:
+                    windows.push(device_id, metric, rule.duration, now, value)
+                    pushed.add(rule.duration)
+                rule_value = windows.aggregate(device_id, metric, rule.duration, rule.aggregate, now)
+                if rule_value is None:
                     continue
-                
-                # Check threshold condition
-                alert_triggered = False
-                
-                if rule.condition == '>':
-                    alert_triggered = metric_value > rule.threshold
-                elif rule.condition == '<':
-                    alert_triggered = metric_value < rule.threshold
-                elif rule.condition == '>=':
-                    alert_triggered = metric_value >= rule.threshold
-                elif rule.condition == '<=':
-                    alert_triggered = metric_value <= rule.threshold
-                elif rule.condition == '==':
-                    alert_triggered = metric_value == rule.threshold
-                
-                if alert_triggered:
-                    # Create alert record
-                    alert = create_alert(
-                        rule_id=rule.id,
-                        device_id=device.id,
-                        metric=rule.metric,
-                        value=metric_value,
-                        threshold=rule.threshold,
-                        condition=rule.condition
-                    )
-                    
-                    # Prepare alert message
-                    message = rule.message_template or generate_alert_message(rule, device, metric_value)
-                    
-                    # Send notifications
-                    if rule.notify_email and settings.get('email_enabled', False):
-                        send_email_alert(rule, device, metric_value, message, settings)
-                    
-                    if rule.notify_telegram and settings.get('telegram_enabled', False):
-                        send_telegram_alert(rule, device, metric_value, message, settings)
-                    
-                    logger.info(f"Alert triggered: {rule.name} for device {device.name}")
+            evaluated += 1
+            if CONDITIONS[rule.condition](rule_value, rule.threshold):
+                triggered.append((rule, rule_value))
+    return triggered, evaluated
+
+class AlertEvaluator:
+    """Collection pipeline stage evaluating alert rules on each fresh sample
+    
+    Rules and notification settings are reloaded by refresh() (scheduled
+    every ALERT_CHECK_INTERVAL); observe() only uses the in-memory index, so
+    evaluating a sample costs no router call and no query unless an alert
+    fires. Notifications are sent on a small thread pool so a slow mail or
+    Telegram server does not hold up collection.
+    
+    Rules with a duration fire on the avg/min/max of a sliding window
+    kept in memory (see windows.py); windows missing after a restart or
+    for new rules are rebuilt from the stored metrics on refresh(), and
+    fire only once the stored samples span the whole duration.
+    
+    With a CompiledRuleEngine, observe() only records the sample and
+    evaluate_pending() (scheduled every ALERT_EVALUATION_INTERVAL) checks
+    the rules of the whole fleet in one vectorized pass; refresh() then
+    reloads only the rules changed since the previous refresh.
+    """
+    
+    def __init__(self, index=None, engine=None, windows=None, notify_workers=2):
+        self.index = index or RuleIndex()
+        self.engine = engine
+        self.windows = windows or WindowStore()
+        self.enabled = False
+        self._devices = {}
+        self._settings = {}
+        self._lock = threading.Lock()
+        self._notify_workers = notify_workers
+        self._notifier = None
+        self._refreshed_at = None
+        self._stats = {'samples': 0, 'skipped_offline': 0, 'evaluated': 0, 'triggered': 0, 'errors': 0}
+    
+    def refresh(self):
+        """Reload enabled rules and settings from the database (needs an app context)"""
+        started = time.time()
+        if self.engine is not None and self._refreshed_at is not None:
+            # Chỉ nạp rule thay đổi; lùi mốc thời gian để không lỡ thay đổi ghi trong lúc nạp lần trước
+            since = datetime.utcfromtimestamp(self._refreshed_at) - timedelta(seconds=Config.ALERT_CHECK_INTERVAL)
+            changed, enabled_ids = get_alert_rule_changes(since)
+            removed, added = self.engine.apply([IndexedRule(rule) for rule in changed], enabled_ids)
+            if removed or added:
+                logger.debug(f"Alert rule engine updated: {removed} rules removed, {added} added")
+        elif self.engine is not None:
+            count = self.engine.load(IndexedRule(rule) for rule in get_all_alert_rules(enabled_only=True))
+            logger.debug(f"Alert rule engine loaded: {count} rules")
+        else:
+            count = self.index.set_rules(get_all_alert_rules(enabled_only=True))
+            logger.debug(f"Alert rule index refreshed: {count} rules")
+        self._settings = get_settings()
+        self._refreshed_at = started
+        self._sync_windows(self.rules())
+    
+    def rules(self):
+        """Every loaded rule, as IndexedRule objects"""
+        return self.engine.rules() if self.engine is not None else self.index.rules()
+    
+    def _sync_windows(self, rules):
+        """Drop windows of removed rules and rebuild missing ones from stored metrics"""
+        keys = {(rule.device_id, rule.series, rule.duration) for rule in rules if rule.duration}
+        self.windows.retain(keys)
+        now = time.time()
+        for device_id, metric, duration in keys:
+            if self.windows.has(device_id, metric, duration):
+                continue
+            # Đọc thêm một chu kỳ poll trước đầu cửa sổ: chỉ khi có điểm cũ hơn đầu cửa sổ
+            # thì dữ liệu mới phủ hết duration và cửa sổ khôi phục mới sẵn sàng
+            start_time = datetime.utcnow() - timedelta(seconds=duration + _poll_period())
+            points = []
+            for metric_type, metric_name in metric_candidates(metric):
+                rows = get_metrics_for_device(device_id, metric_type, metric_name, start_time=start_time, limit=None)
+                if rows:
+                    points = [(_epoch(row['timestamp']), row['value']) for row in rows if row['value'] is not None]
+                    break
+            count = self.windows.recover(device_id, metric, duration, points, now)
+            if count:
+                logger.debug(f"Recovered {duration}s window of {metric} for device {device_id} from {count} samples")
+    
+    def start(self):
+        """Load the rules and start evaluating observed samples"""
+        self.refresh()
+        self.enabled = True
+    
+    def observe(self, device, sample):
+        """Evaluate every rule of the device on a collected sample
+        
+        Args:
+            device: Device object the sample was collected from
+            sample (dict): Result of collect_device_sample(), after save_sample()
+        
+        Returns:
+            Number of alerts triggered (always 0 with the compiled engine,
+            whose alerts are raised by evaluate_pending())
+        """
+        now = time.time()
+        if self.engine is not None:
+            if sample.get('status') != 'online':
+                return 0
+            if self.engine.update(device.id, sample, now):
+                self._devices[device.id] = DeviceRef(device.id, device.name, device.ip_address)
+                self._count(samples=1)
+            return 0
+        
+        rules = self.index.for_device(device.id)
+        if not rules:
+            return 0
+        
+        if sample.get('status') != 'online':
+            self._count(samples=1, skipped_offline=1)
+            return 0
+        
+        try:
+            triggered, evaluated = evaluate_sample(rules, sample, self.windows, device.id, now)
+            self._count(samples=1, evaluated=evaluated, triggered=len(triggered))
+            for rule, value in triggered:
+                self._trigger(rule, device, value)
+            return len(triggered)
+        except Exception as e:
+            self._count(errors=1)
+            logger.error(f"Error evaluating alert rules for device {device.name}: {str(e)}")
+            return 0
+    
+    def evaluate_pending(self):
+        """Evaluate the compiled rules against samples received since the last call
+        
+        Returns:
+            Number of alerts triggered
+        """
+        if self.engine is None:
+            return 0
+        
+        triggered = self.engine.evaluate()
+        self._count(triggered=len(triggered))
+        for rule, value in triggered:
+            try:
+                device = self._devices.get(rule.device_id) or DeviceRef(rule.device_id, str(rule.device_id), '')
+                self._trigger(rule, device, value)
             except Exception as e:
-                logger.error(f"Error checking alert rule {rule.id}: {str(e)}")
+                self._count(errors=1)
+                logger.error(f"Error raising alert for rule {rule.id}: {str(e)}")
+        return len(triggered)
+    
+    def _trigger(self, rule, device, value):
+        create_alert(
+            rule_id=rule.id,
+            device_id=device.id,
+            metric=rule.metric,
+            value=value,
+            threshold=rule.threshold,
+            condition=rule.condition
+        )
+        
+        # Prepare alert message
+        message = rule.message_template or generate_alert_message(rule, device, value)
+        settings = self._settings
+        
+        # Send notifications
+        if rule.notify_email and settings.get('email_enabled', False):
+            self._notify(send_email_alert, rule, device, value, message, settings)
+        
+        if rule.notify_telegram and settings.get('telegram_enabled', False):
+            self._notify(send_telegram_alert, rule, device, value, message, settings)
+        
+        logger.info(f"Alert triggered: {rule.name} for device {device.name}")
+    
+    def _notify(self, send, *args):
+        with self._lock:
+            if self._notifier is None:
+                self._notifier = ThreadPoolExecutor(max_workers=self._notify_workers,
+                                                    thread_name_prefix='alert-notify')
+            notifier = self._notifier
+        notifier.submit(send, *args)
+    
+    def _count(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self._stats[key] += value
+    
+    def stats(self):
+        """Index size and evaluation counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self.engine.stats() if self.engine is not None else self.index.stats())
+        stats['engine'] = 'vectorized' if self.engine is not None else 'index'
+        stats['windows'] = self.windows.stats()
+        stats['enabled'] = self.enabled
+        stats['refreshed_at'] = datetime.utcfromtimestamp(self._refreshed_at).isoformat() if self._refreshed_at else None
+        return stats
+
+def _poll_period():
+    """Longest time between two samples of a device with alert rules"""
+    if Config.MONITORING_ADAPTIVE:
+        return max(Config.MONITORING_INTERVAL, min(Config.ADAPTIVE_RULE_MAX_INTERVAL, Config.ADAPTIVE_MAX_INTERVAL))
+    return Config.MONITORING_INTERVAL
+
+def _epoch(timestamp):
+    """Epoch seconds of a naive UTC datetime or its ISO string"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+def compiled_rule_engine(windows=None):
+    """CompiledRuleEngine if ALERT_ENGINE is 'vectorized' and NumPy is installed, else None"""
+    if Config.ALERT_ENGINE != 'vectorized':
+        return None
+    if rule_engine.np is None:
+        logger.warning("ALERT_ENGINE=vectorized requires NumPy, using the per-device rule index")
+        return None
+    return rule_engine.CompiledRuleEngine(windows=windows)
+
+# Bộ đánh giá dùng chung cho toàn bộ process
+alert_windows = WindowStore(max_points=Config.ALERT_WINDOW_MAX_POINTS)
+alert_evaluator = AlertEvaluator(engine=compiled_rule_engine(alert_windows), windows=alert_windows)
+
+def refresh_alert_rules():
+    """Reload the alert rule index used by the collection pipeline
+    
+    Starts the evaluator if its first load failed (e.g. the database was
+    not reachable at startup).
+    """
+    try:
+        if alert_evaluator.enabled:
+            alert_evaluator.refresh()
+        else:
+            alert_evaluator.start()
+            logger.info("Alert rule evaluation started")
     except Exception as e:
-        logger.error(f"Error in alert check process: {str(e)}")
+        logger.error(f"Error refreshing alert rules: {str(e)}")
+
+def evaluate_pending_alerts():
+    """Run the vectorized pass over samples collected since the previous one"""
+    try:
+        alert_evaluator.evaluate_pending()
+    except Exception as e:
+        logger.error(f"Error evaluating alert rules: {str(e)}")
+
+def get_alert_stats():
+    """Get alert evaluation statistics"""
+    return alert_evaluator.stats()
 
 def generate_alert_message(rule, device, value):
     """Generate a default alert message"""
@@ -0,0 +1,154 @@
+"""
+Circuit breaker theo từng thiết bị cho các router không truy cập được
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger('mikrotik_monitor.breaker')
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class _DeviceCircuit:
+    """Breaker state of one device"""
+
+    __slots__ = ('state', 'failures', 'trips', 'opened_at', 'retry_at', 'last_error', 'probing')
+
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self.retry_at = None
+        self.last_error = None
+        self.probing = False
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'trips': self.trips,
+            'opened_at': _isoformat(self.opened_at),
+            'retry_at': _isoformat(self.retry_at),
+            'probing': self.probing,
+            'last_error': self.last_error
+        }
+
+
+def _isoformat(timestamp):
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class CircuitBreaker:
+    """Per-device closed/open/half-open breaker with exponential backoff
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are refused until retry_at. The first call after that is let through as
+    a probe (half-open): success closes the circuit, failure re-opens it with
+    twice the previous backoff, capped at max_backoff. Calls refused while
+    the probe runs are told to retry probe_wait seconds later.
+    """
+
+    def __init__(self, failure_threshold=3, base_backoff=30, max_backoff=3600, probe_wait=10, clock=time.time):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.probe_wait = probe_wait
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def allow(self, device_id):
+        """Check whether a call to the device may go ahead
+
+        Returns:
+            True if the device may be contacted now
+        """
+        with self._lock:
+            circuit = self._circuits.get(device_id)
+            if circuit is None or circuit.state == STATE_CLOSED:
+                return True
+
+            if circuit.state == STATE_OPEN and self._clock() >= circuit.retry_at:
+                # Hết thời gian chờ: cho phép một lần thử
+                circuit.state = STATE_HALF_OPEN
+                circuit.probing = False
+
+            if circuit.state == STATE_HALF_OPEN and not circuit.probing:
+                circuit.probing = True
+                return True
+            return False
+
+    def record_success(self, device_id):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            circuit = self._circuits.pop(device_id, None)
+        if circuit is not None and circuit.state != STATE_CLOSED:
+            logger.info(f"Circuit closed for device {device_id} after {circuit.trips} trip(s)")
+
+    def record_failure(self, device_id, error=None):
+        """Count a failed call; opens the circuit when the threshold is reached"""
+        with self._lock:
+            circuit = self._circuits.get(device_id)
+            if circuit is None:
+                circuit = _DeviceCircuit()
+                self._circuits[device_id] = circuit
+
+            circuit.failures += 1
+            circuit.last_error = str(error) if error else None
+            circuit.probing = False
+
+            if circuit.state == STATE_HALF_OPEN or circuit.failures >= self.failure_threshold:
+                backoff = min(self.base_backoff * (2 ** circuit.trips), self.max_backoff)
+                now = self._clock()
+                circuit.state = STATE_OPEN
+                circuit.trips += 1
+                circuit.opened_at = now
+                circuit.retry_at = now + backoff
+                logger.warning(f"Circuit open for device {device_id}, retry in {backoff}s")
+
+    def cancel_probe(self, device_id):
+        """Give back a half-open probe slot when the call never reached the device"""
+        with self._lock:
+            circuit = self._circuits.get(device_id)
+            if circuit is not None:
+                circuit.probing = False
+
+    def retry_at(self, device_id):
+        """ISO timestamp of the next allowed attempt, or None if not open"""
+        with self._lock:
+            circuit = self._circuits.get(device_id)
+            if circuit is None or circuit.state == STATE_CLOSED:
+                return None
+            if circuit.state == STATE_HALF_OPEN and circuit.probing:
+                # retry_at đã qua: hẹn lại sau khi lần thử đang chạy có kết quả
+                return _isoformat(max(circuit.retry_at, self._clock() + self.probe_wait))
+            return _isoformat(circuit.retry_at)
+
+    def probing(self, device_id):
+        """True while a half-open probe of the device is running"""
+        with self._lock:
+            circuit = self._circuits.get(device_id)
+            return circuit is not None and circuit.state == STATE_HALF_OPEN and circuit.probing
+
+    def reset(self, device_id=None):
+        """Forget the state of one device, or of every device"""
+        with self._lock:
+            if device_id is None:
+                self._circuits.clear()
+            else:
+                self._circuits.pop(device_id, None)
+
+    def states(self):
+        """State of every device with recorded failures
+
+        Returns:
+            Dictionary {device_id: state dict}
+        """
+        with self._lock:
+            return {device_id: circuit.to_dict() for device_id, circuit in self._circuits.items()}
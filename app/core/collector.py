@@ -0,0 +1,183 @@
+"""
+Bộ thu thập metrics: dàn đều thiết bị trong chu kỳ và poll bằng pool worker giới hạn
+"""
+
+import time
+import zlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from mik.app.config import Config
+
+logger = logging.getLogger('mikrotik_monitor.collector')
+
+
+def device_offset(device_id, window):
+    """Deterministic start offset of a device inside a polling window
+
+    The same device always lands at the same point of every cycle, so its
+    samples stay evenly spaced, while devices as a whole are spread
+    uniformly instead of all being polled at the start of the interval.
+
+    Args:
+        device_id (int): Device ID
+        window (float): Seconds over which devices are spread
+
+    Returns:
+        Offset in seconds, 0 <= offset < window
+    """
+    if window <= 0:
+        return 0.0
+    fraction = zlib.crc32(str(device_id).encode()) / 2 ** 32
+    return fraction * window
+
+
+class CollectorEngine:
+    """Poll every device once per interval on a bounded thread pool
+
+    Each device is submitted at cycle start + device_offset(), within the
+    first spread * interval seconds, and polled by at most 'workers'
+    threads at a time. Per-cycle duration, start lag (actual start minus
+    scheduled start) and overruns (cycle longer than the interval) are
+    recorded.
+    """
+
+    def __init__(self, workers=None, interval=None, spread=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            workers (int, optional): Maximum devices polled at once.
+                Default Config.COLLECTOR_WORKERS.
+            interval (float, optional): Cycle length in seconds.
+                Default Config.MONITORING_INTERVAL.
+            spread (float, optional): Fraction of the interval used to
+                spread start times. Default Config.COLLECTOR_SPREAD.
+        """
+        self.workers = workers or Config.COLLECTOR_WORKERS
+        self.interval = interval or Config.MONITORING_INTERVAL
+        self.spread = Config.COLLECTOR_SPREAD if spread is None else spread
+        self._clock = clock
+        self._sleep = sleep
+        self._executor = None
+        self._lock = threading.Lock()
+        self._cycle_lock = threading.Lock()
+        self._totals = {'cycles': 0, 'overruns': 0, 'skipped': 0, 'polls': 0, 'errors': 0}
+        self._last_cycle = {}
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='collector')
+        return self._executor
+
+    def run_cycle(self, devices, task):
+        """Poll all devices once, spread over the cycle window
+
+        Args:
+            devices (list): Device objects
+            task (callable): task(device) -> truthy on success; exceptions
+                count as errors
+
+        Returns:
+            Statistics of the cycle, or None if the previous cycle is still
+            running (counted as skipped)
+        """
+        if not self._cycle_lock.acquire(blocking=False):
+            self.skip_cycle()
+            logger.warning("Previous collection cycle still running, skipping this one")
+            return None
+
+        try:
+            return self._run_cycle(devices, task)
+        finally:
+            self._cycle_lock.release()
+
+    def skip_cycle(self):
+        """Count a cycle not run because the previous one was still running
+
+        The scheduler job runs with max_instances=1, so APScheduler drops
+        overlapping runs before run_cycle() sees them and reports them here.
+        """
+        with self._lock:
+            self._totals['skipped'] += 1
+
+    def _run_cycle(self, devices, task):
+        window = self.interval * self.spread
+        started = self._clock()
+        schedule = sorted((device_offset(device.id, window), index, device)
+                          for index, device in enumerate(devices))
+        lags = []
+        outcomes = {'ok': 0, 'failed': 0, 'errors': 0}
+        outcomes_lock = threading.Lock()
+
+        def run(device, due):
+            lag = max(0.0, self._clock() - due)
+            try:
+                outcome = 'ok' if task(device) else 'failed'
+            except Exception as e:
+                logger.error(f"Error polling device {getattr(device, 'name', device.id)}: {e}")
+                outcome = 'errors'
+            with outcomes_lock:
+                lags.append(lag)
+                outcomes[outcome] += 1
+
+        futures = []
+        pool = self._pool()
+        for offset, _, device in schedule:
+            due = started + offset
+            delay = due - self._clock()
+            if delay > 0:
+                self._sleep(delay)
+            futures.append(pool.submit(run, device, due))
+        wait(futures)
+
+        duration = self._clock() - started
+        overrun = duration > self.interval
+        cycle = {
+            'devices': len(devices),
+            'ok': outcomes['ok'],
+            'failed': outcomes['failed'],
+            'errors': outcomes['errors'],
+            'duration': duration,
+            'window': window,
+            'max_lag': max(lags) if lags else 0.0,
+            'avg_lag': sum(lags) / len(lags) if lags else 0.0,
+            'overrun': overrun,
+            'workers': self.workers,
+            'interval': self.interval
+        }
+
+        with self._lock:
+            self._totals['cycles'] += 1
+            self._totals['overruns'] += int(overrun)
+            self._totals['polls'] += len(devices)
+            self._totals['errors'] += outcomes['errors']
+            self._last_cycle = cycle
+
+        if overrun:
+            logger.warning(f"Collection cycle took {duration:.1f}s, longer than the {self.interval}s interval")
+        else:
+            logger.debug(f"Collected {len(devices)} devices in {duration:.1f}s (max lag {cycle['max_lag']:.2f}s)")
+        return cycle
+
+    def stats(self):
+        """Totals since start plus the last cycle"""
+        with self._lock:
+            stats = dict(self._totals)
+            stats['last_cycle'] = dict(self._last_cycle)
+        stats['running'] = self._cycle_lock.locked()
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# Bộ thu thập dùng chung cho toàn bộ process
+collector = CollectorEngine()
+
+
+def get_collector_stats():
+    """Get collection cycle statistics"""
+    return collector.stats()
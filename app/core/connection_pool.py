@@ -0,0 +1,312 @@
+"""
+Pool kết nối RouterOS API theo từng thiết bị
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger('mikrotik_monitor.pool')
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no session becomes available within the wait timeout"""
+
+
+class _PooledSession:
+    """A logged-in API session owned by the pool"""
+
+    __slots__ = ('api', 'fingerprint', 'generation', 'created_at', 'last_used')
+
+    def __init__(self, api, fingerprint, generation):
+        now = time.monotonic()
+        self.api = api
+        self.fingerprint = fingerprint
+        self.generation = generation
+        self.created_at = now
+        self.last_used = now
+
+
+class _DeviceSlot:
+    """Per-device bookkeeping: idle sessions, checked-out count and generation"""
+
+    __slots__ = ('idle', 'in_use', 'fingerprint', 'generation', 'available')
+
+    def __init__(self, lock):
+        self.idle = deque()
+        self.in_use = 0
+        self.fingerprint = None
+        self.generation = 0
+        self.available = threading.Condition(lock)
+
+
+def device_fingerprint(device):
+    """Hash of everything that changes how we log in to a device
+
+    Args:
+        device: Device object with connection parameters
+
+    Returns:
+        Hex digest; a different value means pooled sessions are stale
+    """
+    raw = '|'.join(str(part) for part in (
+        device.ip_address,
+        device.api_port,
+        device.username,
+        device.password_hash,
+        device.use_ssl,
+    ))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class ConnectionPool:
+    """Thread-safe pool of logged-in RouterOS API sessions keyed by device id
+
+    Sessions are checked out exclusively, so one socket is never used by two
+    threads at the same time. A session is returned to the pool only when the
+    caller finished without error; otherwise it is closed.
+    """
+
+    def __init__(self, connect, max_per_device=2, idle_timeout=300,
+                 health_check_after=30, wait_timeout=10, sweep_interval=30):
+        """
+        Args:
+            connect (callable): connect(device) -> API object or None
+            max_per_device (int): Maximum open sessions per router
+            idle_timeout (int): Seconds after which an idle session is closed
+            health_check_after (int): Idle seconds after which a session is
+                probed before reuse
+            wait_timeout (int): Seconds to wait for a free slot when the
+                per-device cap is reached
+            sweep_interval (int): Minimum seconds between idle sweeps
+        """
+        self._connect = connect
+        self.max_per_device = max(1, int(max_per_device))
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.wait_timeout = wait_timeout
+        self.sweep_interval = sweep_interval
+
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._last_sweep = time.monotonic()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'connect_failures': 0,
+            'health_check_failures': 0,
+            'discarded': 0,
+            'evicted_idle': 0,
+            'invalidations': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _slot(self, device_id):
+        slot = self._slots.get(device_id)
+        if slot is None:
+            slot = _DeviceSlot(self._lock)
+            self._slots[device_id] = slot
+        return slot
+
+    def acquire(self, device):
+        """Check out a session for device
+
+        Args:
+            device: Device object with connection parameters
+
+        Returns:
+            Tuple (api, session) where api is None if the device could not
+            be reached. Pass session back to release().
+
+        Raises:
+            PoolTimeoutError: If the per-device cap stays reached for
+                wait_timeout seconds
+        """
+        self._maybe_sweep()
+        fingerprint = device_fingerprint(device)
+        stale = []
+
+        with self._lock:
+            slot = self._slot(device.id)
+            if slot.fingerprint != fingerprint:
+                # Thông tin đăng nhập đã thay đổi: bỏ toàn bộ phiên cũ
+                if slot.fingerprint is not None:
+                    stale.extend(self._invalidate_locked(slot))
+                slot.fingerprint = fingerprint
+
+            deadline = time.monotonic() + self.wait_timeout
+            while not slot.idle and slot.in_use >= self.max_per_device:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No free API session for device {device.id} "
+                        f"after {self.wait_timeout}s")
+                self._stats['waits'] += 1
+                slot.available.wait(remaining)
+
+            session = slot.idle.pop() if slot.idle else None
+            slot.in_use += 1
+            generation = slot.generation
+
+        self._close_all(stale)
+
+        if session is not None:
+            if self._is_healthy(session):
+                self._count('hits')
+                session.last_used = time.monotonic()
+                return session.api, session
+            self._count('health_check_failures')
+            self._close(session.api)
+
+        self._count('misses')
+        api = None
+        try:
+            api = self._connect(device)
+        finally:
+            if api is None:
+                self._count('connect_failures')
+                self._release_slot(device.id)
+        if api is None:
+            return None, None
+        return api, _PooledSession(api, fingerprint, generation)
+
+    def release(self, device_id, session, discard=False):
+        """Return a checked-out session to the pool
+
+        Args:
+            device_id (int): Device ID the session belongs to
+            session: Session handle returned by acquire()
+            discard (bool): Close the session instead of keeping it
+        """
+        if session is None:
+            return
+
+        with self._lock:
+            slot = self._slot(device_id)
+            slot.in_use = max(0, slot.in_use - 1)
+            keep = (not discard
+                    and session.generation == slot.generation
+                    and session.fingerprint == slot.fingerprint)
+            if keep:
+                session.last_used = time.monotonic()
+                slot.idle.append(session)
+            else:
+                self._stats['discarded'] += 1
+            slot.available.notify()
+
+        if not keep:
+            self._close(session.api)
+
+    def invalidate(self, device_id):
+        """Drop every session of a device, e.g. after its credentials changed
+
+        Sessions currently checked out are closed when they are released.
+        """
+        with self._lock:
+            slot = self._slots.get(device_id)
+            if slot is None:
+                return
+            stale = self._invalidate_locked(slot)
+            slot.fingerprint = None
+            if not slot.in_use:
+                del self._slots[device_id]
+        self._close_all(stale)
+
+    def evict_idle(self):
+        """Close sessions that have been idle longer than idle_timeout
+
+        Returns:
+            Number of sessions closed
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+
+        with self._lock:
+            for device_id in list(self._slots):
+                slot = self._slots[device_id]
+                while slot.idle and slot.idle[0].last_used < cutoff:
+                    expired.append(slot.idle.popleft())
+                if not slot.idle and not slot.in_use:
+                    del self._slots[device_id]
+            self._stats['evicted_idle'] += len(expired)
+            self._last_sweep = time.monotonic()
+
+        self._close_all(expired)
+        return len(expired)
+
+    def close_all(self):
+        """Close every idle session and forget all devices"""
+        with self._lock:
+            sessions = [s for slot in self._slots.values() for s in slot.idle]
+            for slot in self._slots.values():
+                slot.idle.clear()
+                slot.generation += 1
+            self._slots = {k: v for k, v in self._slots.items() if v.in_use}
+        self._close_all(sessions)
+
+    def stats(self):
+        """Pool counters and current occupancy
+
+        Returns:
+            Dictionary with hit/miss counters, hit ratio and per-device usage
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            devices = {
+                device_id: {'idle': len(slot.idle), 'in_use': slot.in_use}
+                for device_id, slot in self._slots.items()
+            }
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['idle_sessions'] = sum(d['idle'] for d in devices.values())
+        stats['active_sessions'] = sum(d['in_use'] for d in devices.values())
+        stats['max_per_device'] = self.max_per_device
+        stats['devices'] = devices
+        return stats
+
+    def _invalidate_locked(self, slot):
+        stale = list(slot.idle)
+        slot.idle.clear()
+        slot.generation += 1
+        self._stats['invalidations'] += 1
+        return stale
+
+    def _release_slot(self, device_id):
+        with self._lock:
+            slot = self._slot(device_id)
+            slot.in_use = max(0, slot.in_use - 1)
+            slot.available.notify()
+
+    def _is_healthy(self, session):
+        """Probe sessions that sat idle long enough to have been dropped"""
+        if time.monotonic() - session.last_used < self.health_check_after:
+            return True
+        try:
+            tuple(session.api('/system/identity/print'))
+            return True
+        except Exception as e:
+            logger.debug(f"Pooled API session failed health check: {e}")
+            return False
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self.evict_idle()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _close_all(self, sessions):
+        for session in sessions:
+            self._close(session.api)
+
+    @staticmethod
+    def _close(api):
+        try:
+            api.close()
+        except Exception:
+            pass
@@ -0,0 +1,197 @@
+"""
+Tính tốc độ (bps/pps) của interface từ chênh lệch bộ đếm giữa các lần đọc
+"""
+
+import time
+import logging
+import threading
+from array import array
+
+logger = logging.getLogger('mikrotik_monitor.rates')
+
+# Thứ tự các bộ đếm trong mảng, và tên tốc độ tương ứng
+COUNTERS = ('rx_byte', 'tx_byte', 'rx_packet', 'tx_packet')
+RATES = ('rx_bps', 'tx_bps', 'rx_pps', 'tx_pps')
+
+_WIDTHS = (1 << 32, 1 << 64)
+
+# Sai số cho phép khi so sánh thời điểm khởi động (uptime chỉ chính xác đến giây)
+BOOT_TOLERANCE = 5
+
+
+def counter_delta(old, new, max_delta):
+    """Increase of a monotonic counter between two reads
+
+    A decrease is read as a 32- or 64-bit wrap only if the previous value
+    fits in that width and was in its upper half, the result is plausible,
+    and max_delta is below the width: when the counter could cover its
+    whole range in the interval, a wrap cannot be told from a reset.
+    Anything else (reboot, reset-counters, garbage) is a reset.
+
+    Args:
+        old (int): Previous value
+        new (int): Current value
+        max_delta (float): Largest plausible increase for the interval
+
+    Returns:
+        Tuple (delta, wrapped) where delta is None if the counter was reset
+    """
+    if new >= old:
+        delta = new - old
+        return (delta, False) if delta <= max_delta else (None, False)
+    for width in _WIDTHS:
+        if width // 2 <= old < width and max_delta < width:
+            delta = width - old + new
+            if delta <= max_delta:
+                return delta, True
+    return None, False
+
+
+class CounterRateStore:
+    """Last counter values per (device, interface), turned into rates
+
+    Counters live in flat arrays indexed by a slot number, so a store with
+    100k interfaces costs a few MB plus the index dictionary.
+    """
+
+    def __init__(self, capacity=1024, max_bps=400e9, max_pps=600e6, clock=time.time):
+        """
+        Args:
+            capacity (int): Initial number of slots (grows as needed)
+            max_bps (float): Highest believable rate per direction; a
+                decrease that would need more is taken as a counter reset
+            max_pps (float): Same for packet counters
+            clock (callable): Time source used when no timestamp is given
+        """
+        self.max_bps = max_bps
+        self.max_pps = max_pps
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        capacity = max(1, int(capacity))
+        self._capacity = capacity
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._counters = array('Q', bytes(8 * len(COUNTERS) * capacity))
+        self._index = {}
+        self._device_slots = {}
+        self._boot_times = {}
+        self._free = []
+        self._stats = {'samples': 0, 'rates': 0, 'wraps': 0, 'resets': 0, 'reboots': 0}
+
+    def update(self, device_id, interfaces, timestamp=None, uptime=None):
+        """Record a counter read of a device and compute rates
+
+        Args:
+            device_id (int): Device ID
+            interfaces (iterable): Traffic records with 'name', 'rx_byte',
+                'tx_byte', 'rx_packet' and 'tx_packet'
+            timestamp (float, optional): Read time (epoch seconds)
+            uptime (int, optional): Device uptime in seconds, used to detect
+                reboots
+
+        Returns:
+            Dictionary {interface name: {'rx_bps', 'tx_bps', 'rx_pps',
+            'tx_pps'}} for interfaces that had a usable previous read
+        """
+        if timestamp is None:
+            timestamp = self._clock()
+        width = len(COUNTERS)
+        rates = {}
+
+        with self._lock:
+            if uptime is not None and self._rebooted(device_id, timestamp - uptime):
+                # Thiết bị đã khởi động lại: bộ đếm bắt đầu lại từ 0
+                self._stats['reboots'] += 1
+                self._forget_locked(device_id)
+
+            for interface in interfaces:
+                name = interface.get('name')
+                if not name:
+                    continue
+                values = [int(interface.get(key) or 0) for key in COUNTERS]
+                self._stats['samples'] += 1
+
+                key = (device_id, name)
+                slot = self._index.get(key)
+                if slot is None:
+                    self._store(self._allocate(key), timestamp, values)
+                    continue
+
+                elapsed = timestamp - self._timestamps[slot]
+                if elapsed <= 0:
+                    continue
+
+                base = slot * width
+                result = {}
+                for i, rate_name in enumerate(RATES):
+                    bytes_counter = i < 2
+                    max_delta = (self.max_bps / 8 if bytes_counter else self.max_pps) * elapsed
+                    delta, wrapped = counter_delta(self._counters[base + i], values[i], max_delta)
+                    if delta is None:
+                        result = None
+                        break
+                    if wrapped:
+                        self._stats['wraps'] += 1
+                    result[rate_name] = delta * (8 if bytes_counter else 1) / elapsed
+
+                self._store(slot, timestamp, values)
+                if result is None:
+                    self._stats['resets'] += 1
+                    continue
+                rates[name] = result
+                self._stats['rates'] += 1
+
+        return rates
+
+    def forget(self, device_id):
+        """Drop every interface of a device"""
+        with self._lock:
+            self._forget_locked(device_id)
+            self._boot_times.pop(device_id, None)
+
+    def stats(self):
+        """Store size and counters of wraps/resets/reboots seen"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['interfaces'] = len(self._index)
+            stats['devices'] = len(self._device_slots)
+            stats['capacity'] = self._capacity
+            stats['array_bytes'] = (self._timestamps.itemsize * len(self._timestamps)
+                                    + self._counters.itemsize * len(self._counters))
+        return stats
+
+    def __len__(self):
+        return len(self._index)
+
+    def _rebooted(self, device_id, boot_time):
+        previous = self._boot_times.get(device_id)
+        self._boot_times[device_id] = boot_time
+        return previous is not None and boot_time - previous > BOOT_TOLERANCE
+
+    def _store(self, slot, timestamp, values):
+        self._timestamps[slot] = timestamp
+        base = slot * len(COUNTERS)
+        for i, value in enumerate(values):
+            # Giá trị lạ (âm hoặc vượt 64 bit) không được làm hỏng mảng
+            self._counters[base + i] = value if 0 <= value < _WIDTHS[1] else 0
+
+    def _allocate(self, key):
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._index)
+            if slot >= self._capacity:
+                self._grow()
+        self._index[key] = slot
+        self._device_slots.setdefault(key[0], set()).add(key[1])
+        return slot
+
+    def _grow(self):
+        added = self._capacity
+        self._timestamps.extend(array('d', bytes(8 * added)))
+        self._counters.extend(array('Q', bytes(8 * len(COUNTERS) * added)))
+        self._capacity += added
+
+    def _forget_locked(self, device_id):
+        for name in self._device_slots.pop(device_id, ()):
+            self._free.append(self._index.pop((device_id, name)))
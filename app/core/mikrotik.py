@@ -3,13 +3,22 @@ Quản lý kết nối và tương tác với thiết bị MikroTik
 """
 
 import os
+import ssl
 import time
 import logging
 from datetime import datetime
+from contextlib import contextmanager
 
 from librouteros import connect as routeros_connect
 from librouteros.exceptions import ConnectionError, LoginError, FatalError
 
+from mik.app.config import Config
+from mik.app.core.connection_pool import ConnectionPool
+from mik.app.core.circuit_breaker import CircuitBreaker
+from mik.app.core.routeros_query import TableQuery, run_pipelined
+from mik.app.core.counter_rates import CounterRateStore, RATES
+from mik.app.core.state_store import state_store
+from mik.app.core.single_flight import SingleFlight, coalesced
 from mik.app.utils.security import decrypt_device_password
 
 logger = logging.getLogger('mikrotik_monitor.core')
@@ -54,8 +63,11 @@ def connect_to_device(ip_address, username, password, port=8728, use_ssl=True, t
         }
         
         if use_ssl:
-            params['ssl_wrapper'] = True  # Sử dụng SSL
-            params['ssl_verify'] = False  # Không xác thực cert để tương thích tốt hơn
+            # Sử dụng SSL, không xác thực cert để tương thích tốt hơn
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+            params['ssl_wrapper'] = ssl_context.wrap_socket
         
         # Kết nối đến thiết bị
         api = routeros_connect(**params)
@@ -73,233 +85,522 @@ def connect_to_device(ip_address, username, password, port=8728, use_ssl=True, t
     
     return None
 
-def get_device_metrics(device):
-    """Get current device metrics
+def _connect_device(device):
+    """Open a fresh API session for a Device object"""
+    return connect_to_device(
+        device.ip_address, 
+        device.username, 
+        device.password_hash, 
+        device.api_port, 
+        device.use_ssl
+    )
+
+# Pool kết nối dùng chung cho toàn bộ process
+_connection_pool = ConnectionPool(
+    _connect_device,
+    max_per_device=Config.MIKROTIK_POOL_MAX_PER_DEVICE,
+    idle_timeout=Config.MIKROTIK_POOL_IDLE_TIMEOUT,
+    health_check_after=Config.MIKROTIK_POOL_HEALTH_CHECK_AFTER,
+    wait_timeout=Config.MIKROTIK_CONNECTION_TIMEOUT
+)
+
+# Circuit breaker cho các thiết bị không truy cập được
+circuit_breaker = CircuitBreaker(
+    failure_threshold=Config.BREAKER_FAILURE_THRESHOLD,
+    base_backoff=Config.BREAKER_BASE_BACKOFF,
+    max_backoff=Config.BREAKER_MAX_BACKOFF,
+    # Lần thử kết nối có kết quả trong tối đa thời gian chờ kết nối
+    probe_wait=Config.MIKROTIK_CONNECTION_TIMEOUT
+)
+
+# Bộ đếm interface của lần đọc trước, dùng để tính tốc độ
+interface_rates = CounterRateStore()
+
+# Các lần đọc giống nhau đang chạy đồng thời (nhiều tab cùng mở một thiết bị) dùng chung một lần gọi router
+single_flight = SingleFlight()
+
+# Lỗi cho thấy thiết bị/kết nối có vấn đề (không tính lỗi !trap của lệnh)
+CONNECTION_ERRORS = (OSError, ConnectionError, FatalError)
+
+@contextmanager
+def device_connection(device):
+    """Borrow a logged-in API session for a device from the pool
+    
+    Yields None if the device could not be reached or its circuit breaker
+    is open. The session goes back to the pool when the block exits
+    normally and is closed if it raises.
     
     Args:
         device: Device object with connection parameters
-        
-    Returns:
-        Dictionary with device metrics or offline status
     """
+    if not circuit_breaker.allow(device.id):
+        yield None
+        return
+    
     try:
-        # Kết nối đến thiết bị
-        api = connect_to_device(
-            device.ip_address, 
-            device.username, 
-            device.password_hash, 
-            device.api_port, 
-            device.use_ssl
-        )
-        
-        if not api:
-            return {'status': 'offline'}
-        
-        # Lấy thông tin hệ thống
-        system_resource = next(api.path('/system/resource').select())
-        
-        # Lấy thông tin CPU
-        cpu_load = system_resource.get('cpu-load', 0)
-        
-        # Lấy thông tin bộ nhớ
-        total_memory = int(system_resource.get('total-memory', 0))
-        free_memory = int(system_resource.get('free-memory', 0))
-        memory_usage = 0
-        
-        if total_memory > 0:
-            memory_usage = 100 - (free_memory / total_memory * 100)
-        
-        # Lấy thông tin ổ đĩa
-        total_hdd = int(system_resource.get('total-hdd-space', 0))
-        free_hdd = int(system_resource.get('free-hdd-space', 0))
-        disk_usage = 0
-        
-        if total_hdd > 0:
-            disk_usage = 100 - (free_hdd / total_hdd * 100)
-        
-        # Lấy thông tin uptime
-        uptime_seconds = system_resource.get('uptime', '0s')
-        
-        # Đóng kết nối
-        api.close()
-        
-        # Trả về dữ liệu
-        return {
-            'status': 'online',
-            'cpu': {
-                'load': cpu_load,
-                'cores': system_resource.get('cpu-count', 1)
-            },
-            'memory': {
-                'total': total_memory,
-                'free': free_memory,
-                'usage': memory_usage
-            },
-            'disk': {
-                'total': total_hdd,
-                'free': free_hdd,
-                'usage': disk_usage
-            },
-            'system': {
-                'version': system_resource.get('version', 'Unknown'),
-                'architecture': system_resource.get('architecture-name', 'Unknown'),
-                'uptime': format_uptime(uptime_seconds),
-                'board': system_resource.get('board-name', 'Unknown'),
-                'model': device.model or 'Unknown'
-            },
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        api, session = _connection_pool.acquire(device)
+    except BaseException:
+        circuit_breaker.cancel_probe(device.id)
+        raise
     
-    except Exception as e:
-        logger.error(f"Error getting metrics from device {device.name} ({device.ip_address}): {e}")
-        return {
-            'status': 'error',
-            'error': str(e)
-        }
+    if api is None:
+        circuit_breaker.record_failure(device.id, 'connection failed')
+        yield None
+        return
+    
+    circuit_breaker.record_success(device.id)
+    try:
+        yield api
+    except CONNECTION_ERRORS as e:
+        circuit_breaker.record_failure(device.id, e)
+        _connection_pool.release(device.id, session, discard=True)
+        raise
+    except Exception:
+        _connection_pool.release(device.id, session, discard=True)
+        raise
+    else:
+        _connection_pool.release(device.id, session)
 
-def get_device_clients(device):
-    """Get clients connected to device
+def offline_status(device, **extra):
+    """Offline result for a device, with retry_at while its circuit is open"""
+    result = {'status': 'offline'}
+    retry_at = circuit_breaker.retry_at(device.id)
+    if retry_at:
+        result['retry_at'] = retry_at
+    if circuit_breaker.probing(device.id):
+        # Một lần thử kết nối đang chạy; retry_at đã được lùi sau thời điểm có kết quả
+        result['probe_in_progress'] = True
+    result.update(extra)
+    return result
+
+def get_circuit_breaker_states():
+    """Get circuit breaker state of devices with recorded failures"""
+    return circuit_breaker.states()
+
+def reset_circuit_breaker(device_id=None):
+    """Close the circuit of one device (or of all devices)"""
+    circuit_breaker.reset(device_id)
 
+def invalidate_device_connections(device_id):
+    """Close pooled sessions of a device (credentials changed or device deleted)"""
+    _connection_pool.invalidate(device_id)
+
+def evict_idle_connections():
+    """Close pooled sessions that have been idle too long"""
+    return _connection_pool.evict_idle()
+
+def get_connection_pool_stats():
+    """Get connection pool hit/miss statistics"""
+    return _connection_pool.stats()
+
+def get_single_flight_stats():
+    """Get statistics of coalesced concurrent device reads"""
+    return single_flight.stats()
+
+def build_device_metrics(device, system_resource):
+    """Shape a /system/resource row into the device metrics dictionary
+    
     Args:
-        device: Device object with connection parameters
+        device: Device object (used for the model name)
+        system_resource (dict): Row returned by /system/resource/print
         
     Returns:
-        Dictionary with client information or offline status
+        Dictionary with device metrics
     """
-    try:
-        # Kết nối đến thiết bị
-        api = connect_to_device(
-            device.ip_address, 
-            device.username, 
-            device.password_hash, 
-            device.api_port, 
-            device.use_ssl
-        )
-        
-        if not api:
-            return {'status': 'offline'}
+    # Lấy thông tin CPU
+    cpu_load = _to_int(system_resource.get('cpu-load', 0))
+    
+    # Lấy thông tin bộ nhớ
+    total_memory = _to_int(system_resource.get('total-memory', 0))
+    free_memory = _to_int(system_resource.get('free-memory', 0))
+    memory_usage = 0
+    
+    if total_memory > 0:
+        memory_usage = 100 - (free_memory / total_memory * 100)
+    
+    # Lấy thông tin ổ đĩa
+    total_hdd = _to_int(system_resource.get('total-hdd-space', 0))
+    free_hdd = _to_int(system_resource.get('free-hdd-space', 0))
+    disk_usage = 0
+    
+    if total_hdd > 0:
+        disk_usage = 100 - (free_hdd / total_hdd * 100)
+    
+    # Lấy thông tin uptime
+    uptime_seconds = system_resource.get('uptime', '0s')
+    
+    # Trả về dữ liệu
+    return {
+        'status': 'online',
+        'cpu': {
+            'load': cpu_load,
+            'cores': _to_int(system_resource.get('cpu-count', 1), 1)
+        },
+        'memory': {
+            'total': total_memory,
+            'free': free_memory,
+            'usage': memory_usage
+        },
+        'disk': {
+            'total': total_hdd,
+            'free': free_hdd,
+            'usage': disk_usage
+        },
+        'system': {
+            'version': system_resource.get('version', 'Unknown'),
+            'architecture': system_resource.get('architecture-name', 'Unknown'),
+            'uptime': format_uptime(uptime_seconds),
+            'uptime_seconds': parse_uptime(uptime_seconds),
+            'board': system_resource.get('board-name', 'Unknown'),
+            'model': device.model or 'Unknown'
+        },
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def build_clients_result(clients):
+    """Wrap per-source client lists into the clients response"""
+    total_clients = sum(len(client_list) for client_list in clients.values())
+    
+    return {
+        'status': 'online',
+        'clients': clients,
+        'total': total_clients,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def format_wireless_client(client):
+    """Shape a wireless registration-table row"""
+    return {
+        'mac': client.get('mac-address', ''),
+        'interface': client.get('interface', ''),
+        'signal': client.get('signal-strength', ''),
+        'uptime': client.get('uptime', ''),
+        'tx_rate': client.get('tx-rate', ''),
+        'rx_rate': client.get('rx-rate', '')
+    }
+
+def format_dhcp_client(client):
+    """Shape a DHCP lease row"""
+    return {
+        'mac': client.get('mac-address', ''),
+        'address': client.get('address', ''),
+        'hostname': client.get('host-name', ''),
+        'status': client.get('status', ''),
+        'expires_after': client.get('expires-after', '')
+    }
+
+def format_capsman_client(client):
+    """Shape a CAPsMAN registration-table row"""
+    return {
+        'mac': client.get('mac-address', ''),
+        'interface': client.get('interface', ''),
+        'ssid': client.get('ssid', ''),
+        'signal': client.get('signal-strength', ''),
+        'uptime': client.get('uptime', ''),
+        'tx_rate': client.get('tx-rate', ''),
+        'rx_rate': client.get('rx-rate', '')
+    }
+
+def build_interface_traffic(interfaces, include_types):
+    """Shape /interface rows into traffic records
+    
+    Args:
+        interfaces (iterable): Rows returned by /interface/print
+        include_types (list): Interface types to keep (empty keeps all)
         
-        # Thu thập thông tin client từ nhiều nguồn
-        clients = {
-            'wireless': _get_wireless_clients(api),
-            'dhcp': _get_dhcp_clients(api),
-            'capsman': _get_capsman_clients(api)
+    Returns:
+        List of interface traffic dictionaries
+    """
+    interface_data = []
+    
+    for interface in interfaces:
+        # Kiểm tra loại interface có nằm trong danh sách được lọc không
+        iface_type = interface.get('type', '')
+        if iface_type not in include_types and include_types:
+            continue
+        
+        # Lấy dữ liệu traffic
+        traffic_data = {
+            'name': interface.get('name', ''),
+            'type': iface_type,
+            'rx_byte': _to_int(interface.get('rx-byte', 0)),
+            'tx_byte': _to_int(interface.get('tx-byte', 0)),
+            'rx_packet': _to_int(interface.get('rx-packet', 0)),
+            'tx_packet': _to_int(interface.get('tx-packet', 0)),
+            'enabled': not _to_bool(interface.get('disabled', 'true')),  # 'disabled' property is inverted
+            'running': _to_bool(interface.get('running', 'false')),
+            'comment': interface.get('comment', '')
         }
         
-        # Đóng kết nối
-        api.close()
-        
-        total_clients = sum(len(client_list) for client_list in clients.values())
+        if 'actual-mtu' in interface:
+            traffic_data['mtu'] = _to_int(interface.get('actual-mtu', 0))
         
-        # Trả về dữ liệu
-        return {
-            'status': 'online',
-            'clients': clients,
-            'total': total_clients,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        interface_data.append(traffic_data)
     
-    except Exception as e:
-        logger.error(f"Error getting clients from device {device.name} ({device.ip_address}): {e}")
-        return {
-            'status': 'error',
-            'error': str(e)
-        }
+    return interface_data
 
-def _get_wireless_clients(api):
-    """Get wireless clients from device
+# Các phần của snapshot: chỉ lấy những thuộc tính mà các view sử dụng
+SNAPSHOT_SECTIONS = {
+    'resource': TableQuery('/system/resource', proplist=(
+        'cpu-load', 'cpu-count', 'total-memory', 'free-memory', 'total-hdd-space',
+        'free-hdd-space', 'uptime', 'version', 'architecture-name', 'board-name')),
+    'interfaces': TableQuery('/interface', proplist=(
+        'name', 'type', 'rx-byte', 'tx-byte', 'rx-packet', 'tx-packet',
+        'disabled', 'running', 'comment', 'actual-mtu')),
+    'wireless': TableQuery('/interface/wireless/registration-table', proplist=(
+        'mac-address', 'interface', 'signal-strength', 'uptime', 'tx-rate', 'rx-rate')),
+    'capsman': TableQuery('/caps-man/registration-table', proplist=(
+        'mac-address', 'interface', 'ssid', 'signal-strength', 'uptime', 'tx-rate', 'rx-rate')),
+    'dhcp': TableQuery('/ip/dhcp-server/lease', proplist=(
+        'mac-address', 'address', 'host-name', 'status', 'expires-after')),
+}
+
+# Bảng kết nối VPN đang hoạt động (phần 'vpn' của snapshot); API VPN trả về
+# toàn bộ thuộc tính nên không giới hạn proplist
+VPN_ACTIVE_PATHS = {
+    'pptp': '/interface/pptp-server/active',
+    'l2tp': '/interface/l2tp-server/active',
+    'sstp': '/interface/sstp-server/active',
+    'ovpn': '/interface/ovpn-server/active',
+    'ipsec': '/ip/ipsec/active-peers',
+}
+
+# Các phần bắt buộc: lỗi khi đọc sẽ làm hỏng cả snapshot
+REQUIRED_SECTIONS = ('resource', 'interfaces')
+
+ALL_SNAPSHOT_SECTIONS = tuple(SNAPSHOT_SECTIONS) + ('vpn',)
+
+def read_tables(api, queries, required=()):
+    """Read several tables in one pipelined round-trip
     
     Args:
         api: Active API connection
+        queries (dict): {key: TableQuery}
+        required (iterable): Keys whose read errors are raised; the others
+            read as [] (e.g. wireless/CAPsMAN package not installed)
         
     Returns:
-        List of wireless clients
+        Dictionary {key: rows}
     """
-    try:
-        # Kiểm tra nếu có wireless interface
-        wireless_path = api.path('/interface/wireless/registration-table')
-        clients = []
-        
-        for client in wireless_path.select():
-            clients.append({
-                'mac': client.get('mac-address', ''),
-                'interface': client.get('interface', ''),
-                'signal': client.get('signal-strength', ''),
-                'uptime': client.get('uptime', ''),
-                'tx_rate': client.get('tx-rate', ''),
-                'rx_rate': client.get('rx-rate', '')
-            })
-        
-        return clients
-    except Exception as e:
-        logger.debug(f"Error getting wireless clients: {e}")
-        return []
+    keys = list(queries)
+    results = run_pipelined(api, [queries[key] for key in keys])
+    
+    tables = {}
+    for key, rows in zip(keys, results):
+        if isinstance(rows, Exception):
+            if key in required:
+                raise rows
+            logger.debug(f"Error reading {queries[key].path}: {rows}")
+            rows = []
+        tables[key] = rows
+    return tables
 
-def _get_dhcp_clients(api):
-    """Get DHCP clients from device
+def read_snapshot_sections(api, sections, where=None):
+    """Read the requested snapshot sections over an open API session
+    
+    All tables are requested at once (tagged pipelining), so a snapshot
+    costs about one round-trip regardless of the number of sections.
     
     Args:
         api: Active API connection
+        sections (iterable): Section names from ALL_SNAPSHOT_SECTIONS
+        where (dict, optional): Extra router-side filters per section,
+            e.g. {'interfaces': {'type': ['ether', 'wlan']}}
         
     Returns:
-        List of DHCP clients
+        Dictionary keyed by section name with raw RouterOS rows
     """
-    try:
-        # Lấy danh sách client DHCP
-        dhcp_path = api.path('/ip/dhcp-server/lease')
-        clients = []
-        
-        for client in dhcp_path.select():
-            clients.append({
-                'mac': client.get('mac-address', ''),
-                'address': client.get('address', ''),
-                'hostname': client.get('host-name', ''),
-                'status': client.get('status', ''),
-                'expires_after': client.get('expires-after', '')
-            })
-        
-        return clients
-    except Exception as e:
-        logger.debug(f"Error getting DHCP clients: {e}")
-        return []
+    where = where or {}
+    queries = {}
+    
+    for section in sections:
+        if section == 'vpn':
+            for vpn_type, path in VPN_ACTIVE_PATHS.items():
+                queries[('vpn', vpn_type)] = TableQuery(path)
+            continue
+        
+        query = SNAPSHOT_SECTIONS[section]
+        if where.get(section):
+            query = query.filter(**where[section])
+        queries[section] = query
+    
+    tables = read_tables(api, queries, required=REQUIRED_SECTIONS)
+    
+    data = {}
+    for key, rows in tables.items():
+        if isinstance(key, tuple):
+            data.setdefault('vpn', {})[key[1]] = rows
+        elif key == 'resource':
+            data['resource'] = rows[0] if rows else {}
+        else:
+            data[key] = rows
+    
+    return data
 
-def _get_capsman_clients(api):
-    """Get CAPsMAN clients from device
+@coalesced(single_flight, Config.SINGLE_FLIGHT)
+def get_device_snapshot(device, sections=None, where=None):
+    """Fetch several tables of a device in a single API session
     
     Args:
-        api: Active API connection
+        device: Device object with connection parameters
+        sections (list, optional): Sections to read. Default: all of
+            'resource', 'interfaces', 'wireless', 'capsman', 'dhcp', 'vpn'
+        where (dict, optional): Router-side filters per section, see
+            read_snapshot_sections()
         
     Returns:
-        List of CAPsMAN clients
+        Snapshot dictionary with raw rows per section, or offline/error status
     """
+    if sections is None:
+        sections = ALL_SNAPSHOT_SECTIONS
+    
+    unknown = [s for s in sections if s not in ALL_SNAPSHOT_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown snapshot sections: {', '.join(unknown)}")
+    
     try:
-        # Kiểm tra nếu có CAPsMAN
-        capsman_path = api.path('/caps-man/registration-table')
-        clients = []
+        # Mượn phiên kết nối từ pool
+        with device_connection(device) as api:
+            if not api:
+                return offline_status(device)
+            
+            snapshot = read_snapshot_sections(api, sections, where)
+    
+    except Exception as e:
+        logger.error(f"Error getting snapshot from device {device.name} ({device.ip_address}): {e}")
+        return {
+            'status': 'error',
+            'error': str(e)
+        }
+    
+    snapshot.update({
+        'status': 'online',
+        'device_id': device.id,
+        'sections': list(sections),
+        'timestamp': datetime.utcnow().isoformat()
+    })
+    return snapshot
+
+def snapshot_from_store(device_id, sections):
+    """Build a snapshot from subscribed tables in the state store
+    
+    Returns:
+        Snapshot dictionary, or None unless every section is live
+    """
+    if not state_store.is_live(device_id, *sections):
+        return None
+    
+    snapshot = {section: state_store.rows(device_id, section) for section in sections}
+    snapshot.update({
+        'status': 'online',
+        'device_id': device_id,
+        'sections': list(sections),
+        'source': 'subscription',
+        'timestamp': datetime.utcnow().isoformat()
+    })
+    return snapshot
+
+def _snapshot_failure(snapshot):
+    """Offline/error part of a snapshot, passed through unchanged by views"""
+    return {key: value for key, value in snapshot.items() if key in ('status', 'error', 'retry_at')}
+
+def metrics_from_snapshot(device, snapshot):
+    """Device metrics view over a snapshot containing 'resource'"""
+    if snapshot.get('status') != 'online':
+        return _snapshot_failure(snapshot)
+    
+    metrics = build_device_metrics(device, snapshot.get('resource', {}))
+    metrics['timestamp'] = snapshot['timestamp']
+    return metrics
+
+def clients_from_snapshot(snapshot):
+    """Clients view over a snapshot containing 'wireless', 'dhcp' and 'capsman'"""
+    if snapshot.get('status') != 'online':
+        return _snapshot_failure(snapshot)
+    
+    result = build_clients_result({
+        'wireless': [format_wireless_client(c) for c in snapshot.get('wireless', [])],
+        'dhcp': [format_dhcp_client(c) for c in snapshot.get('dhcp', [])],
+        'capsman': [format_capsman_client(c) for c in snapshot.get('capsman', [])]
+    })
+    result['timestamp'] = snapshot['timestamp']
+    return result
+
+def traffic_from_snapshot(snapshot, interface_name=None, include_types=None):
+    """Interface traffic view over a snapshot containing 'interfaces'"""
+    if snapshot.get('status') != 'online':
+        return _snapshot_failure(snapshot)
+    
+    if include_types is None:
+        include_types = ['ether', 'wlan', 'bridge']
+    
+    interfaces = snapshot.get('interfaces', [])
+    if interface_name:
+        interfaces = [i for i in interfaces if i.get('name') == interface_name]
+    
+    return {
+        'status': 'online',
+        'interfaces': build_interface_traffic(interfaces, include_types),
+        'timestamp': snapshot['timestamp']
+    }
+
+@coalesced(single_flight, Config.SINGLE_FLIGHT)
+def get_device_metrics(device, max_age=None):
+    """Get current device metrics
+    
+    Args:
+        device: Device object with connection parameters
+        max_age (float, optional): Serve the stored state if at most this many seconds old
         
-        for client in capsman_path.select():
-            clients.append({
-                'mac': client.get('mac-address', ''),
-                'interface': client.get('interface', ''),
-                'ssid': client.get('ssid', ''),
-                'signal': client.get('signal-strength', ''),
-                'uptime': client.get('uptime', ''),
-                'tx_rate': client.get('tx-rate', ''),
-                'rx_rate': client.get('rx-rate', '')
-            })
+    Returns:
+        Dictionary with device metrics or offline status
+    """
+    stored = latest_state(device.id, 'metrics', max_age)
+    if stored:
+        return stored
+    
+    snapshot = get_device_snapshot(device, ['resource'])
+    metrics = metrics_from_snapshot(device, snapshot)
+    if metrics.get('status') == 'online':
+        state_store.put_latest(device.id, 'metrics', metrics)
+    return metrics
+
+@coalesced(single_flight, Config.SINGLE_FLIGHT)
+def get_device_clients(device, max_age=None):
+    """Get clients connected to device
+
+    Args:
+        device: Device object with connection parameters
+        max_age (float, optional): Serve the stored state if at most this many seconds old
         
-        return clients
-    except Exception as e:
-        logger.debug(f"Error getting CAPsMAN clients: {e}")
-        return []
+    Returns:
+        Dictionary with client information or offline status
+    """
+    sections = ['wireless', 'dhcp', 'capsman']
+    
+    # Dùng bảng đang được theo dõi (listen) nếu có, tránh đọc lại toàn bộ
+    snapshot = snapshot_from_store(device.id, sections)
+    if snapshot:
+        return clients_from_snapshot(snapshot)
+    
+    stored = latest_state(device.id, 'clients', max_age)
+    if stored:
+        return stored
+    
+    clients = clients_from_snapshot(get_device_snapshot(device, sections))
+    if clients.get('status') == 'online':
+        state_store.put_latest(device.id, 'clients', clients)
+    return clients
 
-def get_interface_traffic(device, interface_name=None, include_types=None):
+@coalesced(single_flight, Config.SINGLE_FLIGHT)
+def get_interface_traffic(device, interface_name=None, include_types=None, max_age=None):
     """Get interface traffic for a device
     
     Args:
         device: Device object with connection parameters
         interface_name (str, optional): Specific interface to query
         include_types (list, optional): Interface types to include (default: ['ether', 'wlan', 'bridge'])
+        max_age (float, optional): Serve the stored state if at most this many seconds old
         
     Returns:
         Dictionary with interface traffic data or offline status
@@ -307,73 +608,115 @@ def get_interface_traffic(device, interface_name=None, include_types=None):
     if include_types is None:
         include_types = ['ether', 'wlan', 'bridge']
     
-    try:
-        # Kết nối đến thiết bị
-        api = connect_to_device(
-            device.ip_address, 
-            device.username, 
-            device.password_hash, 
-            device.api_port, 
-            device.use_ssl
-        )
-        
-        if not api:
-            return {'status': 'offline'}
-        
-        # Lấy thông tin interface
-        interfaces_path = api.path('/interface')
-        
-        # Xây dựng query cho interface cụ thể hoặc tất cả
-        query = {}
-        if interface_name:
-            query['name'] = interface_name
-        
-        interfaces = interfaces_path.select(**query)
-        
-        # Lưu thông tin interface
-        interface_data = []
-        
-        for interface in interfaces:
-            # Kiểm tra loại interface có nằm trong danh sách được lọc không
-            iface_type = interface.get('type', '')
-            if iface_type not in include_types and include_types:
-                continue
-            
-            # Lấy dữ liệu traffic
-            traffic_data = {
-                'name': interface.get('name', ''),
-                'type': iface_type,
-                'rx_byte': int(interface.get('rx-byte', 0)),
-                'tx_byte': int(interface.get('tx-byte', 0)),
-                'rx_packet': int(interface.get('rx-packet', 0)),
-                'tx_packet': int(interface.get('tx-packet', 0)),
-                'enabled': interface.get('disabled', 'true') == 'false',  # 'disabled' property is inverted
-                'running': interface.get('running', 'false') == 'true',
-                'comment': interface.get('comment', '')
-            }
-            
-            # Tính toán tốc độ (bps)
-            if 'actual-mtu' in interface:
-                traffic_data['mtu'] = int(interface.get('actual-mtu', 0))
-            
-            interface_data.append(traffic_data)
+    kind = traffic_state_kind(include_types)
+    stored = latest_state(device.id, kind, max_age)
+    if stored and interface_name:
+        stored['interfaces'] = [i for i in stored['interfaces'] if i.get('name') == interface_name]
+    if stored and stored['interfaces']:
+        return stored
+    
+    # Lọc theo tên/loại ngay trên router thay vì tải cả bảng interface
+    where = {'interfaces': {'name': interface_name, 'type': include_types}}
+    snapshot = get_device_snapshot(device, ['interfaces'], where)
+    traffic = traffic_from_snapshot(snapshot, interface_name, include_types)
+    if traffic.get('status') == 'online':
+        add_interface_rates(device.id, traffic['interfaces'])
+        if not interface_name:
+            state_store.put_latest(device.id, kind, traffic)
+    return traffic
+
+def add_interface_rates(device_id, interfaces, uptime=None):
+    """Add rx/tx bps and pps to traffic records from the previous read
+    
+    Interfaces seen for the first time (or right after a counter reset)
+    get no rate keys.
+    
+    Args:
+        device_id (int): Device ID
+        interfaces (list): Traffic records from build_interface_traffic()
+        uptime (int, optional): Device uptime in seconds (reboot detection)
         
-        # Đóng kết nối
-        api.close()
+    Returns:
+        Dictionary {interface name: rates}
+    """
+    rates = interface_rates.update(device_id, interfaces, uptime=uptime)
+    for interface in interfaces:
+        interface.update(rates.get(interface['name'], {}))
+    return rates
+
+def collect_device_sample(device):
+    """Device metrics plus interface traffic, read in one API session
+    
+    Args:
+        device: Device object with connection parameters
         
-        # Trả về dữ liệu
-        return {
+    Returns:
+        Metrics dictionary with an extra 'interfaces' list, or offline status
+    """
+    where = {'interfaces': {'type': Config.MONITORING_INTERFACE_TYPES}}
+    snapshot = get_device_snapshot(device, ['resource', 'interfaces'], where)
+    metrics = metrics_from_snapshot(device, snapshot)
+    if metrics.get('status') == 'online':
+        traffic = traffic_from_snapshot(snapshot, include_types=Config.MONITORING_INTERFACE_TYPES)
+        metrics['interfaces'] = traffic['interfaces']
+    return metrics
+
+def traffic_state_kind(include_types):
+    """Latest-state store key of the traffic view of some interface types"""
+    return 'interfaces:' + ','.join(sorted(include_types))
+
+def latest_state(device_id, kind, max_age):
+    """View from the latest-state store marked with its source and age
+    
+    Returns:
+        View dictionary, or None if max_age is not positive or the view is missing/too old
+    """
+    if not max_age or max_age <= 0:
+        return None
+    
+    found = state_store.latest(device_id, kind, max_age)
+    if found is None:
+        return None
+    
+    view, age = found
+    view['source'] = 'store'
+    view['age'] = round(age, 3)
+    return view
+
+def remember_sample(device_id, sample):
+    """Store a collected sample as the latest metrics and traffic views of the device
+    
+    Args:
+        device_id (int): Device ID
+        sample (dict): Online result of collect_device_sample() with interface rates added
+    """
+    metrics = {key: value for key, value in sample.items() if key != 'interfaces'}
+    state_store.put_latest(device_id, 'metrics', metrics)
+    if 'interfaces' in sample:
+        state_store.put_latest(device_id, traffic_state_kind(Config.MONITORING_INTERFACE_TYPES), {
             'status': 'online',
-            'interfaces': interface_data,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+            'interfaces': sample['interfaces'],
+            'timestamp': sample.get('timestamp')
+        })
+
+def interface_rate_metrics(device_id, sample):
+    """Turn the interface counters of a collected sample into rate metrics
     
-    except Exception as e:
-        logger.error(f"Error getting interface traffic from device {device.name} ({device.ip_address}): {e}")
-        return {
-            'status': 'error',
-            'error': str(e)
-        }
+    Args:
+        device_id (int): Device ID
+        sample (dict): Result of collect_device_sample()
+        
+    Returns:
+        Dictionary {'<interface>.<rate>': value} for the 'interface' metric type
+    """
+    uptime = sample.get('system', {}).get('uptime_seconds')
+    rates = add_interface_rates(device_id, sample.get('interfaces', []), uptime)
+    
+    return {
+        f"{name}.{rate_name}"[:50]: values[rate_name]
+        for name, values in rates.items()
+        for rate_name in RATES
+    }
 
 def send_command_to_device(device, command):
     """Send a CLI command to device and return result
@@ -386,21 +729,6 @@ def send_command_to_device(device, command):
         Dictionary with command result or error message
     """
     try:
-        # Kết nối đến thiết bị
-        api = connect_to_device(
-            device.ip_address, 
-            device.username, 
-            device.password_hash, 
-            device.api_port, 
-            device.use_ssl
-        )
-        
-        if not api:
-            return {
-                'status': 'offline',
-                'error': 'Could not connect to device'
-            }
-        
         # Parse command và path
         parts = command.strip().split()
         if not parts:
@@ -410,11 +738,13 @@ def send_command_to_device(device, command):
         path = '/'.join(parts[:-1]) if len(parts) > 1 else '/'
         cmd = parts[-1] if parts else ''
         
-        # Thực hiện command
-        result = list(api.path(path).select())
-        
-        # Đóng kết nối
-        api.close()
+        # Mượn phiên kết nối từ pool
+        with device_connection(device) as api:
+            if not api:
+                return offline_status(device, error='Could not connect to device')
+            
+            # Thực hiện command
+            result = list(api.path(path).select())
         
         # Trả về kết quả
         return {
@@ -446,48 +776,35 @@ def backup_config(device, max_retries=2):
     
     while attempts <= max_retries:
         try:
-            # Kết nối đến thiết bị
-            api = connect_to_device(
-                device.ip_address, 
-                device.username, 
-                device.password_hash, 
-                device.api_port, 
-                device.use_ssl
-            )
-            
-            if not api:
-                attempts += 1
-                if attempts <= max_retries:
-                    logger.warning(f"Retry {attempts}/{max_retries} connecting to device for backup")
-                    time.sleep(2)  # Wait before retry
-                    continue
-                return {
-                    'status': 'offline',
-                    'error': 'Could not connect to device'
-                }
-            
-            # Generate backup name with timestamp
-            backup_name = f"backup_{device.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            
-            # Create backup
-            backup_path = api.path('/system/backup')
-            backup_path.call('save', {'name': backup_name})
-            
-            # Wait for backup to complete
-            time.sleep(2)
-            
-            # Get backup file details
-            files_path = api.path('/file')
-            backup_files = list(files_path.select(name=backup_name + '.backup'))
+            # Mượn phiên kết nối từ pool
+            with device_connection(device) as api:
+                if not api:
+                    attempts += 1
+                    if attempts <= max_retries and not circuit_breaker.retry_at(device.id):
+                        logger.warning(f"Retry {attempts}/{max_retries} connecting to device for backup")
+                        time.sleep(2)  # Wait before retry
+                        continue
+                    return offline_status(device, error='Could not connect to device')
+                
+                # Generate backup name with timestamp
+                backup_name = f"backup_{device.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                
+                # Create backup
+                backup_path = api.path('/system/backup')
+                backup_path.call('save', {'name': backup_name})
+                
+                # Wait for backup to complete
+                time.sleep(2)
+                
+                # Get backup file details
+                files_path = api.path('/file')
+                backup_files = list(files_path.select(name=backup_name + '.backup'))
             
             if not backup_files:
                 raise Exception("Backup file not found after creation")
             
             backup_file = backup_files[0]
             
-            # Đóng kết nối
-            api.close()
-            
             # Trả về thông tin backup
             return {
                 'status': 'success',
@@ -566,6 +883,9 @@ def restore_config(device, backup_file_name, max_retries=2):
             except:
                 pass
             
+            # Thiết bị có thể khởi động lại: các phiên trong pool không còn dùng được
+            invalidate_device_connections(device.id)
+            
             # Trả về thông tin restore
             return {
                 'status': 'success',
@@ -589,6 +909,19 @@ def restore_config(device, backup_file_name, max_retries=2):
                     'error': str(e)
                 }
 
+def _to_int(value, default=0):
+    """Convert a RouterOS value (int or numeric string) to int"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def _to_bool(value):
+    """Convert a RouterOS value (bool or 'true'/'yes') to bool"""
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('true', 'yes')
+
 def calculate_percentage(used, total):
     """Calculate percentage with error handling"""
     try:
@@ -598,29 +931,28 @@ def calculate_percentage(used, total):
     except Exception:
         return 0
 
+def parse_uptime(value):
+    """Convert a RouterOS uptime like "1w2d3h15m3s" to seconds"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    
+    units = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+    total_seconds = 0
+    num = ""
+    for char in str(value):
+        if char.isdigit():
+            num += char
+        elif char in units and num:
+            total_seconds += int(num) * units[char]
+            num = ""
+    return total_seconds
+
 def format_uptime(seconds):
     """Format uptime in seconds to a readable string"""
     try:
         # Convert string like "1d2h15m3s" to seconds
         if isinstance(seconds, str):
-            total_seconds = 0
-            num = ""
-            for char in seconds:
-                if char.isdigit():
-                    num += char
-                elif char == 'd' and num:
-                    total_seconds += int(num) * 86400
-                    num = ""
-                elif char == 'h' and num:
-                    total_seconds += int(num) * 3600
-                    num = ""
-                elif char == 'm' and num:
-                    total_seconds += int(num) * 60
-                    num = ""
-                elif char == 's' and num:
-                    total_seconds += int(num)
-                    num = ""
-            seconds = total_seconds
+            seconds = parse_uptime(seconds)
         
         # Convert seconds to readable format
         days, remainder = divmod(int(seconds), 86400)
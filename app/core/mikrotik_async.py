@@ -0,0 +1,465 @@
+"""
+Client RouterOS API bất đồng bộ (asyncio) và bộ thu thập dữ liệu song song
+"""
+
+import ssl
+import time
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from contextlib import asynccontextmanager
+
+from mik.app.config import Config
+from mik.app.core.routeros_protocol import (
+    RouterOSError, RouterOSTrapError, RouterOSFatalError,
+    build_command, encode_sentence, parse_sentence, read_sentence
+)
+from mik.app.core.mikrotik import (
+    build_device_metrics, build_clients_result, build_interface_traffic,
+    format_wireless_client, format_dhcp_client, format_capsman_client,
+    circuit_breaker, offline_status, SNAPSHOT_SECTIONS
+)
+from mik.app.core.collector import device_offset
+from mik.app.utils.security import decrypt_device_password
+
+logger = logging.getLogger('mikrotik_monitor.core.async')
+
+
+class _Reply:
+    """Collects the rows of one command until !done"""
+
+    def __init__(self, future):
+        self.rows = []
+        self.future = future
+
+    def row(self, attributes):
+        self.rows.append(attributes)
+
+    def trap(self, error):
+        self.fail(error)
+
+    def done(self):
+        if not self.future.done():
+            self.future.set_result(self.rows)
+
+    def fail(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class _End:
+    pass
+
+
+class RouterOSStream:
+    """Rows of a long-running command (listen, print follow)
+
+    Iterate with 'async for'; iteration ends after cancel() or when the
+    router finishes the command.
+    """
+
+    def __init__(self, client, tag):
+        self.tag = tag
+        self._client = client
+        self._queue = asyncio.Queue()
+        self._cancelled = False
+
+    def row(self, attributes):
+        self._queue.put_nowait(attributes)
+
+    def trap(self, error):
+        # Sau /cancel router trả !trap "interrupted" rồi !done
+        if not self._cancelled:
+            self._queue.put_nowait(error)
+
+    def done(self):
+        self._queue.put_nowait(_End)
+
+    def fail(self, error):
+        self._queue.put_nowait(error)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is _End:
+            self._client._pending.pop(self.tag, None)
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            self._client._pending.pop(self.tag, None)
+            raise item
+        return item
+
+    async def cancel(self):
+        """Stop the command on the router"""
+        if self._cancelled:
+            return
+        self._cancelled = True
+        try:
+            await self._client.command('/cancel', tag=self.tag)
+        except RouterOSError as e:
+            logger.debug(f"Error cancelling stream {self.tag}: {e}")
+            self.done()
+
+
+class AsyncRouterOSClient:
+    """Asyncio RouterOS API client
+
+    Every command is sent with its own .tag and a background reader task
+    routes replies back to the waiting coroutine, so several commands may
+    be in flight on one connection at the same time.
+    """
+
+    def __init__(self, host, username, password, port=8728, use_ssl=False,
+                 timeout=10, command_timeout=15):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.command_timeout = command_timeout
+
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = {}
+        self._tags = itertools.count(1)
+        self._closed_error = None
+
+    async def connect(self):
+        """Open the connection and log in
+
+        Raises:
+            RouterOSError: If login fails
+            OSError / asyncio.TimeoutError: If the router cannot be reached
+        """
+        ssl_context = None
+        if self.use_ssl:
+            # Không xác thực cert, giống connect_to_device
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context),
+            timeout=self.timeout
+        )
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+        try:
+            await self.command('/login', name=self.username, password=self.password)
+        except RouterOSTrapError as e:
+            await self.close()
+            raise RouterOSError(f"Login failed: {e}") from e
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def command(self, command, *queries, proplist=None, **attributes):
+        """Run one API command and collect its replies
+
+        Args:
+            command (str): Command path, e.g. '/system/resource/print'
+            *queries: Query words such as '?type=ether'
+            proplist (iterable, optional): Properties to return
+            **attributes: =key=value attributes
+
+        Returns:
+            List of reply rows (dict of strings)
+
+        Raises:
+            RouterOSTrapError: If the router rejects the command
+        """
+        if self._closed_error is not None:
+            raise self._closed_error
+
+        tag = str(next(self._tags))
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = _Reply(future)
+
+        words = build_command(command, attributes, queries, proplist, tag)
+        self._writer.write(encode_sentence(*words))
+        try:
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout=self.command_timeout)
+        finally:
+            self._pending.pop(tag, None)
+
+    async def stream(self, command, *queries, proplist=None, **attributes):
+        """Start a long-running command and return its RouterOSStream
+
+        Rows that arrive before the caller starts iterating are buffered.
+        Arguments are the same as for command().
+        """
+        if self._closed_error is not None:
+            raise self._closed_error
+
+        tag = str(next(self._tags))
+        stream = RouterOSStream(self, tag)
+        self._pending[tag] = stream
+
+        words = build_command(command, attributes, queries, proplist, tag)
+        self._writer.write(encode_sentence(*words))
+        await self._writer.drain()
+        return stream
+
+    async def close(self):
+        """Close the connection and fail pending commands"""
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+            self._writer = None
+        self._fail_pending(RouterOSError("Connection closed"))
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                words = await read_sentence(self._reader)
+                if not words:
+                    continue
+                reply, attributes, tag = parse_sentence(words)
+
+                if reply == '!fatal':
+                    raise RouterOSFatalError(attributes.get('message', 'fatal'))
+
+                handler = self._pending.get(tag)
+                if handler is None:
+                    logger.debug(f"Dropping reply {reply} for unknown tag {tag}")
+                    continue
+
+                if reply == '!re':
+                    handler.row(attributes)
+                elif reply == '!trap':
+                    handler.trap(RouterOSTrapError(attributes.get('message', 'trap')))
+                elif reply in ('!done', '!empty'):
+                    handler.done()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.IncompleteReadError:
+            self._fail_pending(RouterOSError("Connection closed by router"))
+        except Exception as e:
+            self._fail_pending(e if isinstance(e, RouterOSError) else RouterOSError(str(e)))
+
+    def _fail_pending(self, error):
+        self._closed_error = error
+        for handler in list(self._pending.values()):
+            handler.fail(error)
+
+
+def _device_password(device):
+    """Plain-text API password of a device"""
+    password = device.password_hash
+    if password and password.startswith('enc:'):
+        password = decrypt_device_password(password)
+    return password
+
+
+@asynccontextmanager
+async def device_client(device, timeout=None, command_timeout=None):
+    """Open a logged-in AsyncRouterOSClient for a Device object
+
+    Yields None if the device could not be reached or its circuit breaker
+    is open.
+    """
+    if not circuit_breaker.allow(device.id):
+        yield None
+        return
+
+    client = AsyncRouterOSClient(
+        device.ip_address,
+        device.username,
+        _device_password(device),
+        port=device.api_port,
+        use_ssl=device.use_ssl,
+        timeout=timeout or Config.MIKROTIK_CONNECTION_TIMEOUT,
+        command_timeout=command_timeout or Config.MIKROTIK_COMMAND_TIMEOUT
+    )
+    try:
+        await client.connect()
+    except (OSError, asyncio.TimeoutError, RouterOSError) as e:
+        logger.error(f"Connection error to MikroTik device at {device.ip_address}: {e}")
+        circuit_breaker.record_failure(device.id, str(e) or 'connection timeout')
+        yield None
+        return
+    except BaseException:
+        circuit_breaker.cancel_probe(device.id)
+        raise
+
+    circuit_breaker.record_success(device.id)
+    try:
+        yield client
+    except (OSError, asyncio.TimeoutError, RouterOSFatalError) as e:
+        circuit_breaker.record_failure(device.id, str(e) or 'command timeout')
+        raise
+    finally:
+        await client.close()
+
+
+async def async_get_device_metrics(device, client=None):
+    """Async version of mikrotik.get_device_metrics
+
+    Args:
+        device: Device object with connection parameters
+        client (AsyncRouterOSClient, optional): Reuse an open client
+
+    Returns:
+        Dictionary with device metrics or offline status
+    """
+    async def fetch(api):
+        rows = await SNAPSHOT_SECTIONS['resource'].run_async(api)
+        return build_device_metrics(device, rows[0] if rows else {})
+
+    return await _run(device, fetch, client, 'metrics')
+
+
+async def async_get_interface_traffic(device, interface_name=None, include_types=None, client=None):
+    """Async version of mikrotik.get_interface_traffic"""
+    if include_types is None:
+        include_types = ['ether', 'wlan', 'bridge']
+
+    async def fetch(api):
+        query = SNAPSHOT_SECTIONS['interfaces'].filter(name=interface_name, type=include_types)
+        rows = await query.run_async(api)
+        return {
+            'status': 'online',
+            'interfaces': build_interface_traffic(rows, include_types),
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+    return await _run(device, fetch, client, 'interface traffic')
+
+
+async def async_collect_device_sample(device, client=None):
+    """Async version of mikrotik.collect_device_sample
+
+    Resource and interface tables are requested concurrently on one
+    connection.
+    """
+    include_types = Config.MONITORING_INTERFACE_TYPES
+
+    async def fetch(api):
+        resource, interfaces = await asyncio.gather(
+            SNAPSHOT_SECTIONS['resource'].run_async(api),
+            SNAPSHOT_SECTIONS['interfaces'].filter(type=include_types).run_async(api)
+        )
+        metrics = build_device_metrics(device, resource[0] if resource else {})
+        metrics['interfaces'] = build_interface_traffic(interfaces, include_types)
+        return metrics
+
+    return await _run(device, fetch, client, 'sample')
+
+
+async def async_get_device_clients(device, client=None):
+    """Async version of mikrotik.get_device_clients
+
+    The three client tables are requested concurrently on one connection.
+    """
+    async def optional(api, section, formatter):
+        query = SNAPSHOT_SECTIONS[section]
+        try:
+            return [formatter(row) for row in await query.run_async(api)]
+        except RouterOSTrapError as e:
+            # Gói wireless/CAPsMAN có thể không được cài đặt
+            logger.debug(f"Error reading {query.path}: {e}")
+            return []
+
+    async def fetch(api):
+        wireless, dhcp, capsman = await asyncio.gather(
+            optional(api, 'wireless', format_wireless_client),
+            optional(api, 'dhcp', format_dhcp_client),
+            optional(api, 'capsman', format_capsman_client)
+        )
+        return build_clients_result({'wireless': wireless, 'dhcp': dhcp, 'capsman': capsman})
+
+    return await _run(device, fetch, client, 'clients')
+
+
+async def _run(device, fetch, client, what):
+    try:
+        if client is not None:
+            return await fetch(client)
+        async with device_client(device) as api:
+            if api is None:
+                return offline_status(device)
+            return await fetch(api)
+    except Exception as e:
+        logger.error(f"Error getting {what} from device {device.name} ({device.ip_address}): {e}")
+        return {
+            'status': 'error',
+            'error': str(e)
+        }
+
+
+class AsyncCollector:
+    """Poll many devices concurrently with a bounded number of connections"""
+
+    def __init__(self, concurrency=None, fetch=async_get_device_metrics):
+        """
+        Args:
+            concurrency (int, optional): Maximum devices polled at once.
+                Default from Config.COLLECTOR_CONCURRENCY.
+            fetch (coroutine function): fetch(device) -> result dict
+        """
+        self.concurrency = concurrency or Config.COLLECTOR_CONCURRENCY
+        self.fetch = fetch
+        self.last_run = {}
+
+    async def poll(self, devices, window=0):
+        """Poll all devices and return {device_id: result}
+
+        Args:
+            devices (list): Device objects
+            window (float): Spread start times over this many seconds
+                (see collector.device_offset); 0 starts all at once
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        lags = []
+
+        async def poll_one(device):
+            due = started + device_offset(device.id, window)
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with semaphore:
+                lags.append(max(0.0, time.monotonic() - due))
+                return device.id, await self.fetch(device)
+
+        results = dict(await asyncio.gather(*(poll_one(device) for device in devices)))
+
+        elapsed = time.monotonic() - started
+        online = sum(1 for r in results.values() if r.get('status') == 'online')
+        self.last_run = {
+            'devices': len(results),
+            'online': online,
+            'duration': elapsed,
+            'polls_per_second': len(results) / elapsed if elapsed > 0 else 0.0,
+            'max_lag': max(lags) if lags else 0.0,
+            'concurrency': self.concurrency
+        }
+        logger.debug(f"Polled {len(results)} devices in {elapsed:.2f}s ({online} online)")
+        return results
+
+    def run(self, devices, window=0):
+        """Blocking wrapper around poll() for scheduler jobs"""
+        return asyncio.run(self.poll(devices, window))
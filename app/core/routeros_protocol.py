@@ -0,0 +1,153 @@
+"""
+Mã hóa/giải mã giao thức RouterOS API (word/sentence)
+"""
+
+import logging
+
+logger = logging.getLogger('mikrotik_monitor.protocol')
+
+ENCODING = 'utf-8'
+
+
+class RouterOSError(Exception):
+    """Base error for RouterOS API failures"""
+
+
+class RouterOSTrapError(RouterOSError):
+    """Command failed on the router (!trap reply)"""
+
+
+class RouterOSFatalError(RouterOSError):
+    """Router closed the session (!fatal reply)"""
+
+
+def encode_length(length):
+    """Encode a word length using the RouterOS variable-length scheme
+
+    Args:
+        length (int): Length of the word in bytes
+
+    Returns:
+        Encoded length prefix as bytes
+    """
+    if length < 0x80:
+        return bytes((length,))
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def length_prefix_size(first_byte):
+    """Number of extra bytes that follow the first byte of a length prefix"""
+    if first_byte < 0x80:
+        return 0
+    if first_byte < 0xC0:
+        return 1
+    if first_byte < 0xE0:
+        return 2
+    if first_byte < 0xF0:
+        return 3
+    if first_byte == 0xF0:
+        return 4
+    raise RouterOSError(f"Invalid length prefix byte: {first_byte:#x}")
+
+
+def decode_length(prefix):
+    """Decode a complete length prefix (first byte plus extra bytes)"""
+    first = prefix[0]
+    extra = len(prefix) - 1
+    if extra == 0:
+        return first
+    if extra == 4:
+        return int.from_bytes(prefix[1:], 'big')
+    mask = (0x3F, 0x1F, 0x0F)[extra - 1]
+    return int.from_bytes(bytes((first & mask,)) + prefix[1:], 'big')
+
+
+def encode_word(word):
+    """Encode a single API word"""
+    data = word.encode(ENCODING)
+    return encode_length(len(data)) + data
+
+
+def encode_sentence(*words):
+    """Encode a sentence (words followed by the empty terminator word)"""
+    return b''.join(encode_word(word) for word in words) + b'\x00'
+
+
+def build_command(command, attributes=None, queries=(), proplist=None, tag=None):
+    """Build the words of an API command
+
+    Args:
+        command (str): Command path, e.g. '/interface/print'
+        attributes (dict, optional): =key=value attributes
+        queries (iterable, optional): Query words such as '?type=ether'
+        proplist (iterable, optional): Properties to return (.proplist)
+        tag (str|int, optional): .tag used to match replies
+
+    Returns:
+        List of words
+    """
+    words = [command]
+    for key, value in (attributes or {}).items():
+        words.append(f"={key}={value}")
+    if proplist:
+        words.append(f"=.proplist={','.join(proplist)}")
+    words.extend(queries)
+    if tag is not None:
+        words.append(f".tag={tag}")
+    return words
+
+
+def parse_sentence(words):
+    """Split a reply sentence into its parts
+
+    Args:
+        words (list): Decoded words of one sentence
+
+    Returns:
+        Tuple (reply_word, attributes dict, tag or None)
+    """
+    if not words:
+        raise RouterOSError("Empty sentence")
+
+    reply = words[0]
+    attributes = {}
+    tag = None
+    for word in words[1:]:
+        if word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attributes[key] = value
+        elif word.startswith('.tag='):
+            tag = word[5:]
+        else:
+            # Thuộc tính đặc biệt khác (ví dụ '.section=') giữ nguyên
+            key, _, value = word.partition('=')
+            attributes[key] = value
+    return reply, attributes, tag
+
+
+async def read_sentence(reader):
+    """Read one sentence from an asyncio StreamReader
+
+    Returns:
+        List of decoded words (without the terminating empty word)
+
+    Raises:
+        asyncio.IncompleteReadError: If the peer closed the stream
+    """
+    words = []
+    while True:
+        first = (await reader.readexactly(1))[0]
+        extra = length_prefix_size(first)
+        prefix = bytes((first,))
+        if extra:
+            prefix += await reader.readexactly(extra)
+        length = decode_length(prefix)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode(ENCODING, errors='replace'))
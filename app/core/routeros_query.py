@@ -0,0 +1,156 @@
+"""
+Truy vấn khai báo cho các bảng RouterOS (.proplist và query word)
+"""
+
+import logging
+
+from librouteros.exceptions import TrapError
+
+logger = logging.getLogger('mikrotik_monitor.query')
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def build_query_words(where):
+    """Translate a filter dictionary into RouterOS query words
+
+    Args:
+        where (dict): {property: value}. A list/tuple value matches any of
+            its items; None matches rows that lack the property. All
+            properties must match.
+
+    Returns:
+        List of query words, e.g. ['?type=ether', '?type=vlan', '?#|']
+    """
+    words = []
+    for key, value in (where or {}).items():
+        if value is None:
+            words.append(f'?-{key}')
+        elif isinstance(value, (list, tuple, set)):
+            values = list(value)
+            if not values:
+                continue
+            words.extend(f'?{key}={_format_value(v)}' for v in values)
+            # Gộp N điều kiện bằng N-1 phép OR trên stack truy vấn
+            words.extend('?#|' for _ in range(len(values) - 1))
+        else:
+            words.append(f'?{key}={_format_value(value)}')
+    return words
+
+
+class TableQuery:
+    """Read of one RouterOS table with server-side projection and filtering
+
+    The router only returns the properties in proplist and the rows that
+    match where, instead of the whole table.
+    """
+
+    def __init__(self, path, proplist=None, where=None):
+        """
+        Args:
+            path (str): Menu path, e.g. '/interface'
+            proplist (iterable, optional): Properties to return (all if None)
+            where (dict, optional): Filters, see build_query_words()
+        """
+        self.path = path
+        self.proplist = tuple(proplist) if proplist else None
+        self.where = dict(where or {})
+
+    @property
+    def command(self):
+        return f'{self.path}/print'
+
+    def filter(self, **where):
+        """Return a copy with extra filters (None/empty values are ignored)"""
+        merged = dict(self.where)
+        merged.update({k.replace('_', '-'): v for k, v in where.items() if v})
+        return TableQuery(self.path, self.proplist, merged)
+
+    def query_words(self):
+        return build_query_words(self.where)
+
+    def words(self):
+        """All words after the command word (.proplist first, then queries)"""
+        words = []
+        if self.proplist:
+            words.append(f"=.proplist={','.join(self.proplist)}")
+        return words + self.query_words()
+
+    def run(self, api):
+        """Execute over a librouteros API session
+
+        Returns:
+            List of rows
+        """
+        return list(api.rawCmd(self.command, *self.words()))
+
+    async def run_async(self, client):
+        """Execute over an AsyncRouterOSClient
+
+        Returns:
+            List of rows
+        """
+        return await client.command(self.command, *self.query_words(), proplist=self.proplist)
+
+    def __repr__(self):
+        return f"<TableQuery {self.command} proplist={self.proplist} where={self.where}>"
+
+
+def run_pipelined(api, queries):
+    """Send several reads at once on one librouteros session
+
+    Every command carries its own .tag and all of them are written before
+    any reply is read, so N reads cost about one round-trip instead of N.
+
+    Args:
+        api: librouteros API session (used exclusively by the caller)
+        queries (list): TableQuery objects
+
+    Returns:
+        List with, for each query in order, its rows or the TrapError the
+        router answered with
+
+    Raises:
+        librouteros FatalError / OSError: If the session breaks
+    """
+    results = [[] for _ in queries]
+    if not queries:
+        return results
+
+    # Một lần ghi cho tất cả lệnh, tránh Nagle/delayed ACK giữa các sentence nhỏ
+    api.protocol.transport.write(b''.join(
+        api.protocol.encodeSentence(query.command, *query.words(), f'.tag={index}')
+        for index, query in enumerate(queries)
+    ))
+
+    pending = len(queries)
+    while pending:
+        reply, words = api.protocol.readSentence()
+        tag = None
+        attributes = {}
+        for word in words:
+            if word.startswith('.tag='):
+                tag = word[5:]
+            else:
+                key, value = api.parseWord(word)
+                attributes[key] = value
+
+        if tag is None or not tag.isdigit() or int(tag) >= len(queries):
+            logger.debug(f"Dropping reply {reply} with unexpected tag {tag}")
+            continue
+        index = int(tag)
+
+        if reply == '!re':
+            if isinstance(results[index], list):
+                results[index].append(attributes)
+        elif reply == '!trap':
+            results[index] = TrapError(message=str(attributes.get('message', 'trap')),
+                                       category=attributes.get('category'))
+        elif reply == '!done':
+            pending -= 1
+
+    return results
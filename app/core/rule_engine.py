@@ -0,0 +1,273 @@
+"""
+Bộ máy rule cảnh báo biên dịch thành mảng NumPy, đánh giá toàn bộ rule của mọi thiết bị trong một lượt vector hoá
+"""
+
+import time
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tuỳ chọn: khi thiếu, dùng RuleIndex của alerts.py
+    np = None
+
+from mik.app.core.windows import sample_value
+
+logger = logging.getLogger('mikrotik_monitor.rule_engine')
+
+# Mã toán tử theo thứ tự của _UFUNCS
+OPERATORS = ('>', '<', '>=', '<=', '==')
+_UFUNCS = (np.greater, np.less, np.greater_equal, np.less_equal, np.equal) if np is not None else ()
+
+
+class CompiledRuleEngine:
+    """Enabled alert rules as parallel arrays evaluated in one pass
+
+    Each rule is a row of (rule ID, device row, metric column, operator
+    code, threshold). Collected samples write the values of the metrics
+    used by rules into a fleet-wide devices x metrics matrix (NaN when
+    missing) and mark the device row fresh. evaluate() gathers the value
+    of every rule with one fancy-indexing operation, compares it once per
+    operator, keeps rules of fresh devices and clears the fresh flags, so
+    every sample is evaluated exactly once.
+
+    Rules with a duration get their own column per (metric, aggregate,
+    duration), filled with the aggregate of the matching sliding window
+    (NaN until the window spans the duration).
+
+    Rules are replaced incrementally by apply(): removed and changed rows
+    are masked out and new rows appended, without touching the others.
+    Device rows and metric columns no rule uses any more are then dropped,
+    so the matrix and the metrics read from samples follow the rules.
+    """
+
+    def __init__(self, windows=None, clock=time.perf_counter):
+        """
+        Args:
+            windows (WindowStore, optional): Windows of duration rules;
+                without it every rule uses the latest value
+        """
+        if np is None:
+            raise RuntimeError("CompiledRuleEngine requires NumPy")
+        self._windows = windows
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rules = {}
+        self._device_rows = {}
+        self._metric_columns = {}
+        self._device_metrics = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._columns = np.zeros(0, dtype=np.int32)
+        self._ops = np.zeros(0, dtype=np.int8)
+        self._thresholds = np.zeros(0, dtype=np.float64)
+        self._op_groups = [np.zeros(0, dtype=np.intp) for _ in OPERATORS]
+        self._values = np.full((0, 0), np.nan)
+        self._fresh = np.zeros(0, dtype=bool)
+        self._stats = {'loads': 0, 'changes': 0, 'updates': 0, 'evaluations': 0, 'fired': 0,
+                       'last_evaluation_ms': 0.0, 'max_evaluation_ms': 0.0}
+
+    def load(self, rules):
+        """Replace every rule
+
+        Args:
+            rules (iterable): IndexedRule-like objects (id, device_id, series,
+                aggregate, duration, condition and threshold)
+
+        Returns:
+            Number of rules compiled (rules with an unknown condition are skipped)
+        """
+        with self._lock:
+            self._rules = {}
+            self._device_metrics = {}
+            self._set_arrays(*self._compile(rules))
+            self._compact()
+            self._stats['loads'] += 1
+            return len(self._ids)
+
+    def apply(self, changed, enabled_ids):
+        """Apply rule changes since the previous load/apply
+
+        Args:
+            changed (iterable): Rules created or updated since then, enabled or not
+            enabled_ids (iterable): IDs of every enabled rule (missing ones were deleted)
+
+        Returns:
+            Tuple (rules removed, rules added)
+        """
+        changed = list(changed)
+        enabled_ids = set(enabled_ids)
+        with self._lock:
+            stale = {rule_id for rule_id in self._rules if rule_id not in enabled_ids}
+            stale.update(rule.id for rule in changed if rule.id in self._rules)
+            added = [rule for rule in changed if rule.id in enabled_ids]
+            if not stale and not added:
+                return 0, 0
+
+            keep = ~np.isin(self._ids, np.fromiter(stale, dtype=np.int64, count=len(stale)))
+            stale_devices = {self._rules.pop(rule_id).device_id for rule_id in stale}
+            ids, rows, columns, ops, thresholds = self._compile(added)
+            self._set_arrays(
+                np.concatenate((self._ids[keep], ids)),
+                np.concatenate((self._rows[keep], rows)),
+                np.concatenate((self._columns[keep], columns)),
+                np.concatenate((self._ops[keep], ops)),
+                np.concatenate((self._thresholds[keep], thresholds))
+            )
+            self._forget_metrics(stale_devices)
+            self._compact()
+            self._stats['changes'] += 1
+            return len(stale), len(ids)
+
+    def _compile(self, rules):
+        """Arrays of new rules, registering their devices and metrics (lock held)"""
+        ids, rows, columns, ops, thresholds = [], [], [], [], []
+        for rule in rules:
+            if rule.condition not in OPERATORS:
+                logger.warning(f"Alert rule {rule.id} has unknown condition {rule.condition!r}")
+                continue
+            row = self._device_rows.setdefault(rule.device_id, len(self._device_rows))
+            duration = rule.duration if self._windows is not None else 0
+            key = (rule.series, rule.aggregate if duration else None, duration)
+            column = self._metric_columns.setdefault(key, len(self._metric_columns))
+            self._device_metrics.setdefault(rule.device_id, {})[column] = key
+            self._rules[rule.id] = rule
+            ids.append(rule.id)
+            rows.append(row)
+            columns.append(column)
+            ops.append(OPERATORS.index(rule.condition))
+            thresholds.append(rule.threshold)
+        self._grow_matrix()
+        return (np.array(ids, dtype=np.int64), np.array(rows, dtype=np.int32),
+                np.array(columns, dtype=np.int32), np.array(ops, dtype=np.int8),
+                np.array(thresholds, dtype=np.float64))
+
+    def _grow_matrix(self):
+        shape = (len(self._device_rows), len(self._metric_columns))
+        if shape == self._values.shape:
+            return
+        values = np.full(shape, np.nan)
+        old_rows, old_columns = self._values.shape
+        values[:old_rows, :old_columns] = self._values
+        fresh = np.zeros(shape[0], dtype=bool)
+        fresh[:old_rows] = self._fresh
+        self._values, self._fresh = values, fresh
+
+    def _forget_metrics(self, devices):
+        """Rebuild the metrics read for devices that lost rules from the remaining rules (lock held)"""
+        rows = [self._device_rows[device_id] for device_id in devices]
+        columns = {column: key for key, column in self._metric_columns.items()}
+        for device_id in devices:
+            self._device_metrics.pop(device_id, None)
+        devices = {row: device_id for device_id, row in self._device_rows.items()}
+        used = np.isin(self._rows, rows)
+        for row, column in set(zip(self._rows[used].tolist(), self._columns[used].tolist())):
+            self._device_metrics.setdefault(devices[row], {})[column] = columns[column]
+
+    def _compact(self):
+        """Drop the device rows and metric columns no rule uses any more (lock held)"""
+        used_rows = np.unique(self._rows)
+        used_columns = np.unique(self._columns)
+        if len(used_rows) == len(self._device_rows) and len(used_columns) == len(self._metric_columns):
+            return
+        # Chỉ số cũ -> chỉ số mới, giữ thứ tự; -1 cho hàng/cột bị bỏ
+        row_map = np.full(len(self._device_rows), -1, dtype=np.int32)
+        row_map[used_rows] = np.arange(len(used_rows), dtype=np.int32)
+        column_map = np.full(len(self._metric_columns), -1, dtype=np.int32)
+        column_map[used_columns] = np.arange(len(used_columns), dtype=np.int32)
+
+        self._device_rows = {device_id: int(row_map[row]) for device_id, row in self._device_rows.items()
+                             if row_map[row] >= 0}
+        self._metric_columns = {key: int(column_map[column]) for key, column in self._metric_columns.items()
+                                if column_map[column] >= 0}
+        self._device_metrics = {
+            device_id: {int(column_map[column]): key for column, key in metrics.items()}
+            for device_id, metrics in self._device_metrics.items() if device_id in self._device_rows
+        }
+        self._values = self._values[np.ix_(used_rows, used_columns)]
+        self._fresh = self._fresh[used_rows]
+        self._rows = row_map[self._rows]
+        self._columns = column_map[self._columns]
+
+    def _set_arrays(self, ids, rows, columns, ops, thresholds):
+        self._ids, self._rows, self._columns, self._ops, self._thresholds = ids, rows, columns, ops, thresholds
+        self._op_groups = [np.flatnonzero(ops == code) for code in range(len(OPERATORS))]
+
+    def update(self, device_id, sample, now=None):
+        """Store the rule metrics of a collected sample and mark the device fresh
+
+        Args:
+            device_id (int): Device ID
+            sample (dict): Online collected sample
+            now (float, optional): Sample time in epoch seconds (duration rules)
+
+        Returns:
+            False if no rule uses this device
+        """
+        with self._lock:
+            row = self._device_rows.get(device_id)
+            metrics = self._device_metrics.get(device_id)
+            if row is None or not metrics:
+                return False
+            values = self._values[row]
+            values.fill(np.nan)
+            pushed = set()
+            for column, (metric, aggregate, duration) in metrics.items():
+                value = sample_value(sample, metric)
+                if duration:
+                    # Cửa sổ (metric, duration) dùng chung cho mọi aggregate, chỉ nhận mẫu một lần
+                    if value is not None and (metric, duration) not in pushed:
+                        self._windows.push(device_id, metric, duration, now, value)
+                        pushed.add((metric, duration))
+                    value = self._windows.aggregate(device_id, metric, duration, aggregate, now)
+                if value is not None:
+                    values[column] = value
+            self._fresh[row] = True
+            self._stats['updates'] += 1
+            return True
+
+    def evaluate(self):
+        """Evaluate every rule against the fresh samples, then clear the fresh flags
+
+        Returns:
+            List of (rule, value) whose condition holds
+        """
+        with self._lock:
+            if not self._fresh.any():
+                return []
+            started = self._clock()
+            values = self._values[self._rows, self._columns]
+            fired = np.zeros(len(values), dtype=bool)
+            for ufunc, group in zip(_UFUNCS, self._op_groups):
+                if len(group):
+                    # So sánh với NaN (metric thiếu trong mẫu) luôn là False
+                    fired[group] = ufunc(values[group], self._thresholds[group])
+            fired &= self._fresh[self._rows]
+            self._fresh[:] = False
+            hits = np.flatnonzero(fired)
+            result = [(self._rules[rule_id], value)
+                      for rule_id, value in zip(self._ids[hits].tolist(), values[hits].tolist())]
+
+            elapsed = (self._clock() - started) * 1000
+            self._stats['evaluations'] += 1
+            self._stats['fired'] += len(result)
+            self._stats['last_evaluation_ms'] = elapsed
+            self._stats['max_evaluation_ms'] = max(self._stats['max_evaluation_ms'], elapsed)
+            return result
+
+    def rules(self):
+        """Every compiled rule"""
+        with self._lock:
+            return list(self._rules.values())
+
+    def stats(self):
+        """Compiled rules, matrix shape and evaluation timings"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'rules': len(self._ids),
+                'devices': len(self._device_rows),
+                'metrics': len(self._metric_columns),
+                'pending_devices': int(self._fresh.sum())
+            })
+        return stats
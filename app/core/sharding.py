@@ -0,0 +1,205 @@
+"""
+Chia thiết bị cho nhiều bộ thu thập (process/máy) bằng consistent hashing và lease trong database
+"""
+
+import os
+import time
+import zlib
+import socket
+import hashlib
+import logging
+import threading
+
+from mik.app.config import Config
+from mik.app.database.crud import (
+    heartbeat_collector_node, get_live_collector_nodes, purge_collector_nodes, remove_collector_node,
+    ensure_shard_leases, acquire_shard_leases, release_shard_leases, get_shard_leases
+)
+
+logger = logging.getLogger('mikrotik_monitor.sharding')
+
+
+def shard_of(device_id, shard_count):
+    """Shard of a device; fixed for a given shard count"""
+    return zlib.crc32(str(device_id).encode()) % shard_count
+
+
+def _score(node_id, shard):
+    digest = hashlib.blake2b(f'{node_id}/{shard}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def assign_shards(shard_count, nodes):
+    """Owner of every shard (rendezvous hashing with bounded load)
+
+    Each node scores every shard and a shard goes to the highest-scoring
+    node that has not reached ceil(shards / nodes) shards yet. Adding or
+    removing a node moves roughly the shards won or lost by that node,
+    and every node computes the same result from the same node list.
+
+    Args:
+        shard_count (int): Number of shards
+        nodes (iterable): Live node IDs
+
+    Returns:
+        Dictionary shard -> node ID (empty if there are no nodes)
+    """
+    nodes = sorted(set(nodes))
+    if not nodes:
+        return {}
+    capacity = -(-shard_count // len(nodes))
+    load = dict.fromkeys(nodes, 0)
+    owners = {}
+    for shard in range(shard_count):
+        for node_id in sorted(nodes, key=lambda node_id: _score(node_id, shard), reverse=True):
+            if load[node_id] < capacity:
+                owners[shard] = node_id
+                load[node_id] += 1
+                break
+    return owners
+
+
+def default_node_id():
+    """Node ID from the environment, else '<hostname>-<pid>'"""
+    return Config.COLLECTOR_NODE_ID or f'{socket.gethostname()}-{os.getpid()}'
+
+
+class ShardCoordinator:
+    """Decides which devices this process polls
+
+    Devices are split into a fixed number of shards. Every node writes a
+    heartbeat row, computes the preferred owner of each shard among the
+    live nodes and holds a lease row for the shards it should own. Leases
+    expire after lease_ttl seconds, so the shards of a node that stops
+    renewing are taken over by the others on their next renewal.
+
+    If renewing fails (database unreachable) the node stops polling once
+    its last lease would have expired rather than risk polling shards that
+    another node already took.
+    """
+
+    def __init__(self, shard_count=None, lease_ttl=None, node_id=None, clock=time.monotonic):
+        """
+        Args:
+            shard_count (int, optional): Number of shards.
+                Default Config.COLLECTOR_SHARDS.
+            lease_ttl (int, optional): Lease/heartbeat lifetime in seconds.
+                Default Config.COLLECTOR_LEASE_TTL.
+            node_id (str, optional): ID of this node. Resolved on the first
+                renewal (after a fork) if not given.
+        """
+        self.shard_count = shard_count or Config.COLLECTOR_SHARDS
+        self.lease_ttl = lease_ttl or Config.COLLECTOR_LEASE_TTL
+        self._node_id = node_id
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._owned = frozenset()
+        self._nodes = []
+        self._valid_until = 0.0
+        self._renewals = 0
+        self._failures = 0
+
+    @property
+    def node_id(self):
+        if self._node_id is None:
+            self._node_id = default_node_id()
+        return self._node_id
+
+    @property
+    def renew_interval(self):
+        """Seconds between renewals; a third of the lease lifetime"""
+        return max(1.0, self.lease_ttl / 3)
+
+    def renew(self):
+        """Heartbeat, then take/renew preferred shards and release the others
+
+        Must run in an application context.
+
+        Returns:
+            Set of shards held after the renewal
+        """
+        started = self._clock()
+        node_id = self.node_id
+        try:
+            heartbeat_collector_node(node_id, socket.gethostname(), os.getpid())
+            ensure_shard_leases(self.shard_count)
+            nodes = get_live_collector_nodes(self.lease_ttl)
+            if node_id not in nodes:
+                nodes.append(node_id)
+
+            owners = assign_shards(self.shard_count, nodes)
+            wanted = {shard for shard, owner in owners.items() if owner == node_id}
+            # Trả lại shard không còn thuộc node này để node mới nhận ngay
+            release_shard_leases(node_id, self._owned - wanted)
+            owned = frozenset(acquire_shard_leases(node_id, wanted, self.lease_ttl))
+            purge_collector_nodes(self.lease_ttl * 10)
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+            logger.error(f"Error renewing collector shard leases: {e}")
+            return self.owned_shards()
+
+        with self._lock:
+            changed = owned != self._owned
+            self._owned = owned
+            self._nodes = nodes
+            self._valid_until = started + self.lease_ttl
+            self._renewals += 1
+
+        if changed:
+            logger.info(f"Collector {node_id} holds {len(owned)}/{self.shard_count} shards "
+                        f"({len(nodes)} live nodes, {len(wanted) - len(owned)} waiting for release)")
+        return owned
+
+    def owned_shards(self):
+        """Shards held by this node; empty once the leases may have expired"""
+        with self._lock:
+            if self._clock() >= self._valid_until:
+                return frozenset()
+            return self._owned
+
+    def owns(self, device_id):
+        return shard_of(device_id, self.shard_count) in self.owned_shards()
+
+    def owns_shard(self, shard):
+        return shard in self.owned_shards()
+
+    def filter_devices(self, devices):
+        """Devices of the shards held by this node"""
+        owned = self.owned_shards()
+        return [device for device in devices if shard_of(device.id, self.shard_count) in owned]
+
+    def leave(self):
+        """Release every lease and unregister (clean shutdown)"""
+        try:
+            remove_collector_node(self.node_id)
+        except Exception as e:
+            logger.error(f"Error releasing collector shard leases: {e}")
+        with self._lock:
+            self._owned = frozenset()
+            self._valid_until = 0.0
+
+    def stats(self):
+        """Node ID, held shards and renewal counters"""
+        owned = sorted(self.owned_shards())
+        with self._lock:
+            return {
+                'node_id': self.node_id,
+                'shard_count': self.shard_count,
+                'lease_ttl': self.lease_ttl,
+                'owned_shards': owned,
+                'live_nodes': list(self._nodes),
+                'renewals': self._renewals,
+                'failures': self._failures
+            }
+
+
+# Bộ điều phối dùng chung cho toàn bộ process
+shard_coordinator = ShardCoordinator()
+
+
+def get_sharding_stats():
+    """Get this node's shards plus every lease row (application context)"""
+    stats = shard_coordinator.stats()
+    stats['leases'] = get_shard_leases()
+    return stats
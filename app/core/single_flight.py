@@ -0,0 +1,133 @@
+"""
+Gộp các lần đọc router giống nhau đang chạy đồng thời thành một lần gọi (single-flight)
+"""
+
+import copy
+import logging
+import functools
+import threading
+
+logger = logging.getLogger('mikrotik_monitor.single_flight')
+
+
+class _Call:
+    """One in-flight call and the threads waiting for it"""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one execution of identical concurrent calls
+
+    The first caller of a key runs the function; callers arriving while it
+    runs wait and get a deep copy of its result (or its exception). The
+    copies are made from a snapshot taken before the first caller gets the
+    result, so changes it makes are never seen by the others. Nothing is
+    cached: a call made after the first one finished runs again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def do(self, key, function, *args, **kwargs):
+        """Run function(*args, **kwargs) unless an identical call is in flight
+
+        Args:
+            key (tuple): Identity of the call; its first item names the operation
+
+        Returns:
+            Result of the function (a copy for callers that joined a running call)
+        """
+        operation = key[0]
+        with self._lock:
+            stats = self._stats.setdefault(operation, {'calls': 0, 'executions': 0, 'shared': 0})
+            stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters and call.error is None:
+                # Không còn ai tham gia thêm; chụp kết quả trước khi người gọi đầu tiên có thể sửa nó
+                try:
+                    call.result = copy.deepcopy(result)
+                except Exception as e:
+                    call.error = e
+                logger.debug(f"Shared {operation} result with {call.waiters} waiting callers")
+            call.done.set()
+        return result
+
+    def stats(self):
+        """Calls, router executions and shared results per operation"""
+        with self._lock:
+            operations = {name: dict(stats) for name, stats in self._stats.items()}
+            in_flight = len(self._calls)
+        calls = sum(stats['calls'] for stats in operations.values())
+        shared = sum(stats['shared'] for stats in operations.values())
+        return {
+            'calls': calls,
+            'executions': sum(stats['executions'] for stats in operations.values()),
+            'shared': shared,
+            'shared_ratio': shared / calls if calls else 0.0,
+            'in_flight': in_flight,
+            'operations': operations
+        }
+
+
+def _freeze(value):
+    """Hashable form of an argument (lists, sets and dicts included)"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(item) for item in value))
+    return value
+
+
+def coalesced(group, enabled=True):
+    """Decorator sharing concurrent calls with the same device and arguments
+
+    The first positional argument must be a Device (identified by its id).
+
+    Args:
+        group (SingleFlight): Group tracking in-flight calls
+        enabled (bool): Set False to call through unchanged
+    """
+    def decorator(function):
+        if not enabled:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(device, *args, **kwargs):
+            key = (function.__name__, device.id, _freeze(args), _freeze(kwargs))
+            return group.do(key, function, device, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,207 @@
+"""
+Kho trạng thái trong bộ nhớ (bảng đẩy từ router, trạng thái poll mới nhất) và event bus
+"""
+
+import copy
+import time
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger('mikrotik_monitor.state')
+
+
+class EventBus:
+    """Synchronous in-process publish/subscribe
+
+    Callbacks run in the publishing thread and must be quick; an exception
+    in one callback is logged and does not affect the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._tokens = itertools.count(1)
+
+    def subscribe(self, callback, table=None, device_id=None):
+        """Register callback(event) for matching events
+
+        Args:
+            callback (callable): Called with the event dictionary
+            table (str, optional): Only events of this table
+            device_id (int, optional): Only events of this device
+
+        Returns:
+            Token for unsubscribe()
+        """
+        with self._lock:
+            token = next(self._tokens)
+            self._subscribers[token] = (callback, table, device_id)
+        return token
+
+    def unsubscribe(self, token):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for callback, table, device_id in subscribers:
+            if table is not None and event.get('table') != table:
+                continue
+            if device_id is not None and event.get('device_id') != device_id:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error in state event subscriber: {e}")
+
+
+class _Table:
+    """Rows of one RouterOS table of one device, keyed by .id"""
+
+    __slots__ = ('rows', 'live', 'updated_at')
+
+    def __init__(self):
+        self.rows = {}
+        self.live = False
+        self.updated_at = None
+
+
+class StateStore:
+    """Current rows of subscribed RouterOS tables per device
+
+    A table is 'live' while its subscription is running; readers should fall
+    back to polling the router when it is not.
+
+    Every change is published on the event bus as a dictionary with
+    'device_id', 'table', 'action' ('reset', 'update', 'delete' or
+    'stale'), 'id', 'row' and 'timestamp'.
+
+    The store also keeps the latest polled view of each device ('metrics',
+    'clients' or an interface traffic kind) with the time it was stored, so
+    live endpoints can answer from memory while that view is fresh enough.
+    """
+
+    def __init__(self, bus=None, clock=time.time):
+        self.bus = bus or EventBus()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._latest = {}
+
+    def replace(self, device_id, table, rows):
+        """Load a full table (initial read of a subscription) and mark it live"""
+        now = self._clock()
+        with self._lock:
+            state = self._tables.setdefault((device_id, table), _Table())
+            state.rows = {row.get('.id', index): dict(row) for index, row in enumerate(rows)}
+            state.live = True
+            state.updated_at = now
+        self._publish(device_id, table, 'reset', None, None, now)
+
+    def apply(self, device_id, table, row):
+        """Apply one pushed change; rows with .dead set are removed"""
+        now = self._clock()
+        row_id = row.get('.id')
+        dead = str(row.get('.dead', '')).lower() in ('true', 'yes')
+
+        with self._lock:
+            state = self._tables.setdefault((device_id, table), _Table())
+            if dead:
+                state.rows.pop(row_id, None)
+                current = None
+            else:
+                current = state.rows.setdefault(row_id, {})
+                # listen chỉ gửi các thuộc tính thay đổi trên một số phiên bản RouterOS
+                current.update(row)
+                current = dict(current)
+            state.updated_at = now
+        self._publish(device_id, table, 'delete' if dead else 'update', row_id, current, now)
+
+    def mark_stale(self, device_id, table):
+        """Flag a table whose subscription stopped; its rows are kept"""
+        with self._lock:
+            state = self._tables.get((device_id, table))
+            if state is None or not state.live:
+                return
+            state.live = False
+        self._publish(device_id, table, 'stale', None, None, self._clock())
+
+    def is_live(self, device_id, *tables):
+        """True if every given table of the device is being kept up to date"""
+        with self._lock:
+            return all(
+                (device_id, table) in self._tables and self._tables[(device_id, table)].live
+                for table in tables
+            )
+
+    def rows(self, device_id, table):
+        """Copy of the current rows of a table, or None if never loaded"""
+        with self._lock:
+            state = self._tables.get((device_id, table))
+            if state is None:
+                return None
+            return [dict(row) for row in state.rows.values()]
+
+    def put_latest(self, device_id, kind, data):
+        """Store the latest view of a device, replacing the previous one
+
+        Args:
+            device_id (int): Device ID
+            kind (str): View name, e.g. 'metrics' or 'clients'
+            data (dict): View as returned by the live API; a copy is kept
+        """
+        data = copy.deepcopy(data)
+        now = self._clock()
+        with self._lock:
+            self._latest[(device_id, kind)] = (now, data)
+
+    def latest(self, device_id, kind, max_age):
+        """Latest view of a device if it was stored at most max_age seconds ago
+
+        Returns:
+            Tuple (copy of the view, age in seconds), or None if missing or too old
+        """
+        with self._lock:
+            entry = self._latest.get((device_id, kind))
+        if entry is None:
+            return None
+        updated_at, data = entry
+        age = max(0.0, self._clock() - updated_at)
+        if age > max_age:
+            return None
+        return copy.deepcopy(data), age
+
+    def forget(self, device_id):
+        """Drop every table and latest view of a device"""
+        with self._lock:
+            for key in [key for key in self._tables if key[0] == device_id]:
+                del self._tables[key]
+            for key in [key for key in self._latest if key[0] == device_id]:
+                del self._latest[key]
+
+    def stats(self):
+        """Number of tables/rows held, how many tables are live and latest views held"""
+        with self._lock:
+            return {
+                'tables': len(self._tables),
+                'live_tables': sum(1 for t in self._tables.values() if t.live),
+                'rows': sum(len(t.rows) for t in self._tables.values()),
+                'devices': len({device_id for device_id, _ in self._tables}),
+                'latest_views': len(self._latest)
+            }
+
+    def _publish(self, device_id, table, action, row_id, row, timestamp):
+        self.bus.publish({
+            'device_id': device_id,
+            'table': table,
+            'action': action,
+            'id': row_id,
+            'row': row,
+            'timestamp': timestamp
+        })
+
+
+# Kho dùng chung cho toàn bộ process
+state_store = StateStore()
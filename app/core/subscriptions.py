@@ -0,0 +1,196 @@
+"""
+Theo dõi thay đổi bảng RouterOS (listen) qua kết nối lâu dài và đẩy vào kho trạng thái
+"""
+
+import asyncio
+import logging
+import threading
+
+from mik.app.config import Config
+from mik.app.core.connection_pool import device_fingerprint
+from mik.app.core.mikrotik import SNAPSHOT_SECTIONS
+from mik.app.core.mikrotik_async import device_client
+from mik.app.core.routeros_protocol import RouterOSError, RouterOSTrapError
+from mik.app.core.routeros_query import TableQuery
+from mik.app.core.state_store import state_store
+
+logger = logging.getLogger('mikrotik_monitor.subscriptions')
+
+
+def _with_id(query, proplist=None):
+    return TableQuery(query.path, ('.id',) + tuple(proplist or query.proplist))
+
+
+# Các bảng ít thay đổi được theo dõi; bộ đếm traffic không phát sự kiện
+# listen nên bảng interface chỉ giữ trạng thái
+SUBSCRIPTION_TABLES = {
+    'interfaces': _with_id(SNAPSHOT_SECTIONS['interfaces'], (
+        'name', 'type', 'disabled', 'running', 'comment', 'actual-mtu')),
+    'wireless': _with_id(SNAPSHOT_SECTIONS['wireless']),
+    'capsman': _with_id(SNAPSHOT_SECTIONS['capsman']),
+    'dhcp': _with_id(SNAPSHOT_SECTIONS['dhcp']),
+}
+
+
+class SubscriptionManager:
+    """Keeps one long-lived API connection per device following its tables
+
+    Runs its own asyncio loop in a background thread. For every table it
+    starts '<path>/listen' first and then reads the full table, so no change
+    is lost between the two; changes are applied to the state store as they
+    arrive. On disconnect the tables are marked stale and the device is
+    retried after retry_interval seconds.
+    """
+
+    def __init__(self, store=None, tables=None, retry_interval=None):
+        self.store = store or state_store
+        self.tables = tables or SUBSCRIPTION_TABLES
+        self.retry_interval = retry_interval or Config.SUBSCRIPTION_RETRY_INTERVAL
+        self._loop = None
+        self._thread = None
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app=None):
+        """Start the background loop
+
+        Args:
+            app (Flask, optional): Application whose context is pushed in the
+                loop thread (needed to decrypt device passwords)
+        """
+        if self.running:
+            return
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            ready.set()
+            if app is not None:
+                with app.app_context():
+                    self._loop.run_forever()
+            else:
+                self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='routeros-subscriptions', daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info("RouterOS subscription manager started")
+
+    def stop(self, timeout=10):
+        """Cancel every subscription and stop the loop"""
+        if not self.running:
+            return
+        asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def sync(self, devices):
+        """Follow exactly the given devices
+
+        New devices are subscribed, removed ones are cancelled and devices
+        whose connection settings changed are restarted.
+        """
+        if not self.running:
+            return
+        wanted = {device.id: (device, device_fingerprint(device)) for device in devices}
+        future = asyncio.run_coroutine_threadsafe(self._sync(wanted), self._loop)
+        future.result(timeout=10)
+
+    def stats(self):
+        """Number of followed devices plus state store counters"""
+        with self._lock:
+            stats = {'subscribed_devices': len(self._tasks), 'running': self.running}
+        stats.update(self.store.stats())
+        return stats
+
+    async def _sync(self, wanted):
+        with self._lock:
+            current = dict(self._tasks)
+
+        for device_id, (task, fingerprint) in current.items():
+            if device_id not in wanted or wanted[device_id][1] != fingerprint:
+                task.cancel()
+                with self._lock:
+                    self._tasks.pop(device_id, None)
+
+        for device_id, (device, fingerprint) in wanted.items():
+            with self._lock:
+                if device_id in self._tasks:
+                    continue
+                task = self._loop.create_task(self._follow_device(device))
+                self._tasks[device_id] = (task, fingerprint)
+
+    async def _cancel_all(self):
+        with self._lock:
+            tasks = [task for task, _ in self._tasks.values()]
+            self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _follow_device(self, device):
+        while True:
+            try:
+                async with device_client(device, command_timeout=Config.MIKROTIK_COMMAND_TIMEOUT) as client:
+                    if client is None:
+                        logger.debug(f"Subscription to device {device.id} not connected, retrying later")
+                    else:
+                        await self._follow_tables(client, device.id)
+            except asyncio.CancelledError:
+                raise
+            except (RouterOSError, OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"Subscription to device {device.name} ({device.ip_address}) lost: {e}")
+            except Exception as e:
+                logger.error(f"Error in subscription to device {device.name}: {e}")
+            finally:
+                for table in self.tables:
+                    self.store.mark_stale(device.id, table)
+
+            await asyncio.sleep(self.retry_interval)
+
+    async def _follow_tables(self, client, device_id):
+        tasks = [
+            asyncio.ensure_future(self._follow_table(client, device_id, table, query))
+            for table, query in self.tables.items()
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _follow_table(self, client, device_id, table, query):
+        # Bắt đầu listen trước khi đọc toàn bộ bảng để không bỏ sót thay đổi
+        stream = await client.stream(f'{query.path}/listen', proplist=query.proplist)
+        try:
+            rows = await query.run_async(client)
+        except RouterOSTrapError as e:
+            # Gói wireless/CAPsMAN chưa cài: bảng được coi là rỗng
+            logger.debug(f"Table {query.path} not available on device {device_id}: {e}")
+            await stream.cancel()
+            self.store.replace(device_id, table, [])
+            return
+
+        self.store.replace(device_id, table, rows)
+        try:
+            async for row in stream:
+                self.store.apply(device_id, table, row)
+        except RouterOSTrapError as e:
+            logger.debug(f"Listen on {query.path} stopped on device {device_id}: {e}")
+            self.store.mark_stale(device_id, table)
+        finally:
+            await stream.cancel()
+
+
+# Trình quản lý dùng chung cho toàn bộ process
+subscription_manager = SubscriptionManager()
@@ -0,0 +1,220 @@
+"""
+Cửa sổ trượt theo thời gian cho rule cảnh báo có duration: trung bình, min, max cập nhật O(1) khấu hao,
+cùng các hàm đọc metric của rule từ mẫu thu thập dùng chung cho cảnh báo và poll thích ứng
+"""
+
+import logging
+import operator
+import threading
+from collections import deque
+
+logger = logging.getLogger('mikrotik_monitor.windows')
+
+# Điều kiện so sánh của rule cảnh báo
+CONDITIONS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+}
+
+# Hàm tổng hợp được ghi trước tên metric của rule, ví dụ 'max:cpu_load'; mặc định là avg
+AGGREGATES = ('avg', 'min', 'max')
+
+
+def parse_rule_metric(metric):
+    """Split an alert rule metric into (aggregate, metric)
+
+    'max:cpu_load' -> ('max', 'cpu_load'); without a known prefix the
+    aggregate is 'avg', as documented for AlertRule.duration.
+    """
+    aggregate, separator, name = metric.partition(':')
+    if separator and aggregate in AGGREGATES and name:
+        return aggregate, name
+    return 'avg', metric
+
+
+def sample_value(sample, metric):
+    """Value of a metric in a collected sample
+
+    Accepts both 'type.name' style keys and the flat alert rule names
+    ('cpu_load', 'memory_usage', ...), whose first '_' separates the type.
+
+    Returns:
+        Number, or None if the sample does not contain the metric
+    """
+    for separator in ('.', '_'):
+        metric_type, _, metric_name = metric.partition(separator)
+        group = sample.get(metric_type)
+        if isinstance(group, dict) and metric_name in group:
+            value = group[metric_name]
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+    return None
+
+
+def metric_candidates(metric):
+    """(metric_type, metric_name) pairs a rule metric can be stored as, in sample_value() order"""
+    candidates = []
+    for separator in ('.', '_'):
+        metric_type, _, metric_name = metric.partition(separator)
+        if metric_type and metric_name and (metric_type, metric_name) not in candidates:
+            candidates.append((metric_type, metric_name))
+    return candidates
+
+
+class SlidingWindow:
+    """Values of one series over the last 'duration' seconds
+
+    Keeps a running sum and count for the average and monotonic deques for
+    the minimum and maximum, so push() and the aggregates are O(1)
+    amortized. At most max_points values are kept; beyond that the oldest
+    are dropped and the window covers less than 'duration'.
+    """
+
+    __slots__ = ('duration', 'max_points', 'points', 'total', 'minimums', 'maximums', 'first', 'next', 'since')
+
+    def __init__(self, duration, max_points=1440):
+        self.duration = duration
+        self.max_points = max_points
+        self.points = deque()
+        self.total = 0.0
+        # Deque đơn điệu chứa (số thứ tự, giá trị); số thứ tự phân biệt các điểm cùng thời điểm
+        self.minimums = deque()
+        self.maximums = deque()
+        self.first = 0
+        self.next = 0
+        # Thời điểm bắt đầu dữ liệu liên tục trong cửa sổ
+        self.since = None
+
+    def push(self, timestamp, value):
+        """Add a value observed at timestamp (epoch seconds, non-decreasing)"""
+        self.evict(timestamp)
+        if not self.points:
+            self.since = timestamp
+            self.total = 0.0
+        while len(self.points) >= self.max_points:
+            self._pop_oldest()
+
+        self.points.append((timestamp, value))
+        self.total += value
+        while self.minimums and self.minimums[-1][1] >= value:
+            self.minimums.pop()
+        self.minimums.append((self.next, value))
+        while self.maximums and self.maximums[-1][1] <= value:
+            self.maximums.pop()
+        self.maximums.append((self.next, value))
+        self.next += 1
+
+    def evict(self, now):
+        """Drop values older than now - duration"""
+        cutoff = now - self.duration
+        while self.points and self.points[0][0] <= cutoff:
+            self._pop_oldest()
+
+    def _pop_oldest(self):
+        _, value = self.points.popleft()
+        self.total -= value
+        if self.minimums[0][0] == self.first:
+            self.minimums.popleft()
+        if self.maximums[0][0] == self.first:
+            self.maximums.popleft()
+        self.first += 1
+
+    def ready(self, now):
+        """True once the window holds data spanning the whole duration"""
+        return bool(self.points) and now - self.since >= self.duration
+
+    def aggregate(self, name):
+        """'avg', 'min' or 'max' of the values in the window, None if empty"""
+        if not self.points:
+            return None
+        if name == 'min':
+            return self.minimums[0][1]
+        if name == 'max':
+            return self.maximums[0][1]
+        return self.total / len(self.points)
+
+
+class WindowStore:
+    """Sliding windows per (device_id, metric, duration), shared by the rules using them
+
+    Rules with the same series and duration but different aggregates or
+    thresholds read the same window. retain() drops the windows no rule
+    uses any more, so memory is bounded by the rules times max_points.
+    """
+
+    def __init__(self, max_points=1440):
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._stats = {'pushes': 0, 'recovered_windows': 0, 'recovered_points': 0}
+
+    def push(self, device_id, metric, duration, timestamp, value):
+        with self._lock:
+            window = self._windows.get((device_id, metric, duration))
+            if window is None:
+                window = self._windows[(device_id, metric, duration)] = SlidingWindow(duration, self.max_points)
+            window.push(timestamp, value)
+            self._stats['pushes'] += 1
+
+    def aggregate(self, device_id, metric, duration, name, now):
+        """Aggregate over the window, or None until it spans the whole duration"""
+        with self._lock:
+            window = self._windows.get((device_id, metric, duration))
+            if window is None:
+                return None
+            window.evict(now)
+            if not window.ready(now):
+                return None
+            return window.aggregate(name)
+
+    def has(self, device_id, metric, duration):
+        with self._lock:
+            return (device_id, metric, duration) in self._windows
+
+    def recover(self, device_id, metric, duration, points, now):
+        """Rebuild a window from stored samples (e.g. after a restart)
+
+        The points are pushed as if they had just been collected, so the
+        window is ready only once they span the whole duration: pass
+        samples from somewhat before now - duration to recover a ready
+        window. The window is installed even without points so the same
+        key is not queried again, but never replaces a window that
+        samples created meanwhile.
+
+        Args:
+            points (iterable): (timestamp, value) pairs, epoch seconds
+            now (float): Current time (epoch seconds)
+
+        Returns:
+            Number of points loaded (0 if the window already existed)
+        """
+        window = SlidingWindow(duration, self.max_points)
+        for timestamp, value in sorted(points):
+            if timestamp <= now:
+                window.push(timestamp, value)
+        window.evict(now)
+        count = len(window.points)
+        with self._lock:
+            if self._windows.setdefault((device_id, metric, duration), window) is not window:
+                return 0
+            if count:
+                self._stats['recovered_windows'] += 1
+                self._stats['recovered_points'] += count
+        return count
+
+    def retain(self, keys):
+        """Drop the windows whose (device_id, metric, duration) key is not in keys"""
+        keys = set(keys)
+        with self._lock:
+            for key in [key for key in self._windows if key not in keys]:
+                del self._windows[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['windows'] = len(self._windows)
+            stats['points'] = sum(len(window.points) for window in self._windows.values())
+        return stats
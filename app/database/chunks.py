@@ -0,0 +1,288 @@
+"""
+Lưu metrics dạng chunk nén theo từng chuỗi (Gorilla), mỗi chunk phủ một khoảng thời gian cố định
+"""
+
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from mik.app import db
+from mik.app.config import Config
+from mik.app.database.models import MetricChunk
+from mik.app.utils import gorilla
+
+logger = logging.getLogger('mikrotik_monitor.chunks')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(timestamp):
+    """Naive UTC datetime -> integer epoch seconds"""
+    return int((timestamp - _EPOCH).total_seconds())
+
+
+def from_epoch(seconds):
+    return _EPOCH + timedelta(seconds=int(seconds))
+
+
+class _OpenChunk:
+    """Points of a chunk still being written by this process"""
+
+    __slots__ = ('timestamps', 'values', 'row_id', 'loaded', 'dirty')
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.values = array('d')
+        self.row_id = None
+        self.loaded = False
+        self.dirty = False
+
+
+class MetricChunkStore:
+    """Metric series stored as Gorilla-compressed chunks
+
+    Each (device, metric_type, metric_name) series is cut into chunks of
+    chunk_seconds; a chunk is one row whose BLOB holds delta-of-delta
+    timestamps (second precision) and XOR-compressed values. Points are
+    appended in memory and written by flush(); the first flush of a chunk
+    merges the points already stored for it (restart, shard handoff).
+    Chunks that ended more than one flush ago are dropped from memory.
+
+    Points not flushed yet are lost if the process dies, as with the
+    write-behind buffer.
+    """
+
+    def __init__(self, chunk_seconds=None):
+        """
+        Args:
+            chunk_seconds (int, optional): Time span of a chunk.
+                Default Config.CHUNK_SECONDS.
+        """
+        self.chunk_seconds = chunk_seconds or Config.CHUNK_SECONDS
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._open = {}
+        self._stats = {'points': 0, 'flushes': 0, 'chunks_written': 0, 'bytes_written': 0, 'errors': 0}
+
+    def chunk_start(self, seconds):
+        return seconds - seconds % self.chunk_seconds
+
+    def append(self, rows):
+        """Add metric rows (see crud.metric_rows) to their open chunks"""
+        with self._lock:
+            for row in rows:
+                seconds = to_epoch(row['timestamp'])
+                key = (row['device_id'], row['metric_type'], row['metric_name'], self.chunk_start(seconds))
+                chunk = self._open.get(key)
+                if chunk is None:
+                    chunk = self._open[key] = _OpenChunk()
+                chunk.timestamps.append(seconds)
+                chunk.values.append(row['value'])
+                chunk.dirty = True
+            self._stats['points'] += len(rows)
+
+    def flush(self, now=None):
+        """Write every chunk that received points (application context)
+
+        Returns:
+            Number of chunks written
+        """
+        with self._flush_lock:
+            with self._lock:
+                dirty = [(key, chunk) for key, chunk in self._open.items() if chunk.dirty]
+                snapshots = {}
+                for key, chunk in dirty:
+                    snapshots[key] = (array('q', chunk.timestamps), array('d', chunk.values))
+                    chunk.dirty = False
+
+            written = 0
+            try:
+                for key, chunk in dirty:
+                    written += self._write(key, chunk, *snapshots[key])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self._stats['errors'] += 1
+                    for key, chunk in dirty:
+                        chunk.dirty = True
+                        chunk.row_id = None
+                        chunk.loaded = False
+                logger.error(f"Error writing metric chunks: {e}")
+                return 0
+
+            # Bỏ khỏi bộ nhớ các chunk đã kết thúc và đã được ghi
+            horizon = to_epoch(now or datetime.utcnow()) - self.chunk_seconds
+            with self._lock:
+                for key in [key for key, chunk in self._open.items()
+                            if not chunk.dirty and key[3] + self.chunk_seconds <= horizon]:
+                    del self._open[key]
+                self._stats['flushes'] += 1
+                self._stats['chunks_written'] += written
+            return written
+
+    def _write(self, key, chunk, timestamps, values):
+        device_id, metric_type, metric_name, start = key
+        if not chunk.loaded:
+            # Lần đầu process này ghi chunk: gộp các điểm đã có trong database
+            existing = MetricChunk.query.filter_by(
+                device_id=device_id, metric_type=metric_type, metric_name=metric_name, start=from_epoch(start)
+            ).first()
+            if existing is not None:
+                stored_timestamps, stored_values = array('q'), array('d')
+                gorilla.decode_into(existing.data, stored_timestamps, stored_values)
+                with self._lock:
+                    known = set(chunk.timestamps)
+                    points = [(t, v) for t, v in zip(stored_timestamps, stored_values) if t not in known]
+                    if points:
+                        merged = sorted(points + list(zip(chunk.timestamps, chunk.values)))
+                        chunk.timestamps = array('q', (t for t, _ in merged))
+                        chunk.values = array('d', (v for _, v in merged))
+                    timestamps, values = array('q', chunk.timestamps), array('d', chunk.values)
+                chunk.row_id = existing.id
+            chunk.loaded = True
+
+        if any(timestamps[i] > timestamps[i + 1] for i in range(len(timestamps) - 1)):
+            order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+            timestamps = array('q', (timestamps[i] for i in order))
+            values = array('d', (values[i] for i in order))
+
+        data = gorilla.encode(timestamps, values)
+        fields = {
+            'first_at': from_epoch(timestamps[0]),
+            'last_at': from_epoch(timestamps[-1]),
+            'count': len(timestamps),
+            'data': data
+        }
+        if chunk.row_id is None:
+            row = MetricChunk(device_id=device_id, metric_type=metric_type, metric_name=metric_name,
+                              start=from_epoch(start), **fields)
+            db.session.add(row)
+            db.session.flush()
+            chunk.row_id = row.id
+        else:
+            MetricChunk.query.filter_by(id=chunk.row_id).update(fields, synchronize_session=False)
+
+        with self._lock:
+            self._stats['bytes_written'] += len(data)
+        return 1
+
+    def arrays(self, device_id, metric_type, metric_name, start_time=None, end_time=None):
+        """Points of one series in a time range, oldest first
+
+        Chunks are decoded straight into typed buffers; with NumPy the
+        result is (int64 epoch seconds, float64 values) arrays.
+        """
+        timestamps, values = array('q'), array('d')
+        for seconds, value in self._points(device_id, metric_type, metric_name, start_time, end_time):
+            timestamps.append(seconds)
+            values.append(value)
+        return gorilla.as_arrays(timestamps, values)
+
+    def _chunks(self, device_id, metric_type=None, metric_name=None, start_time=None, end_time=None):
+        """Stored and in-memory chunks as {(type, name, start): (timestamps, values)}"""
+        columns = MetricChunk.__table__.c
+        query = select(columns.metric_type, columns.metric_name, columns.start, columns.data).where(
+            columns.device_id == device_id)
+        if metric_type:
+            query = query.where(columns.metric_type == metric_type)
+        if metric_name:
+            query = query.where(columns.metric_name == metric_name)
+        if start_time:
+            query = query.where(columns.start > start_time - timedelta(seconds=self.chunk_seconds))
+        if end_time:
+            query = query.where(columns.start <= end_time)
+
+        chunks = {}
+        for row in db.session.execute(query):
+            timestamps, values = array('q'), array('d')
+            gorilla.decode_into(row.data, timestamps, values)
+            chunks[(row.metric_type, row.metric_name, to_epoch(row.start))] = (timestamps, values)
+
+        # Điểm chưa flush của process này mới hơn bản trong database
+        with self._lock:
+            for (chunk_device, chunk_type, chunk_name, start), chunk in self._open.items():
+                if chunk_device != device_id or (metric_type and chunk_type != metric_type) \
+                        or (metric_name and chunk_name != metric_name):
+                    continue
+                stored = chunks.get((chunk_type, chunk_name, start))
+                points = dict(zip(*stored)) if stored else {}
+                points.update(zip(chunk.timestamps, chunk.values))
+                ordered = sorted(points.items())
+                chunks[(chunk_type, chunk_name, start)] = (
+                    array('q', (t for t, _ in ordered)), array('d', (v for _, v in ordered)))
+        return chunks
+
+    def _points(self, device_id, metric_type, metric_name, start_time=None, end_time=None):
+        low = to_epoch(start_time) if start_time else None
+        high = to_epoch(end_time) if end_time else None
+        chunks = self._chunks(device_id, metric_type, metric_name, start_time, end_time)
+        for key in sorted(chunks, key=lambda key: key[2]):
+            timestamps, values = chunks[key]
+            for seconds, value in zip(timestamps, values):
+                if (low is None or seconds >= low) and (high is None or seconds <= high):
+                    yield seconds, value
+
+    def query(self, device_id, metric_type=None, metric_name=None, start_time=None, end_time=None, limit=100):
+        """Points of a device in the shape of Metric.to_dict(), newest first"""
+        low = to_epoch(start_time) if start_time else None
+        high = to_epoch(end_time) if end_time else None
+        points = []
+        for (series_type, series_name, _), (timestamps, values) in self._chunks(
+                device_id, metric_type, metric_name, start_time, end_time).items():
+            for seconds, value in zip(timestamps, values):
+                if (low is None or seconds >= low) and (high is None or seconds <= high):
+                    points.append((seconds, series_type, series_name, value))
+        points.sort(key=lambda point: point[0], reverse=True)
+        if limit:
+            points = points[:limit]
+        return [
+            {
+                'id': None,
+                'device_id': device_id,
+                'metric_type': series_type,
+                'metric_name': series_name,
+                'value': value,
+                'timestamp': from_epoch(seconds).isoformat()
+            }
+            for seconds, series_type, series_name, value in points
+        ]
+
+    def prune(self, cutoff):
+        """Delete chunks that ended before cutoff; the caller commits"""
+        return MetricChunk.query.filter(
+            MetricChunk.start <= cutoff - timedelta(seconds=self.chunk_seconds)
+        ).delete(synchronize_session=False)
+
+    def delete_device(self, device_id):
+        """Delete stored and in-memory chunks of a device; the caller commits"""
+        with self._lock:
+            for key in [key for key in self._open if key[0] == device_id]:
+                del self._open[key]
+        return MetricChunk.query.filter_by(device_id=device_id).delete(synchronize_session=False)
+
+    def stats(self):
+        """Open chunks and write counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open_chunks'] = len(self._open)
+            stats['pending_chunks'] = sum(1 for chunk in self._open.values() if chunk.dirty)
+        stats['chunk_seconds'] = self.chunk_seconds
+        stats['numpy'] = gorilla.np is not None
+        return stats
+
+
+_store = None
+
+
+def metric_chunks():
+    """Shared MetricChunkStore, or None when rows are stored one per value"""
+    global _store
+    if Config.METRICS_STORAGE != 'chunks':
+        return None
+    if _store is None:
+        _store = MetricChunkStore()
+    return _store
@@ -5,14 +5,19 @@ Các thao tác CRUD (Create, Read, Update, Delete) cho database
 import time
 import logging
 import functools
-from datetime import datetime
+from datetime import datetime, timedelta
 from contextlib import contextmanager
 
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
 from mik.app import db
-from mik.app.database.models import User, Device, Metric, AlertRule, Alert, Setting
-from mik.app.utils.security import hash_password, encrypt_device_password
+from mik.app.config import Config
+from mik.app.database.models import User, Device, Metric, MetricPoint, AlertRule, Alert, Setting, CollectorNode, ShardLease
+from mik.app.database.partitions import metric_partitions, query_tables
+from mik.app.database.series import series_catalog
+from mik.app.database.chunks import metric_chunks
+from mik.app.utils.security import hash_password, encrypt_device_password, forget_device_password
 
 logger = logging.getLogger('mikrotik_monitor.crud')
 
@@ -250,6 +255,11 @@ def get_all_devices():
     devices = Device.query.order_by(Device.name).all()
     return [device.to_dict() for device in devices]
 
+@track_db_performance
+def get_devices_for_polling():
+    """Get all Device objects (with connection parameters) for collectors"""
+    return Device.query.order_by(Device.id).all()
+
 @track_db_performance
 def get_device_by_id(device_id):
     """Get a device by ID"""
@@ -297,6 +307,7 @@ def update_device(device_id, name=None, ip_address=None, username=None, password
         device.username = username
     
     if password:
+        forget_device_password(device.password_hash)
         device.password_hash = encrypt_device_password(password)
     
     if api_port is not None:
@@ -319,6 +330,10 @@ def update_device(device_id, name=None, ip_address=None, username=None, password
     with session_manager():
         db.session.add(device)
     
+    # Đóng các phiên API đang giữ trong pool với thông tin đăng nhập cũ
+    from mik.app.core.mikrotik import invalidate_device_connections
+    invalidate_device_connections(device_id)
+    
     logger.info(f"Device updated: {device.name} (ID: {device_id})")
     return device
 
@@ -330,10 +345,30 @@ def delete_device(device_id):
         return False
     
     device_name = device.name  # Save for logging
+    forget_device_password(device.password_hash)
     
     with session_manager():
+        series_ids = list(series_catalog.find(device_id))
+        partitions = metric_partitions()
+        if partitions:
+            # Các bảng phân vùng không có quan hệ cascade với devices
+            partitions.delete_device(device_id, series_ids)
+        if series_ids:
+            MetricPoint.query.filter(MetricPoint.series_id.in_(series_ids)).delete(synchronize_session=False)
+        series_catalog.delete_device(device_id)
+        chunks = metric_chunks()
+        if chunks:
+            chunks.delete_device(device_id)
         db.session.delete(device)
     
+    from mik.app.core.mikrotik import invalidate_device_connections, interface_rates
+    from mik.app.core.state_store import state_store
+    from mik.app.core.adaptive import adaptive_polling
+    invalidate_device_connections(device_id)
+    interface_rates.forget(device_id)
+    state_store.forget(device_id)
+    adaptive_polling.forget(device_id)
+    
     logger.info(f"Device deleted: {device_name} (ID: {device_id})")
     return True
 
@@ -344,31 +379,108 @@ def get_devices_count():
 
 # Metrics CRUD operations
 
-@track_db_performance
-def save_device_metrics(device_id, metrics_data):
-    """Save device metrics to database"""
-    metrics_objects = []
+def metric_rows(device_id, metrics_data, timestamp=None):
+    """Flatten a collected sample into metrics table rows
+    
+    Args:
+        device_id (int): Device ID
+        metrics_data (dict): {metric_type: {metric_name: value}}; non-numeric
+            values and non-dictionary fields (status, timestamp, ...) are skipped
+        timestamp (datetime, optional): Time of the sample, default now (UTC)
+        
+    Returns:
+        List of dictionaries with the Metric columns
+    """
+    timestamp = timestamp or datetime.utcnow()
+    rows = []
     
     for metric_type, metrics in metrics_data.items():
+        # Bỏ qua các trường không phải nhóm metric (status, timestamp, ...)
+        if not isinstance(metrics, dict):
+            continue
+        
         for metric_name, value in metrics.items():
-            metric = Metric(
-                device_id=device_id,
-                metric_type=metric_type,
-                metric_name=metric_name,
-                value=float(value),
-                timestamp=datetime.utcnow()
-            )
-            metrics_objects.append(metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            
+            rows.append({
+                'device_id': device_id,
+                'metric_type': metric_type,
+                'metric_name': metric_name,
+                'value': float(value),
+                'timestamp': timestamp
+            })
+    
+    return rows
+
+def insert_metric_rows(rows):
+    """Insert metric rows with one executemany per target table
+    
+    Rows go to their time partitions when partitioning is enabled, else to
+    the metrics table. With METRICS_STORAGE=series they are first turned
+    into (series_id, value, timestamp) rows through the series catalog.
+    Runs in the current session; the caller commits.
+    """
+    series = Config.METRICS_STORAGE == 'series'
+    if series:
+        rows = series_catalog.points(rows)
+    
+    partitions = metric_partitions()
+    if partitions:
+        return partitions.insert(rows)
+    
+    table = MetricPoint.__table__ if series else Metric.__table__
+    db.session.execute(table.insert(), rows)
+    return len(rows)
+
+@track_db_performance
+def save_device_metrics(device_id, metrics_data, timestamp=None):
+    """Save device metrics to database"""
+    rows = metric_rows(device_id, metrics_data, timestamp)
     
     with session_manager():
-        db.session.add_all(metrics_objects)
+        if metric_partitions() or Config.METRICS_STORAGE == 'series':
+            insert_metric_rows(rows)
+        else:
+            db.session.add_all([Metric(**row) for row in rows])
     
-    logger.debug(f"Saved {len(metrics_objects)} metrics for device ID {device_id}")
-    return len(metrics_objects)
+    logger.debug(f"Saved {len(rows)} metrics for device ID {device_id}")
+    return len(rows)
 
 @track_db_performance
 def get_metrics_for_device(device_id, metric_type=None, metric_name=None, start_time=None, end_time=None, limit=100):
     """Get metrics for a device with optional filters"""
+    chunks = metric_chunks()
+    if chunks:
+        # Giải nén các chunk giao với khoảng thời gian (kể cả điểm chưa ghi xuống)
+        results = chunks.query(device_id, metric_type, metric_name, start_time, end_time, limit)
+        if limit and len(results) >= limit:
+            return results
+        # Lịch sử ghi trước khi bật chunks nằm trong các bảng dòng: đọc sau cùng, chỉ phần cũ hơn
+        # điểm chunk cũ nhất, như các bảng cũ của phân vùng và series
+        if results:
+            end_time = datetime.fromisoformat(results[-1]['timestamp']) - timedelta(microseconds=1)
+        remaining = limit - len(results) if limit else None
+        series = series_catalog.find(device_id, metric_type, metric_name)
+        partitions = metric_partitions()
+        if partitions:
+            return results + partitions.query(device_id, metric_type, metric_name, start_time, end_time,
+                                              remaining, series)
+        return results + query_tables([MetricPoint.__table__, Metric.__table__], device_id, metric_type,
+                                      metric_name, start_time, end_time, remaining, series)
+    
+    partitions = metric_partitions()
+    if partitions:
+        # Đọc lần lượt các phân vùng trong khoảng thời gian, mới nhất trước
+        series = series_catalog.find(device_id, metric_type, metric_name)
+        return partitions.query(device_id, metric_type, metric_name, start_time, end_time, limit, series)
+    
+    if Config.METRICS_STORAGE == 'series':
+        # Một điều kiện series_id IN (...) thay cho so khớp chuỗi; bảng metrics cũ đọc sau cùng
+        series = series_catalog.find(device_id, metric_type, metric_name)
+        return query_tables([MetricPoint.__table__, Metric.__table__], device_id, metric_type, metric_name,
+                            start_time, end_time, limit, series)
+    
     query = Metric.query.filter_by(device_id=device_id)
     
     if metric_type:
@@ -404,6 +516,20 @@ def get_all_alert_rules(enabled_only=False):
     rules = query.order_by(AlertRule.name).all()
     return [rule.to_dict() for rule in rules]
 
+@track_db_performance
+def get_alert_rule_changes(since):
+    """Get alert rules changed since a time and the IDs of all enabled rules
+    
+    Args:
+        since (datetime): Rules created or updated at or after this time are returned
+        
+    Returns:
+        Tuple (list of changed rule dictionaries, enabled or not; set of enabled rule IDs)
+    """
+    changed = AlertRule.query.filter(AlertRule.updated_at >= since).all()
+    enabled_ids = {row.id for row in db.session.query(AlertRule.id).filter_by(enabled=True)}
+    return [rule.to_dict() for rule in changed], enabled_ids
+
 @track_db_performance
 def get_alert_rules():
     """Get all alert rules"""
@@ -588,4 +714,123 @@ def update_settings(settings_dict):
             updated_count += 1
     
     logger.info(f"Updated {updated_count} settings")
-    return updated_count
\ No newline at end of file
+    return updated_count
+
+# Collector shard lease operations
+
+@track_db_performance
+def heartbeat_collector_node(node_id, hostname=None, pid=None):
+    """Register a collector node or refresh its heartbeat"""
+    now = datetime.utcnow()
+    node = CollectorNode.query.get(node_id)
+    
+    with session_manager():
+        if node:
+            node.heartbeat_at = now
+        else:
+            node = CollectorNode(node_id=node_id, hostname=hostname, pid=pid, started_at=now, heartbeat_at=now)
+            db.session.add(node)
+    
+    return node
+
+@track_db_performance
+def get_live_collector_nodes(ttl):
+    """Get IDs of collector nodes whose heartbeat is younger than ttl seconds"""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    nodes = CollectorNode.query.filter(CollectorNode.heartbeat_at >= cutoff).order_by(CollectorNode.node_id).all()
+    return [node.node_id for node in nodes]
+
+@track_db_performance
+def get_collector_nodes():
+    """Get all registered collector nodes"""
+    nodes = CollectorNode.query.order_by(CollectorNode.node_id).all()
+    return [node.to_dict() for node in nodes]
+
+@track_db_performance
+def purge_collector_nodes(older_than):
+    """Delete nodes without a heartbeat for older_than seconds"""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    
+    with session_manager():
+        deleted = CollectorNode.query.filter(CollectorNode.heartbeat_at < cutoff).delete(synchronize_session=False)
+    
+    return deleted
+
+@track_db_performance
+def remove_collector_node(node_id):
+    """Unregister a node and release all of its shard leases"""
+    with session_manager():
+        ShardLease.query.filter_by(owner=node_id).update(
+            {'owner': None, 'expires_at': None}, synchronize_session=False)
+        CollectorNode.query.filter_by(node_id=node_id).delete(synchronize_session=False)
+    
+    logger.info(f"Collector node removed: {node_id}")
+
+@track_db_performance
+def ensure_shard_leases(shard_count):
+    """Create the lease rows of shards 0..shard_count-1 that do not exist yet"""
+    existing = {shard for (shard,) in db.session.query(ShardLease.shard).all()}
+    missing = [shard for shard in range(shard_count) if shard not in existing]
+    if not missing:
+        return 0
+    
+    try:
+        with session_manager():
+            db.session.add_all([ShardLease(shard=shard) for shard in missing])
+    except IntegrityError:
+        # Một node khác vừa tạo cùng các dòng này
+        return 0
+    
+    return len(missing)
+
+@track_db_performance
+def acquire_shard_leases(node_id, shards, ttl):
+    """Renew or take the leases of the given shards
+    
+    A lease is taken only if it is free, expired or already held by the
+    node; the check and the update are one conditional UPDATE so two nodes
+    can never both win the same shard.
+    
+    Returns:
+        Set of shards now held by the node
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    acquired = set()
+    
+    with session_manager():
+        for shard in shards:
+            renewed = ShardLease.query.filter_by(shard=shard, owner=node_id).update(
+                {'expires_at': expires_at}, synchronize_session=False)
+            if renewed:
+                acquired.add(shard)
+                continue
+            
+            taken = ShardLease.query.filter(
+                ShardLease.shard == shard,
+                or_(ShardLease.owner.is_(None), ShardLease.expires_at < now)
+            ).update({'owner': node_id, 'acquired_at': now, 'expires_at': expires_at}, synchronize_session=False)
+            if taken:
+                acquired.add(shard)
+    
+    return acquired
+
+@track_db_performance
+def release_shard_leases(node_id, shards):
+    """Give up the leases of the given shards held by the node"""
+    if not shards:
+        return 0
+    
+    with session_manager():
+        released = ShardLease.query.filter(
+            ShardLease.shard.in_(list(shards)),
+            ShardLease.owner == node_id
+        ).update({'owner': None, 'expires_at': None}, synchronize_session=False)
+    
+    return released
+
+@track_db_performance
+def get_shard_leases():
+    """Get all shard leases"""
+    leases = ShardLease.query.order_by(ShardLease.shard).all()
+    return [lease.to_dict() for lease in leases]
\ No newline at end of file
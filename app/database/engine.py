@@ -0,0 +1,194 @@
+"""
+Cấu hình engine SQLite cho tải đồng thời: pragma hiệu năng khi kết nối và cổng ghi tuần tự trong process
+"""
+
+import time
+import logging
+import weakref
+import threading
+from collections import deque
+
+from sqlalchemy import event
+
+logger = logging.getLogger('mikrotik_monitor.engine')
+
+# Câu lệnh bắt đầu bằng các từ khoá này sẽ ghi vào database
+_WRITE_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+_GATE_KEY = 'mikrotik_write_gate'
+
+# Engine đã được cấu hình (mỗi engine chỉ đăng ký listener một lần)
+_configured = weakref.WeakSet()
+
+
+def sqlite_pragmas(config):
+    """PRAGMA statements of the SQLite performance profile
+
+    Args:
+        config (Mapping): Flask config or Config attributes as a dict
+
+    Returns:
+        List of (name, value) tuples, in the order they are applied
+    """
+    journal_mode = str(config.get('SQLITE_JOURNAL_MODE', 'WAL')).upper()
+    synchronous = str(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    for value in (journal_mode, synchronous):
+        if not value.isalpha():
+            raise ValueError(f"Invalid SQLite pragma value: {value}")
+    return [
+        ('journal_mode', journal_mode),
+        ('synchronous', synchronous),
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT', 30000))),
+        ('cache_size', int(config.get('SQLITE_CACHE_SIZE', -65536))),
+        ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 268435456))),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+class WriteGate:
+    """FIFO gate letting one connection of the process write at a time
+
+    SQLite allows a single writer. When several threads write at once the
+    losers spin in SQLite's busy handler (sleeping with backoff) and fail
+    with 'database is locked' once busy_timeout expires. The gate queues
+    writers in arrival order instead: a connection takes it at the first
+    write statement of its transaction and gives it back when commit or
+    rollback starts, i.e. while SQLite holds the write lock (the commit
+    itself is short in WAL mode and covered by busy_timeout). Reads never
+    take the gate and, in WAL mode, never wait for the writer.
+
+    The gate is re-entrant per thread so a thread that opens a second
+    connection cannot deadlock on itself.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._owner = None
+        self._depth = 0
+        self._acquired_at = None
+        self._stats = {'writes': 0, 'waited': 0, 'total_wait': 0.0, 'max_wait': 0.0,
+                       'total_hold': 0.0, 'max_hold': 0.0, 'max_queue': 0}
+
+    def acquire(self):
+        thread = threading.get_ident()
+        with self._cond:
+            if self._owner == thread:
+                self._depth += 1
+                return
+            started = self._clock()
+            ticket = object()
+            self._queue.append(ticket)
+            self._stats['max_queue'] = max(self._stats['max_queue'], len(self._queue))
+            while self._owner is not None or self._queue[0] is not ticket:
+                self._cond.wait()
+            self._queue.popleft()
+            self._owner, self._depth = thread, 1
+            self._acquired_at = self._clock()
+            waited = self._acquired_at - started
+            self._stats['writes'] += 1
+            if waited > 0.001:
+                self._stats['waited'] += 1
+            self._stats['total_wait'] += waited
+            self._stats['max_wait'] = max(self._stats['max_wait'], waited)
+
+    def release(self):
+        # Có thể được gọi từ luồng khác (pool reset), nên không kiểm tra chủ sở hữu
+        with self._cond:
+            if self._owner is None:
+                return
+            self._depth -= 1
+            if self._depth:
+                return
+            held = self._clock() - self._acquired_at
+            self._stats['total_hold'] += held
+            self._stats['max_hold'] = max(self._stats['max_hold'], held)
+            self._owner = None
+            self._cond.notify_all()
+
+    def stats(self):
+        """Write transactions, queueing and hold times"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queue'] = len(self._queue)
+            stats['busy'] = self._owner is not None
+        writes = stats['writes']
+        stats['avg_wait'] = stats.pop('total_wait') / writes if writes else 0.0
+        stats['avg_hold'] = stats.pop('total_hold') / writes if writes else 0.0
+        return stats
+
+
+# Cổng ghi dùng chung cho mọi engine SQLite của process
+write_gate = WriteGate()
+
+
+def _is_write(statement):
+    return statement.lstrip()[:7].upper().startswith(_WRITE_KEYWORDS)
+
+
+def configure_engine(engine, config, gate=None):
+    """Apply the SQLite profile to an engine (no-op for other databases)
+
+    Registers connect-time PRAGMAs and, unless SQLITE_WRITE_GATE is off,
+    the serialized write gate.
+
+    Args:
+        engine: SQLAlchemy engine
+        config (Mapping): Flask config or Config attributes as a dict
+        gate (WriteGate, optional): Gate to use. Default the shared write_gate.
+
+    Returns:
+        True if the engine is SQLite and was configured
+    """
+    if engine.dialect.name != 'sqlite' or engine in _configured or not config.get('SQLITE_TUNING', True):
+        return False
+    _configured.add(engine)
+
+    pragmas = sqlite_pragmas(config)
+    memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                if name in ('journal_mode', 'mmap_size') and memory:
+                    continue
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+    if not config.get('SQLITE_WRITE_GATE', True):
+        return True
+    gate = gate or write_gate
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def enter_gate(connection, cursor, statement, parameters, context, executemany):
+        if _is_write(statement) and not connection.info.get(_GATE_KEY):
+            gate.acquire()
+            connection.info[_GATE_KEY] = True
+
+    def leave_gate(info):
+        if info.pop(_GATE_KEY, None):
+            gate.release()
+
+    @event.listens_for(engine, 'commit')
+    def on_commit(connection):
+        leave_gate(connection.info)
+
+    @event.listens_for(engine, 'rollback')
+    def on_rollback(connection):
+        leave_gate(connection.info)
+
+    # Kết nối trả về pool mà không commit/rollback tường minh
+    @event.listens_for(engine.pool, 'reset')
+    def on_reset(dbapi_connection, connection_record, reset_state):
+        leave_gate(connection_record.info)
+
+    return True
+
+
+def get_write_gate_stats():
+    """Get SQLite write gate statistics"""
+    return write_gate.stats()
@@ -0,0 +1,240 @@
+"""
+Ghi metrics theo lô (write-behind): gom mẫu từ mọi worker thu thập và ghi bằng một luồng riêng
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+from mik.app import db
+from mik.app.config import Config
+from mik.app.database.crud import metric_rows, insert_metric_rows
+
+logger = logging.getLogger('mikrotik_monitor.ingest')
+
+
+class MetricBuffer:
+    """Write-behind buffer for metric rows
+
+    Collector workers only append rows to an in-memory queue. A dedicated
+    writer thread flushes the queue when batch_size rows are pending or
+    the oldest pending row is flush_interval seconds old, with one Core
+    INSERT executed as executemany per table and one commit per batch.
+
+    When max_pending rows are already queued new rows are dropped (and
+    counted) so a stalled database cannot exhaust memory. A batch whose
+    insert fails is retried once on the next flush, then dropped.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None, clock=time.monotonic):
+        """
+        Args:
+            batch_size (int, optional): Rows per INSERT. Default Config.INGEST_BATCH_SIZE.
+            flush_interval (float, optional): Longest time a row waits in the
+                queue, in seconds. Default Config.INGEST_FLUSH_INTERVAL.
+            max_pending (int, optional): Queue capacity in rows.
+                Default Config.INGEST_MAX_PENDING.
+        """
+        self.batch_size = batch_size or Config.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.INGEST_FLUSH_INTERVAL
+        self.max_pending = max_pending or Config.INGEST_MAX_PENDING
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._pending = deque()
+        # [thời điểm vào hàng đợi, số dòng còn lại] của mỗi lần add(), theo thứ tự hàng đợi
+        self._arrivals = deque()
+        self._retry = None
+        self._writing = False
+        self._flush_requested = False
+        self._stopping = False
+        self._thread = None
+        self._stats = {
+            'enqueued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0,
+            'last_batch': 0, 'last_flush_seconds': 0.0, 'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0, 'max_queue_depth': 0
+        }
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app=None):
+        """Start the writer thread
+
+        Args:
+            app (Flask, optional): Application whose context is pushed in the
+                writer thread (needed for the database session)
+        """
+        if self.running:
+            return
+        self._stopping = False
+
+        def run():
+            if app is not None:
+                with app.app_context():
+                    self._run()
+            else:
+                self._run()
+
+        self._thread = threading.Thread(target=run, name='metric-writer', daemon=True)
+        self._thread.start()
+        logger.info(f"Metric writer started (batch {self.batch_size} rows, every {self.flush_interval}s)")
+
+    def stop(self, timeout=30):
+        """Flush everything still queued and stop the writer thread"""
+        if not self.running:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def add(self, rows):
+        """Queue metric rows (dictionaries with the Metric columns)
+
+        Returns:
+            Number of rows queued; the rest were dropped because the queue is full
+        """
+        if not rows:
+            return 0
+        with self._cond:
+            room = self.max_pending - len(self._pending)
+            accepted = rows if len(rows) <= room else rows[:max(room, 0)]
+            if accepted:
+                self._arrivals.append([self._clock(), len(accepted)])
+                self._pending.extend(accepted)
+            self._stats['enqueued'] += len(accepted)
+            self._stats['dropped'] += len(rows) - len(accepted)
+            depth = len(self._pending)
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+            if depth >= self.batch_size or len(accepted) == depth:
+                # Đủ một lô, hoặc hàng đợi vừa có dữ liệu: đánh thức luồng ghi để đặt hẹn giờ
+                self._cond.notify()
+
+        if len(accepted) < len(rows):
+            logger.warning(f"Metric queue full, dropped {len(rows) - len(accepted)} rows")
+        return len(accepted)
+
+    def add_sample(self, device_id, metrics_data, timestamp=None):
+        """Queue one collected sample; see metric_rows()"""
+        return self.add(metric_rows(device_id, metrics_data, timestamp))
+
+    def flush(self, timeout=30):
+        """Block until everything queued so far has been written
+
+        Returns:
+            True if the queue drained within the timeout
+        """
+        deadline = self._clock() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending or self._writing or self._retry:
+                remaining = deadline - self._clock()
+                if remaining <= 0 or not self.running:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        """Queue depth, write counters and flush latency"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._pending)
+            stats['oldest_pending_seconds'] = self._clock() - self._arrivals[0][0] if self._arrivals else 0.0
+        stats['avg_flush_seconds'] = stats.pop('total_flush_seconds') / stats['batches'] if stats['batches'] else 0.0
+        stats['running'] = self.running
+        return stats
+
+    def _next_batch(self):
+        """Wait until a batch is due; None once stopped and drained"""
+        with self._cond:
+            while True:
+                if self._retry:
+                    batch, self._retry = self._retry, None
+                    self._writing = True
+                    return batch, True
+
+                due = len(self._pending) >= self.batch_size or self._stopping or self._flush_requested
+                if self._pending and not due:
+                    wait = self._arrivals[0][0] + self.flush_interval - self._clock()
+                    due = wait <= 0
+                else:
+                    wait = None
+
+                if due and self._pending:
+                    count = min(self.batch_size, len(self._pending))
+                    batch = [self._pending.popleft() for _ in range(count)]
+                    self._take_arrivals(count)
+                    self._writing = True
+                    return batch, False
+
+                if self._stopping:
+                    return None, False
+                self._flush_requested = False
+                self._cond.notify_all()
+                self._cond.wait(wait)
+
+    def _take_arrivals(self, count):
+        """Forget the arrival times of count rows taken from the queue (lock held)
+
+        What remains starts with the arrival time of the oldest row still
+        queued, so a partial batch does not restart its flush timer.
+        """
+        while count:
+            arrival = self._arrivals[0]
+            taken = min(count, arrival[1])
+            arrival[1] -= taken
+            count -= taken
+            if not arrival[1]:
+                self._arrivals.popleft()
+
+    def _run(self):
+        while True:
+            batch, retried = self._next_batch()
+            if batch is None:
+                return
+
+            started = self._clock()
+            try:
+                insert_metric_rows(batch)
+                db.session.commit()
+                failed = False
+            except Exception as e:
+                db.session.rollback()
+                failed = True
+                logger.error(f"Error writing {len(batch)} metric rows{' (retry)' if retried else ''}: {e}")
+            elapsed = self._clock() - started
+
+            with self._cond:
+                self._writing = False
+                if failed:
+                    self._stats['errors'] += 1
+                    if retried:
+                        self._stats['dropped'] += len(batch)
+                    else:
+                        self._retry = batch
+                else:
+                    self._stats['written'] += len(batch)
+                    self._stats['batches'] += 1
+                    self._stats['last_batch'] = len(batch)
+                    self._stats['last_flush_seconds'] = elapsed
+                    self._stats['total_flush_seconds'] += elapsed
+                    self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], elapsed)
+                self._cond.notify_all()
+
+            if failed and not retried:
+                # Chờ một chút trước khi thử lại để database kịp hồi phục
+                time.sleep(min(self.flush_interval, 5))
+
+
+# Bộ đệm dùng chung cho toàn bộ process
+metric_buffer = MetricBuffer()
+
+
+def get_ingest_stats():
+    """Get write-behind metric ingestion statistics"""
+    return metric_buffer.stats()
@@ -4,7 +4,7 @@ Các mô hình dữ liệu cho ứng dụng MikroTik Monitor
 
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey, UniqueConstraint, LargeBinary, Index
 from sqlalchemy.orm import relationship
 
 from mik.app import db
@@ -72,6 +72,10 @@ class Device(db.Model):
 class Metric(db.Model):
     """Time series metrics for devices"""
     __tablename__ = 'metrics'
+    __table_args__ = (
+        # Lọc theo thiết bị/metric rồi sắp theo thời gian; có value nên không cần đọc lại bảng
+        Index('ix_metrics_device_series_time', 'device_id', 'metric_type', 'metric_name', 'timestamp', 'value'),
+    )
     
     id = Column(Integer, primary_key=True)
     device_id = Column(Integer, ForeignKey('devices.id'), nullable=False)
@@ -101,10 +105,10 @@ class AlertRule(db.Model):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     device_id = Column(Integer, ForeignKey('devices.id'), nullable=False)
-    metric = Column(String(50), nullable=False)  # 'cpu_load', 'memory_usage', 'disk_usage', etc.
+    metric = Column(String(50), nullable=False)  # 'cpu_load', 'memory_usage', 'disk_usage', etc.; 'min:'/'max:' prefix picks the duration aggregate
     condition = Column(String(10), nullable=False)  # '>', '<', '>=', '<=', '=='
     threshold = Column(Float, nullable=False)
-    duration = Column(Integer, default=0)  # Duration in seconds to check average
+    duration = Column(Integer, default=0)  # Duration in seconds to check average (or min/max, see metric)
     enabled = Column(Boolean, default=True)
     notify_email = Column(Boolean, default=False)
     notify_telegram = Column(Boolean, default=False)
@@ -139,15 +143,19 @@ class AlertRule(db.Model):
 class Alert(db.Model):
     """Triggered alerts history"""
     __tablename__ = 'alerts'
+    __table_args__ = (
+        # Đếm và liệt kê cảnh báo chưa xác nhận
+        Index('ix_alerts_acknowledged_time', 'acknowledged', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
-    rule_id = Column(Integer, ForeignKey('alert_rules.id'), nullable=False)
-    device_id = Column(Integer, ForeignKey('devices.id'), nullable=False)
+    rule_id = Column(Integer, ForeignKey('alert_rules.id'), nullable=False, index=True)
+    device_id = Column(Integer, ForeignKey('devices.id'), nullable=False, index=True)
     metric = Column(String(50), nullable=False)
     value = Column(Float, nullable=False)
     threshold = Column(Float, nullable=False)
     condition = Column(String(10), nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     acknowledged = Column(Boolean, default=False)
     acknowledged_by = Column(Integer, ForeignKey('users.id'))
     acknowledged_at = Column(DateTime)
@@ -186,4 +194,159 @@ class Setting(db.Model):
         return {
             'key': self.key,
             'value': self.value
+        }
+
+class CollectorNode(db.Model):
+    """Collector processes taking part in sharded polling (heartbeat rows)"""
+    __tablename__ = 'collector_nodes'
+    
+    node_id = Column(String(100), primary_key=True)
+    hostname = Column(String(255))
+    pid = Column(Integer)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'node_id': self.node_id,
+            'hostname': self.hostname,
+            'pid': self.pid,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None
+        }
+
+class ShardLease(db.Model):
+    """Ownership lease of one device shard by a collector node"""
+    __tablename__ = 'shard_leases'
+    
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String(100))  # node_id, NULL khi chưa có ai giữ
+    acquired_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'shard': self.shard,
+            'owner': self.owner,
+            'acquired_at': self.acquired_at.isoformat() if self.acquired_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+class MetricRollup(db.Model):
+    """Per-bucket aggregates of a metric series (1m/5m/1h/1d tiers)"""
+    __tablename__ = 'metric_rollups'
+    __table_args__ = (
+        UniqueConstraint('resolution', 'device_id', 'metric_type', 'metric_name', 'bucket',
+                         name='uq_metric_rollups_series_bucket'),
+        # Xoá theo thời gian giữ của từng tier
+        Index('ix_metric_rollups_resolution_bucket', 'resolution', 'bucket'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    resolution = Column(Integer, nullable=False)  # Độ dài bucket (giây)
+    device_id = Column(Integer, nullable=False)
+    metric_type = Column(String(50), nullable=False)
+    metric_name = Column(String(50), nullable=False)
+    bucket = Column(DateTime, nullable=False)  # Thời điểm bắt đầu bucket (UTC)
+    count = Column(Integer, nullable=False)
+    sum = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    last = Column(Float, nullable=False)
+    last_at = Column(DateTime, nullable=False)
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'device_id': self.device_id,
+            'metric_type': self.metric_type,
+            'metric_name': self.metric_name,
+            'resolution': self.resolution,
+            'timestamp': self.bucket.isoformat() if self.bucket else None,
+            'value': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'last': self.last,
+            'count': self.count
+        }
+
+class MetricChunk(db.Model):
+    """Compressed block of one metric series covering a fixed time span"""
+    __tablename__ = 'metric_chunks'
+    __table_args__ = (
+        UniqueConstraint('device_id', 'metric_type', 'metric_name', 'start',
+                         name='uq_metric_chunks_series_start'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, nullable=False)
+    metric_type = Column(String(50), nullable=False)
+    metric_name = Column(String(50), nullable=False)
+    start = Column(DateTime, nullable=False, index=True)  # Đầu khoảng thời gian của chunk (UTC)
+    first_at = Column(DateTime, nullable=False)
+    last_at = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)  # Mã hoá Gorilla, xem app/utils/gorilla.py
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'metric_type': self.metric_type,
+            'metric_name': self.metric_name,
+            'start': self.start.isoformat() if self.start else None,
+            'first_at': self.first_at.isoformat() if self.first_at else None,
+            'last_at': self.last_at.isoformat() if self.last_at else None,
+            'count': self.count,
+            'bytes': len(self.data) if self.data else 0
+        }
+
+class MetricSeries(db.Model):
+    """Catalog entry giving a metric series a compact integer ID"""
+    __tablename__ = 'metric_series'
+    __table_args__ = (
+        UniqueConstraint('device_id', 'metric_type', 'metric_name', 'labels',
+                         name='uq_metric_series_key'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, nullable=False)  # Tra cứu theo thiết bị dùng index của UniqueConstraint
+    metric_type = Column(String(50), nullable=False)
+    metric_name = Column(String(50), nullable=False)
+    labels = Column(String(255), nullable=False, default='')  # 'key=value,...' sắp xếp theo key, rỗng nếu không có
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'metric_type': self.metric_type,
+            'metric_name': self.metric_name,
+            'labels': self.labels,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class MetricPoint(db.Model):
+    """One value of a catalogued metric series"""
+    __tablename__ = 'metric_points'
+    __table_args__ = (
+        Index('ix_metric_points_series_time', 'series_id', 'timestamp'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    series_id = Column(Integer, nullable=False)  # metric_series.id
+    value = Column(Float, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'id': self.id,
+            'series_id': self.series_id,
+            'value': self.value,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None
         }
\ No newline at end of file
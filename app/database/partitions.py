@@ -0,0 +1,334 @@
+"""
+Lưu metrics trong các bảng chia theo thời gian (ngày/tuần); xoá dữ liệu cũ bằng cách DROP cả bảng
+"""
+
+import re
+import time
+import logging
+import threading
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, Float, DateTime, Index, inspect, select
+
+from mik.app import db
+from mik.app.config import Config
+from mik.app.database.models import Metric, MetricPoint
+
+logger = logging.getLogger('mikrotik_monitor.partitions')
+
+# metrics_d20261018 (ngày) hoặc metrics_w2026_42 (tuần ISO); points_... cho bảng theo series_id
+_NAME_PATTERN = re.compile(r'^(metrics|points)_(?:d(\d{4})(\d{2})(\d{2})|w(\d{4})_(\d{2}))$')
+
+PERIODS = ('day', 'week')
+
+
+def partition_name(timestamp, period, prefix='metrics'):
+    """Name of the partition table holding a timestamp"""
+    if period == 'week':
+        year, week, _ = timestamp.isocalendar()
+        return f'{prefix}_w{year:04d}_{week:02d}'
+    return f'{prefix}_d{timestamp:%Y%m%d}'
+
+
+def partition_bounds(name, prefix='metrics'):
+    """Time range [start, end) covered by a partition table
+
+    Returns:
+        Tuple (start, end) of datetimes, or None if name is not a partition
+        with the given prefix
+    """
+    match = _NAME_PATTERN.match(name)
+    if not match or match.group(1) != prefix:
+        return None
+    if match.group(2):
+        start = datetime(int(match.group(2)), int(match.group(3)), int(match.group(4)))
+        return start, start + timedelta(days=1)
+    start = datetime.combine(date.fromisocalendar(int(match.group(5)), int(match.group(6)), 1), datetime.min.time())
+    return start, start + timedelta(weeks=1)
+
+
+def query_tables(tables, device_id, metric_type=None, metric_name=None, start_time=None, end_time=None,
+                 limit=100, series=None):
+    """Rows of a device read from several tables in order, newest first per table
+
+    Reading stops as soon as 'limit' rows were found. Tables with a
+    series_id column (metric_points layout) are filtered on the IDs of
+    'series' and their rows are named from it.
+
+    Args:
+        tables (list): Table objects, newest data first
+        series (dict, optional): {series_id: (device_id, metric_type, metric_name, labels)}
+            of the matching series, see SeriesCatalog.find()
+
+    Returns:
+        List of dictionaries like Metric.to_dict()
+    """
+    results = []
+    for table in tables:
+        remaining = limit - len(results) if limit else None
+        if remaining is not None and remaining <= 0:
+            break
+        columns = table.c
+        by_series = 'series_id' in columns
+        if by_series:
+            if not series:
+                continue
+            query = select(table).where(columns.series_id.in_(list(series)))
+        else:
+            query = select(table).where(columns.device_id == device_id)
+            if metric_type:
+                query = query.where(columns.metric_type == metric_type)
+            if metric_name:
+                query = query.where(columns.metric_name == metric_name)
+        if start_time:
+            query = query.where(columns.timestamp >= start_time)
+        if end_time:
+            query = query.where(columns.timestamp <= end_time)
+        query = query.order_by(columns.timestamp.desc())
+        if remaining:
+            query = query.limit(remaining)
+        for row in db.session.execute(query).mappings():
+            if by_series:
+                _, row_type, row_name, _ = series[row['series_id']]
+            else:
+                row_type, row_name = row['metric_type'], row['metric_name']
+            results.append({
+                'id': row['id'],
+                'device_id': device_id,
+                'metric_type': row_type,
+                'metric_name': row_name,
+                'value': row['value'],
+                'timestamp': row['timestamp'].isoformat() if row['timestamp'] else None
+            })
+    return results
+
+
+class MetricPartitions:
+    """Metric rows stored in one table per day or week
+
+    Partition tables have the columns and the composite (device_id,
+    metric_type, metric_name, timestamp) index of 'metrics'; they are
+    created on first write. The legacy
+    'metrics' table is still read (as the oldest data) so enabling
+    partitioning needs no migration. Tables of both periods are read, so
+    the period can be changed on a running database.
+
+    With series=True the partitions hold metric_points rows (series_id,
+    value, timestamp) and are named points_...; metric_points and the
+    legacy 'metrics' table are read after them.
+    """
+
+    def __init__(self, period=None, refresh_interval=60, clock=time.monotonic, series=False):
+        """
+        Args:
+            period (str, optional): 'day' or 'week'. Default Config.METRICS_PARTITIONING.
+            refresh_interval (float): Seconds the list of partition tables
+                is cached before it is read from the database again
+            series (bool): Partition metric_points rows instead of metrics rows
+        """
+        self.period = period or Config.METRICS_PARTITIONING
+        if self.period not in PERIODS:
+            raise ValueError(f"Unknown partition period: {self.period}")
+        self.series = series
+        self.prefix = 'points' if series else 'metrics'
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._metadata = MetaData()
+        self._lock = threading.Lock()
+        self._known = {}
+        self._refreshed_at = None
+
+    def table(self, name):
+        """Table object of a partition (it may not exist in the database yet)"""
+        with self._lock:
+            table = self._metadata.tables.get(name)
+            if table is None and self.series:
+                table = Table(
+                    name, self._metadata,
+                    Column('id', Integer, primary_key=True),
+                    Column('series_id', Integer, nullable=False),
+                    Column('value', Float, nullable=False),
+                    Column('timestamp', DateTime, nullable=False),
+                    Index(f'ix_{name}_series_time', 'series_id', 'timestamp')
+                )
+            elif table is None:
+                table = Table(
+                    name, self._metadata,
+                    Column('id', Integer, primary_key=True),
+                    Column('device_id', Integer, nullable=False),
+                    Column('metric_type', String(50), nullable=False),
+                    Column('metric_name', String(50), nullable=False),
+                    Column('value', Float, nullable=False),
+                    Column('timestamp', DateTime, nullable=False),
+                    # Cùng index với bảng metrics: lọc theo thiết bị/metric rồi sắp theo thời gian
+                    Index(f'ix_{name}_device_series_time', 'device_id', 'metric_type', 'metric_name',
+                          'timestamp', 'value')
+                )
+            return table
+
+    def partitions(self, refresh=False):
+        """Existing partitions as {name: (start, end)}"""
+        now = self._clock()
+        if refresh or self._refreshed_at is None or now - self._refreshed_at > self.refresh_interval:
+            names = inspect(db.session.connection()).get_table_names()
+            known = {name: partition_bounds(name, self.prefix) for name in names if partition_bounds(name, self.prefix)}
+            with self._lock:
+                self._known = known
+                self._refreshed_at = now
+        with self._lock:
+            return dict(self._known)
+
+    def ensure(self, name):
+        """Create a partition table if it does not exist yet"""
+        if name in self.partitions():
+            return self.table(name)
+        table = self.table(name)
+        connection = db.session.connection()
+        try:
+            table.create(bind=connection, checkfirst=True)
+        except Exception:
+            # Process khác vừa tạo cùng bảng
+            if not inspect(connection).has_table(name):
+                raise
+        with self._lock:
+            self._known[name] = partition_bounds(name, self.prefix)
+        logger.info(f"Created metrics partition {name}")
+        return table
+
+    def ensure_indexes(self, bind=None):
+        """Create the indexes of the current layout missing on existing partitions
+
+        Partitions created by an older version keep their old indexes;
+        they are dropped with the partition at the end of retention.
+
+        Returns:
+            Names of the created indexes
+        """
+        bind = bind or db.engine
+        inspector = inspect(bind)
+        created = []
+        for name in inspector.get_table_names():
+            if not partition_bounds(name, self.prefix):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(name)}
+            for index in self.table(name).indexes:
+                if index.name in existing:
+                    continue
+                logger.info(f"Creating index {index.name} on {name}...")
+                index.create(bind=bind, checkfirst=True)
+                created.append(index.name)
+        return created
+
+    def insert(self, rows):
+        """Insert rows into their partitions, one executemany per partition
+
+        Runs in the current session; the caller commits.
+
+        Returns:
+            Number of rows inserted
+        """
+        groups = {}
+        for row in rows:
+            timestamp = row.get('timestamp') or datetime.utcnow()
+            groups.setdefault(partition_name(timestamp, self.period, self.prefix), []).append(row)
+        for name, group in groups.items():
+            db.session.execute(self.ensure(name).insert(), group)
+        return len(rows)
+
+    def covering(self, start_time=None, end_time=None):
+        """Partitions overlapping [start_time, end_time], newest first"""
+        known = self.partitions()
+        if end_time is None or end_time >= datetime.utcnow() - timedelta(days=1):
+            # Phân vùng của hôm nay có thể vừa được process khác tạo
+            current = partition_name(datetime.utcnow(), self.period, self.prefix)
+            if current not in known:
+                known = self.partitions(refresh=True)
+        selected = [
+            (bounds[0], name) for name, bounds in known.items()
+            if (start_time is None or bounds[1] > start_time) and (end_time is None or bounds[0] <= end_time)
+        ]
+        return [name for _, name in sorted(selected, reverse=True)]
+
+    def query(self, device_id, metric_type=None, metric_name=None, start_time=None, end_time=None, limit=100,
+              series=None):
+        """Rows of a device across partitions, newest first
+
+        Partitions are read newest to oldest and reading stops as soon as
+        'limit' rows were found; the unpartitioned tables are read last.
+
+        Args:
+            series (dict, optional): Matching series for the series layout,
+                see query_tables()
+
+        Returns:
+            List of dictionaries like Metric.to_dict()
+        """
+        tables = [self.table(name) for name in self.covering(start_time, end_time)]
+        if self.series:
+            tables.append(MetricPoint.__table__)
+        tables.append(Metric.__table__)
+        return query_tables(tables, device_id, metric_type, metric_name, start_time, end_time, limit, series)
+
+    def drop_before(self, cutoff):
+        """Drop every partition that ends at or before cutoff
+
+        Returns:
+            Names of the dropped tables
+        """
+        dropped = []
+        connection = db.session.connection()
+        for name, (_, end) in sorted(self.partitions(refresh=True).items()):
+            if end > cutoff:
+                continue
+            self.table(name).drop(bind=connection, checkfirst=True)
+            dropped.append(name)
+        db.session.commit()
+        with self._lock:
+            for name in dropped:
+                self._known.pop(name, None)
+                self._metadata.remove(self._metadata.tables[name])
+        return dropped
+
+    def delete_device(self, device_id, series_ids=None):
+        """Delete the rows of a device from every partition; the caller commits
+
+        Args:
+            series_ids (iterable, optional): Series IDs of the device (series layout)
+        """
+        deleted = 0
+        series_ids = list(series_ids or [])
+        for name in self.partitions(refresh=True):
+            table = self.table(name)
+            if self.series:
+                if series_ids:
+                    deleted += db.session.execute(table.delete().where(table.c.series_id.in_(series_ids))).rowcount
+                continue
+            deleted += db.session.execute(table.delete().where(table.c.device_id == device_id)).rowcount
+        return deleted
+
+    def stats(self):
+        """Partition period and the time range of each table"""
+        partitions = self.partitions()
+        return {
+            'period': self.period,
+            'layout': 'series' if self.series else 'rows',
+            'count': len(partitions),
+            'partitions': [
+                {'name': name, 'start': start.isoformat(), 'end': end.isoformat()}
+                for name, (start, end) in sorted(partitions.items())
+            ]
+        }
+
+
+_partitions = None
+
+
+def metric_partitions():
+    """Shared MetricPartitions, or None when partitioning is disabled"""
+    global _partitions
+    if Config.METRICS_PARTITIONING not in PERIODS:
+        return None
+    series = Config.METRICS_STORAGE == 'series'
+    if _partitions is None or _partitions.period != Config.METRICS_PARTITIONING or _partitions.series != series:
+        _partitions = MetricPartitions(series=series)
+    return _partitions
@@ -0,0 +1,300 @@
+"""
+Bảng tổng hợp metrics theo bucket (1m/5m/1h/1d), cập nhật dần bởi bộ thu thập
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from mik.app import db
+from mik.app.config import Config
+from mik.app.database.models import MetricRollup
+
+logger = logging.getLogger('mikrotik_monitor.rollups')
+
+# Tên tier -> độ dài bucket (giây)
+TIERS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+_EPOCH = datetime(1970, 1, 1)
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_SERIES = ('resolution', 'device_id', 'metric_type', 'metric_name', 'bucket')
+
+
+def parse_retention(value):
+    """Parse '1m=7d,1h=730d' into {60: timedelta(days=7), 3600: ...}
+
+    Tiers not listed are kept forever.
+    """
+    retention = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        tier, _, duration = item.partition('=')
+        tier, duration = tier.strip(), duration.strip()
+        if tier not in TIERS or not duration or duration[-1] not in _UNITS:
+            raise ValueError(f"Invalid rollup retention: {item}")
+        retention[TIERS[tier]] = timedelta(seconds=float(duration[:-1]) * _UNITS[duration[-1]])
+    return retention
+
+
+def bucket_start(timestamp, resolution):
+    """Start of the bucket of the given resolution holding a timestamp (UTC)"""
+    seconds = int((timestamp - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def tier_name(resolution):
+    for name, seconds in TIERS.items():
+        if seconds == resolution:
+            return name
+    return f'{resolution}s'
+
+
+class MetricRollups:
+    """Incrementally maintained min/max/avg/count/last per bucket and tier
+
+    Collected rows are folded into in-memory deltas per (tier, series,
+    bucket); flush() merges the deltas into metric_rollups with an upsert
+    that adds counts and sums and keeps the extreme and latest values, so
+    a bucket written in several flushes, or by several collector nodes
+    after a shard moved, stays correct.
+    """
+
+    def __init__(self, tiers=None, retention=None):
+        """
+        Args:
+            tiers (iterable, optional): Bucket lengths in seconds. Default all TIERS.
+            retention (dict, optional): {resolution: timedelta}.
+                Default parsed from Config.ROLLUP_RETENTION.
+        """
+        self.tiers = sorted(tiers or TIERS.values())
+        self.retention = parse_retention(Config.ROLLUP_RETENTION) if retention is None else retention
+        self._lock = threading.Lock()
+        self._deltas = {}
+        self._stats = {'rows': 0, 'flushes': 0, 'buckets_written': 0, 'errors': 0}
+
+    def add(self, rows):
+        """Fold metric rows (see crud.metric_rows) into the pending deltas"""
+        with self._lock:
+            deltas = self._deltas
+            for row in rows:
+                timestamp = row['timestamp']
+                value = row['value']
+                series = (row['device_id'], row['metric_type'], row['metric_name'])
+                for resolution in self.tiers:
+                    key = (resolution,) + series + (bucket_start(timestamp, resolution),)
+                    delta = deltas.get(key)
+                    if delta is None:
+                        deltas[key] = [1, value, value, value, value, timestamp]
+                        continue
+                    delta[0] += 1
+                    delta[1] += value
+                    if value < delta[2]:
+                        delta[2] = value
+                    if value > delta[3]:
+                        delta[3] = value
+                    if timestamp >= delta[5]:
+                        delta[4] = value
+                        delta[5] = timestamp
+            self._stats['rows'] += len(rows)
+
+    def flush(self):
+        """Merge pending deltas into the database (application context)
+
+        Returns:
+            Number of buckets written
+        """
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+        if not deltas:
+            return 0
+
+        rows = [
+            dict(zip(_SERIES, key), count=delta[0], sum=delta[1], min=delta[2], max=delta[3],
+                 last=delta[4], last_at=delta[5])
+            for key, delta in deltas.items()
+        ]
+        try:
+            self._upsert(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # Gộp lại vào delta để lần flush sau thử tiếp
+            with self._lock:
+                self._stats['errors'] += 1
+                for key, delta in deltas.items():
+                    self._merge(key, delta)
+            logger.error(f"Error writing {len(rows)} metric rollup buckets: {e}")
+            return 0
+
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['buckets_written'] += len(rows)
+        return len(rows)
+
+    def _merge(self, key, delta):
+        current = self._deltas.get(key)
+        if current is None:
+            self._deltas[key] = delta
+            return
+        current[0] += delta[0]
+        current[1] += delta[1]
+        current[2] = min(current[2], delta[2])
+        current[3] = max(current[3], delta[3])
+        if delta[5] >= current[5]:
+            current[4], current[5] = delta[4], delta[5]
+
+    def _upsert(self, rows):
+        table = MetricRollup.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            module = sqlite if dialect == 'sqlite' else postgresql
+            least, greatest = (func.min, func.max) if dialect == 'sqlite' else (func.least, func.greatest)
+            statement = module.insert(table)
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=list(_SERIES),
+                set_={
+                    'count': table.c.count + excluded.count,
+                    'sum': table.c.sum + excluded.sum,
+                    'min': least(table.c.min, excluded.min),
+                    'max': greatest(table.c.max, excluded.max),
+                    'last': case((excluded.last_at >= table.c.last_at, excluded.last), else_=table.c.last),
+                    'last_at': case((excluded.last_at >= table.c.last_at, excluded.last_at), else_=table.c.last_at),
+                }
+            )
+            db.session.execute(statement, rows)
+            return
+
+        # Database khác: đọc rồi cập nhật từng bucket
+        for row in rows:
+            existing = MetricRollup.query.filter_by(**{column: row[column] for column in _SERIES}).first()
+            if existing is None:
+                db.session.add(MetricRollup(**row))
+                continue
+            existing.count += row['count']
+            existing.sum += row['sum']
+            existing.min = min(existing.min, row['min'])
+            existing.max = max(existing.max, row['max'])
+            if row['last_at'] >= existing.last_at:
+                existing.last, existing.last_at = row['last'], row['last_at']
+
+    def choose(self, interval_seconds, start_time=None, now=None):
+        """Coarsest tier whose buckets fit the requested interval
+
+        Args:
+            interval_seconds (int): Requested point spacing
+            start_time (datetime, optional): Start of the requested range;
+                tiers whose retention no longer reaches back to it are skipped
+
+        Returns:
+            Resolution in seconds, or None if raw rows are needed
+        """
+        candidates = [resolution for resolution in self.tiers if resolution <= interval_seconds]
+        if not candidates:
+            return None
+        now = now or datetime.utcnow()
+        for resolution in reversed(candidates):
+            keep = self.retention.get(resolution)
+            if keep is None or start_time is None or start_time >= now - keep:
+                return resolution
+        return candidates[-1]
+
+    def query(self, device_id, resolution, metric_type=None, metric_name=None,
+              start_time=None, end_time=None, interval_seconds=None):
+        """Aggregated points of a device, oldest first
+
+        Buckets of the tier are merged into interval_seconds-long points
+        when the interval is a multiple of the tier, so the result has the
+        requested spacing. Like resample_time_series(), steps without data
+        between the first and last point give a point with value None and
+        count 0.
+
+        Returns:
+            List of dictionaries with the keys of resampled raw metrics
+            (id is None) plus min, max and last, per metric series
+        """
+        table = MetricRollup.__table__
+        columns = table.c
+        query = select(table).where(columns.resolution == resolution, columns.device_id == device_id)
+        if metric_type:
+            query = query.where(columns.metric_type == metric_type)
+        if metric_name:
+            query = query.where(columns.metric_name == metric_name)
+        if start_time:
+            query = query.where(columns.bucket >= bucket_start(start_time, resolution))
+        if end_time:
+            query = query.where(columns.bucket <= end_time)
+        query = query.order_by(columns.bucket)
+
+        step = interval_seconds if interval_seconds and interval_seconds % resolution == 0 else resolution
+        points = {}
+        for row in db.session.execute(query).mappings():
+            key = (row['metric_type'], row['metric_name'], bucket_start(row['bucket'], step))
+            point = points.get(key)
+            if point is None:
+                points[key] = dict(row)
+                continue
+            point['count'] += row['count']
+            point['sum'] += row['sum']
+            point['min'] = min(point['min'], row['min'])
+            point['max'] = max(point['max'], row['max'])
+            if row['last_at'] >= point['last_at']:
+                point['last'], point['last_at'] = row['last'], row['last_at']
+
+        result = []
+        previous = None
+        for (series_type, series_name, bucket), point in sorted(points.items(), key=lambda item: item[0][2]):
+            # Điểm rỗng cho các bước không có dữ liệu, giữ biểu đồ liên tục như dữ liệu thô
+            while previous is not None and bucket - previous > timedelta(seconds=step):
+                previous += timedelta(seconds=step)
+                result.append({'timestamp': previous.isoformat(), 'value': None, 'count': 0})
+            previous = bucket
+            result.append({
+                'id': None,
+                'device_id': device_id,
+                'metric_type': series_type,
+                'metric_name': series_name,
+                'value': point['sum'] / point['count'] if point['count'] else None,
+                'timestamp': bucket.isoformat(),
+                'count': point['count'],
+                'min': point['min'],
+                'max': point['max'],
+                'last': point['last']
+            })
+        return result
+
+    def prune(self, now=None):
+        """Delete buckets older than the retention of their tier
+
+        Returns:
+            Dictionary {tier name: deleted rows}
+        """
+        now = now or datetime.utcnow()
+        deleted = {}
+        for resolution, keep in self.retention.items():
+            deleted[tier_name(resolution)] = MetricRollup.query.filter(
+                MetricRollup.resolution == resolution,
+                MetricRollup.bucket < now - keep
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def stats(self):
+        """Pending buckets and write counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending_buckets'] = len(self._deltas)
+        stats['tiers'] = [tier_name(resolution) for resolution in self.tiers]
+        stats['retention'] = {tier_name(resolution): keep.total_seconds() for resolution, keep in self.retention.items()}
+        return stats
+
+
+# Bộ tổng hợp dùng chung cho toàn bộ process
+metric_rollups = MetricRollups()
+
+
+def get_rollup_stats():
+    """Get metric rollup statistics"""
+    return metric_rollups.stats()
@@ -0,0 +1,72 @@
+"""
+Cập nhật schema của database đã tồn tại: tạo các index được khai báo trong models nhưng còn thiếu
+"""
+
+import time
+import logging
+
+from sqlalchemy import inspect
+
+from mik.app import db
+
+logger = logging.getLogger('mikrotik_monitor.schema')
+
+
+def missing_indexes(bind=None):
+    """Indexes declared on the models that do not exist in the database
+
+    Only tables that already exist are checked; db.create_all() creates
+    new tables together with their indexes. Indexes on columns the
+    existing table does not have (tables created by an older schema, e.g.
+    setup_db.py) are skipped with a warning.
+
+    Returns:
+        List of sqlalchemy Index objects
+    """
+    bind = bind or db.engine
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        columns = None
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if columns is None:
+                columns = {column['name'] for column in inspector.get_columns(table.name)}
+            absent = [column.name for column in index.columns if column.name not in columns]
+            if absent:
+                logger.warning(f"Skipping index {index.name}: table {table.name} has no column {', '.join(absent)}")
+                continue
+            missing.append(index)
+    return missing
+
+
+def ensure_indexes(bind=None):
+    """Create the missing model indexes (application context)
+
+    db.create_all() never alters existing tables, so indexes added to the
+    models later are created here. Building an index on a large metrics
+    table can take a while; it runs once, at startup.
+
+    Returns:
+        Names of the created indexes
+    """
+    bind = bind or db.engine
+    created = []
+    for index in missing_indexes(bind):
+        started = time.perf_counter()
+        logger.info(f"Creating index {index.name} on {index.table.name}...")
+        index.create(bind=bind, checkfirst=True)
+        logger.info(f"Created index {index.name} in {time.perf_counter() - started:.1f}s")
+        created.append(index.name)
+
+    # Bảng phân vùng không nằm trong models, index của chúng được kiểm tra riêng
+    from mik.app.database.partitions import metric_partitions
+    partitions = metric_partitions()
+    if partitions:
+        created.extend(partitions.ensure_indexes(bind))
+    return created
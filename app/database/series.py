@@ -0,0 +1,187 @@
+"""
+Danh mục chuỗi metrics: ánh xạ (device_id, metric_type, metric_name, labels) sang series_id kiểu số nguyên
+"""
+
+import logging
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from mik.app import db
+from mik.app.database.models import MetricSeries
+
+logger = logging.getLogger('mikrotik_monitor.series')
+
+
+def labels_key(labels):
+    """Canonical string of a label set: 'key=value,...' sorted by key ('' if none)"""
+    if not labels:
+        return ''
+    if isinstance(labels, str):
+        return labels
+    return ','.join(f'{key}={labels[key]}' for key in sorted(labels))
+
+
+class SeriesCatalog:
+    """In-process cache of the metric_series catalog
+
+    The first lookup for a device loads every series of that device with
+    one query; unknown series are created in a separate short transaction
+    (committed at once, so an ID is never cached for a row that a later
+    rollback removes). Catalog rows are never updated, so cached IDs stay
+    valid until the device is deleted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._keys = {}
+        self._devices = set()
+        self._stats = {'hits': 0, 'misses': 0, 'created': 0, 'device_loads': 0}
+
+    def _remember(self, series_id, key):
+        self._ids[key] = series_id
+        self._keys[series_id] = key
+
+    def _load(self, device_ids):
+        """Read every series of the given devices into the cache"""
+        table = MetricSeries.__table__
+        columns = table.c
+        query = select(columns.id, columns.device_id, columns.metric_type, columns.metric_name, columns.labels)
+        query = query.where(columns.device_id.in_(list(device_ids)))
+        found = db.session.execute(query).all()
+        with self._lock:
+            for row in found:
+                self._remember(row.id, (row.device_id, row.metric_type, row.metric_name, row.labels))
+            self._devices.update(device_ids)
+            self._stats['device_loads'] += len(device_ids)
+
+    def _create(self, keys):
+        """Insert catalog rows for keys, ignoring rows created concurrently"""
+        rows = [
+            {'device_id': key[0], 'metric_type': key[1], 'metric_name': key[2], 'labels': key[3]}
+            for key in keys
+        ]
+        table = MetricSeries.__table__
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            if dialect in ('sqlite', 'postgresql'):
+                module = sqlite if dialect == 'sqlite' else postgresql
+                connection.execute(module.insert(table).on_conflict_do_nothing(), rows)
+                return
+        # Database khác: từng dòng một, bỏ qua dòng mà process khác vừa tạo
+        for row in rows:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(table.insert(), row)
+            except IntegrityError:
+                pass
+
+    def resolve_many(self, keys):
+        """Series IDs of (device_id, metric_type, metric_name, labels) keys
+
+        Labels must already be canonical (see labels_key()). Missing series
+        are created.
+
+        Returns:
+            Dictionary {key: series_id}
+        """
+        with self._lock:
+            found = {key: self._ids[key] for key in keys if key in self._ids}
+            missing = [key for key in keys if key not in found]
+            unloaded = {key[0] for key in missing if key[0] not in self._devices}
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(missing)
+        if not missing:
+            return found
+
+        if unloaded:
+            self._load(unloaded)
+        with self._lock:
+            unknown = [key for key in dict.fromkeys(missing) if key not in self._ids]
+        if unknown:
+            self._create(unknown)
+            self._load({key[0] for key in unknown})
+            with self._lock:
+                self._stats['created'] += len(unknown)
+            logger.debug(f"Created {len(unknown)} metric series")
+
+        with self._lock:
+            for key in missing:
+                found[key] = self._ids[key]
+        return found
+
+    def series_id(self, device_id, metric_type, metric_name, labels=None):
+        """Series ID of one series, creating it if needed"""
+        key = (device_id, metric_type, metric_name, labels_key(labels))
+        return self.resolve_many([key])[key]
+
+    def points(self, rows):
+        """Turn metric rows (see crud.metric_rows) into metric_points rows
+
+        New series are written on another connection, so on SQLite call
+        this before the current transaction writes anything.
+
+        Returns:
+            List of dictionaries with series_id, value and timestamp
+        """
+        keys = [
+            (row['device_id'], row['metric_type'], row['metric_name'], labels_key(row.get('labels')))
+            for row in rows
+        ]
+        ids = self.resolve_many(list(dict.fromkeys(keys)))
+        return [
+            {'series_id': ids[key], 'value': row['value'], 'timestamp': row['timestamp']}
+            for key, row in zip(keys, rows)
+        ]
+
+    def find(self, device_id, metric_type=None, metric_name=None):
+        """Series of a device matching the filters
+
+        Always reads the catalog, so series created by other processes are
+        seen.
+
+        Returns:
+            Dictionary {series_id: (device_id, metric_type, metric_name, labels)}
+        """
+        self._load({device_id})
+        with self._lock:
+            return {
+                series_id: key for series_id, key in self._keys.items()
+                if key[0] == device_id
+                and (not metric_type or key[1] == metric_type)
+                and (not metric_name or key[2] == metric_name)
+            }
+
+    def delete_device(self, device_id):
+        """Delete the catalog rows of a device; the caller commits"""
+        self.forget(device_id)
+        return MetricSeries.query.filter_by(device_id=device_id).delete(synchronize_session=False)
+
+    def forget(self, device_id):
+        """Drop the cached series of a device"""
+        with self._lock:
+            for series_id, key in list(self._keys.items()):
+                if key[0] == device_id:
+                    del self._keys[series_id]
+                    del self._ids[key]
+            self._devices.discard(device_id)
+
+    def stats(self):
+        """Cache size and lookup counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_series'] = len(self._ids)
+            stats['cached_devices'] = len(self._devices)
+        return stats
+
+
+# Danh mục dùng chung cho toàn bộ process
+series_catalog = SeriesCatalog()
+
+
+def get_series_stats():
+    """Get metric series catalog statistics"""
+    return series_catalog.stats()
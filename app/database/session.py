@@ -10,6 +10,7 @@ from sqlalchemy.orm import scoped_session, sessionmaker
 
 from mik.app import db
 from mik.app.database.models import Setting
+from mik.app.database.schema import ensure_indexes
 
 logger = logging.getLogger('mikrotik_monitor.db')
 
@@ -48,6 +49,7 @@ def initialize_db(app):
     with app.app_context():
         # Tạo các bảng nếu chưa tồn tại
         db.create_all()
+        ensure_indexes()
         
         # Tạo các cài đặt mặc định
         default_settings = {
@@ -103,7 +103,11 @@ def handle_update_request(data):
         
         device = get_device_by_id(device_id)
         if device:
-            metrics = get_device_metrics(device)
+            try:
+                max_age = float(data.get('max_age', current_app.config.get('STATE_MAX_AGE', 0)))
+            except (TypeError, ValueError):
+                max_age = 0
+            metrics = get_device_metrics(device, max_age=max_age)
             socketio.emit('device_update', {'device_id': device_id, 'metrics': metrics})
 
 # Register error handlers
@@ -1,40 +1,64 @@
 import logging
-from app import app, scheduler
-from app.core.alerts import check_alerts
-from app.config import Config
+from flask import current_app
+from mik.app import scheduler
+from mik.app.core.alerts import alert_evaluator, refresh_alert_rules, evaluate_pending_alerts
+from mik.app.config import Config
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
-def alert_check_task():
-    """Task to check alert conditions"""
+# Ứng dụng Flask cho context của các tác vụ nền, gán khi khởi tạo tác vụ
+app = None
+
+def refresh_alert_rules_task():
+    """Task to reload the alert rule index"""
+    with app.app_context():
+        refresh_alert_rules()
+
+def evaluate_alerts_task():
+    """Task to evaluate the compiled alert rules over the samples collected since the last run"""
     with app.app_context():
-        try:
-            logger.debug("Starting alert check task")
-            check_alerts()
-            logger.debug("Alert check task completed")
-        except Exception as e:
-            logger.error(f"Error in alert check task: {str(e)}")
+        evaluate_pending_alerts()
 
 def schedule_alert_checks():
-    """Schedule periodic alert checks"""
+    """Evaluate alert rules on collected samples and reload the rules periodically"""
     try:
         interval = Config.ALERT_CHECK_INTERVAL
         
-        # Add job to scheduler
+        # Rule được đánh giá trên từng mẫu của bộ thu thập (xem observe_sample),
+        # tác vụ định kỳ chỉ nạp lại danh sách rule và cài đặt thông báo
         scheduler.add_job(
-            func=alert_check_task,
+            func=refresh_alert_rules_task,
             trigger='interval',
             seconds=interval,
-            id='check_alerts',
+            id='refresh_alert_rules',
             replace_existing=True
         )
         
-        logger.info(f"Scheduled alert checks every {interval} seconds")
+        if alert_evaluator.engine is not None:
+            # Một lượt vector hoá cho mọi mẫu nhận được kể từ lượt trước
+            scheduler.add_job(
+                func=evaluate_alerts_task,
+                trigger='interval',
+                seconds=Config.ALERT_EVALUATION_INTERVAL,
+                id='evaluate_alerts',
+                replace_existing=True
+            )
     except Exception as e:
         logger.error(f"Error scheduling alert checks: {str(e)}")
+        return
+    
+    # Lần nạp đầu lỗi (ví dụ database chưa sẵn sàng) thì tác vụ định kỳ sẽ thử lại và bật đánh giá
+    try:
+        alert_evaluator.start()
+        logger.info(f"Alert rules evaluated on collected samples, reloaded every {interval} seconds")
+    except Exception as e:
+        logger.error(f"Error loading alert rules, retrying in {interval} seconds: {str(e)}")
 
 def initialize_alert_tasks():
-    """Initialize all alert-related tasks"""
+    """Initialize all alert-related tasks (inside the application context)"""
+    global app
+    app = current_app._get_current_object()
+    
     # Schedule alert checks
     schedule_alert_checks()
@@ -1,31 +1,127 @@
 import logging
 from datetime import datetime, timedelta
-from app import app, scheduler, db
-from app.database.crud import get_all_devices, save_device_metrics, get_setting
-from app.core.mikrotik import get_device_metrics
-from app.config import Config
-from app.database.models import Metric
+from flask import current_app
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES
+from mik.app import scheduler, db
+from mik.app.database.crud import (
+    get_devices_for_polling, save_device_metrics, get_setting, get_all_alert_rules, metric_rows
+)
+from mik.app.core.mikrotik import (
+    collect_device_sample, interface_rate_metrics, evict_idle_connections, snapshot_from_store,
+    remember_sample
+)
+from mik.app.core.subscriptions import subscription_manager
+from mik.app.core.collector import collector
+from mik.app.core.sharding import shard_coordinator
+from mik.app.core.adaptive import adaptive_polling
+from mik.app.core.alerts import alert_evaluator
+from mik.app.database.ingest import metric_buffer
+from mik.app.database.partitions import metric_partitions
+from mik.app.database.chunks import metric_chunks
+from mik.app.database.rollups import metric_rollups
+from mik.app.core.mikrotik_async import AsyncCollector, async_collect_device_sample
+from mik.app.config import Config
+from mik.app.database.models import Metric, MetricPoint
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# Ứng dụng Flask cho context của các tác vụ nền, gán khi khởi tạo tác vụ
+app = None
+
+def save_sample(device, metrics):
+    """Persist one collected sample; returns True if the device was online"""
+    if metrics.get('status') != 'online':
+        logger.warning(f"Device {device.name} is offline, skipping metrics collection")
+        return False
+    
+    # Tốc độ interface tính từ chênh lệch bộ đếm so với lần poll trước
+    rates = interface_rate_metrics(device.id, metrics)
+    
+    # Trạng thái mới nhất cho các API xem trực tiếp, khỏi phải đọc lại router
+    remember_sample(device.id, metrics)
+    
+    if rates:
+        metrics['interface'] = rates
+    
+    # Số client lấy từ bảng đang theo dõi, không cần đọc lại router
+    clients = snapshot_from_store(device.id, ['wireless', 'dhcp', 'capsman'])
+    if clients:
+        metrics['clients'] = {
+            'wireless': len(clients['wireless']),
+            'dhcp': len(clients['dhcp']),
+            'capsman': len(clients['capsman'])
+        }
+    
+    timestamp = datetime.utcnow()
+    chunks = metric_chunks()
+    if chunks:
+        # Điểm được gom vào chunk nén của từng chuỗi, ghi xuống định kỳ
+        chunks.append(metric_rows(device.id, metrics, timestamp))
+    elif Config.INGEST_WRITE_BEHIND:
+        # Luồng ghi riêng gom mẫu của mọi worker thành các lô INSERT lớn
+        metric_buffer.add_sample(device.id, metrics, timestamp)
+    else:
+        # Save metrics to database
+        save_device_metrics(device.id, metrics, timestamp)
+    
+    if Config.METRICS_ROLLUPS:
+        # Cộng dồn vào các bucket 1m/5m/1h/1d, ghi xuống định kỳ
+        metric_rollups.add(metric_rows(device.id, metrics, timestamp))
+    return True
+
+def poll_interval():
+    """Seconds between collection ticks"""
+    return Config.ADAPTIVE_MIN_INTERVAL if Config.MONITORING_ADAPTIVE else Config.MONITORING_INTERVAL
+
+def observe_sample(device, metrics):
+    """Persist a sample, evaluate alert rules on it and let the adaptive policy pick the next interval"""
+    try:
+        return save_sample(device, metrics)
+    finally:
+        if alert_evaluator.enabled:
+            # Cảnh báo đánh giá ngay trên mẫu vừa thu thập, không đọc lại router
+            alert_evaluator.observe(device, metrics)
+        if Config.MONITORING_ADAPTIVE:
+            adaptive_polling.observe(device.id, metrics)
+
+def poll_device(device):
+    """Collector task: poll one device and save its sample (worker thread)"""
+    with app.app_context():
+        return observe_sample(device, collect_device_sample(device))
+
 def collect_metrics():
     """Collect metrics from all devices"""
     with app.app_context():
         try:
             logger.debug("Starting metrics collection task")
-            devices = get_all_devices()
+            devices = get_devices_for_polling()
+            
+            if Config.COLLECTOR_SHARDING:
+                # Chỉ poll thiết bị thuộc các shard mà node này đang giữ lease
+                devices = shard_coordinator.filter_devices(devices)
+            
+            if Config.MONITORING_SUBSCRIPTIONS:
+                # Thêm/bớt các kết nối listen theo danh sách thiết bị hiện tại
+                subscription_manager.sync(devices)
+            
+            if Config.MONITORING_ADAPTIVE:
+                # Chỉ poll thiết bị đã đến hạn theo chu kỳ riêng của nó
+                devices = adaptive_polling.due(devices)
+            
+            if not Config.MONITORING_ASYNC:
+                # Dàn đều thiết bị trong chu kỳ, poll bằng pool worker giới hạn
+                collector.run_cycle(devices, poll_device)
+                logger.debug("Metrics collection task completed")
+                return
+            
+            # Poll song song toàn bộ thiết bị bằng client asyncio
+            window = poll_interval() * Config.COLLECTOR_SPREAD
+            results = AsyncCollector(fetch=async_collect_device_sample).run(devices, window)
             
             for device in devices:
                 try:
-                    # Get metrics from device
-                    metrics = get_device_metrics(device)
-                    
-                    # Save metrics to database
-                    if metrics.get('online', False):
-                        save_device_metrics(device.id, metrics)
-                    else:
-                        logger.warning(f"Device {device.name} is offline, skipping metrics collection")
+                    observe_sample(device, results.get(device.id, {'status': 'error'}))
                 except Exception as e:
                     logger.error(f"Error collecting metrics for device {device.name}: {str(e)}")
             
@@ -33,10 +129,20 @@ def collect_metrics():
         except Exception as e:
             logger.error(f"Error in metrics collection task: {str(e)}")
 
+def count_skipped_cycle(event):
+    """Scheduler listener: a collection run was dropped because the previous one is still running"""
+    if event.job_id == 'collect_metrics':
+        collector.skip_cycle()
+
 def schedule_metrics_collection():
     """Schedule periodic metrics collection"""
     try:
-        interval = Config.MONITORING_INTERVAL
+        interval = poll_interval()
+        # Các thiết bị được dàn đều trong mỗi nhịp thu thập
+        collector.interval = interval
+        
+        # APScheduler bỏ lượt chạy chồng lên lượt trước (max_instances=1); đếm vào thống kê của bộ thu thập
+        scheduler.add_listener(count_skipped_cycle, EVENT_JOB_MAX_INSTANCES)
         
         # Add job to scheduler
         scheduler.add_job(
@@ -51,28 +157,153 @@ def schedule_metrics_collection():
     except Exception as e:
         logger.error(f"Error scheduling metrics collection: {str(e)}")
 
+def refresh_adaptive_rules():
+    """Reload the alert thresholds adaptive polling keeps devices near"""
+    with app.app_context():
+        try:
+            if alert_evaluator.enabled:
+                # Dùng lại rule bộ đánh giá cảnh báo đã nạp, không truy vấn lại database
+                rules = alert_evaluator.rules()
+            else:
+                rules = get_all_alert_rules(enabled_only=True)
+            adaptive_polling.set_rules(rules)
+        except Exception as e:
+            logger.error(f"Error refreshing adaptive polling thresholds: {str(e)}")
+
+def renew_shard_leases():
+    """Heartbeat and renew this node's collector shard leases"""
+    with app.app_context():
+        shard_coordinator.renew()
+
+def flush_metric_rollups():
+    """Write the rollup buckets accumulated since the last flush"""
+    with app.app_context():
+        try:
+            written = metric_rollups.flush()
+            logger.debug(f"Flushed {written} metric rollup buckets")
+        except Exception as e:
+            logger.error(f"Error flushing metric rollups: {str(e)}")
+
+def flush_metric_chunks():
+    """Write the metric chunks that received points since the last flush"""
+    with app.app_context():
+        try:
+            written = metric_chunks().flush()
+            logger.debug(f"Flushed {written} metric chunks")
+        except Exception as e:
+            logger.error(f"Error flushing metric chunks: {str(e)}")
+
 def clear_old_metrics():
     """Clear old metrics data to prevent database bloat"""
+    if Config.COLLECTOR_SHARDING and not shard_coordinator.owns_shard(0):
+        # Chỉ node giữ shard 0 dọn dữ liệu, tránh xoá trùng từ mọi node
+        return
+    
     with app.app_context():
         try:
             # Get retention period from settings (default 30 days)
             retention_days = int(get_setting('metrics_retention_days', '30'))
             cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
             
+            partitions = metric_partitions()
+            if partitions:
+                # Xoá cả bảng phân vùng đã quá hạn thay vì DELETE từng dòng
+                dropped = partitions.drop_before(cutoff_date)
+                logger.info(f"Dropped {len(dropped)} metrics partitions older than {retention_days} days")
+            
+            chunks = metric_chunks()
+            if chunks:
+                pruned = chunks.prune(cutoff_date)
+                logger.info(f"Deleted {pruned} metric chunks older than {retention_days} days")
+            
             # Delete old metrics
             deleted = Metric.query.filter(Metric.timestamp < cutoff_date).delete()
+            deleted += MetricPoint.query.filter(MetricPoint.timestamp < cutoff_date).delete()
             db.session.commit()
             
             logger.info(f"Cleared {deleted} old metrics records older than {retention_days} days")
+            
+            if Config.METRICS_ROLLUPS:
+                # Mỗi tier có thời gian giữ riêng (ROLLUP_RETENTION)
+                pruned = metric_rollups.prune()
+                logger.info(f"Pruned metric rollups: {pruned}")
         except Exception as e:
             logger.error(f"Error clearing old metrics: {str(e)}")
             db.session.rollback()
 
+def evict_idle_connections_task():
+    """Close pooled RouterOS sessions that have been idle too long"""
+    try:
+        evicted = evict_idle_connections()
+        if evicted:
+            logger.debug(f"Closed {evicted} idle RouterOS API sessions")
+    except Exception as e:
+        logger.error(f"Error evicting idle connections: {str(e)}")
+
 def initialize_monitoring_tasks():
-    """Initialize all monitoring tasks"""
+    """Initialize all monitoring tasks (inside the application context)"""
+    global app
+    app = current_app._get_current_object()
+    
+    if Config.COLLECTOR_SHARDING:
+        # Nhận lease ngay để chu kỳ đầu tiên đã biết các shard của node này
+        renew_shard_leases()
+        scheduler.add_job(
+            func=renew_shard_leases,
+            trigger='interval',
+            seconds=shard_coordinator.renew_interval,
+            id='renew_shard_leases',
+            replace_existing=True
+        )
+    
+    if Config.MONITORING_ADAPTIVE:
+        # Ngưỡng cảnh báo được làm mới theo nhịp nạp lại rule, không phải mỗi chu kỳ thu thập
+        refresh_adaptive_rules()
+        scheduler.add_job(
+            func=refresh_adaptive_rules,
+            trigger='interval',
+            seconds=Config.ALERT_CHECK_INTERVAL,
+            id='refresh_adaptive_rules',
+            replace_existing=True
+        )
+    
     # Schedule metrics collection
     schedule_metrics_collection()
     
+    if Config.INGEST_WRITE_BEHIND:
+        metric_buffer.start(app)
+    
+    if Config.MONITORING_SUBSCRIPTIONS:
+        # Kết nối listen lâu dài; danh sách thiết bị được đồng bộ ở mỗi lần thu thập
+        subscription_manager.start(app)
+    
+    if metric_chunks():
+        scheduler.add_job(
+            func=flush_metric_chunks,
+            trigger='interval',
+            seconds=Config.CHUNK_FLUSH_INTERVAL,
+            id='flush_metric_chunks',
+            replace_existing=True
+        )
+    
+    if Config.METRICS_ROLLUPS:
+        scheduler.add_job(
+            func=flush_metric_rollups,
+            trigger='interval',
+            seconds=Config.ROLLUP_FLUSH_INTERVAL,
+            id='flush_metric_rollups',
+            replace_existing=True
+        )
+    
+    # Dọn các phiên API nhàn rỗi trong pool
+    scheduler.add_job(
+        func=evict_idle_connections_task,
+        trigger='interval',
+        seconds=Config.MIKROTIK_POOL_IDLE_TIMEOUT,
+        id='evict_idle_connections',
+        replace_existing=True
+    )
+    
     # Schedule old metrics cleanup (daily at 1 AM)
     scheduler.add_job(
         func=clear_old_metrics,
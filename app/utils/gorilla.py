@@ -0,0 +1,206 @@
+"""
+Nén chuỗi thời gian kiểu Gorilla: delta-of-delta cho thời điểm, XOR cho giá trị float
+"""
+
+import struct
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tuỳ chọn: khi thiếu, decode trả về array.array
+    np = None
+
+_DOUBLE = struct.Struct('>d')
+_UINT64 = struct.Struct('>Q')
+
+# (số bit tiền tố, giá trị tiền tố, số bit dữ liệu) cho delta-of-delta khác 0
+_DOD_CLASSES = ((2, 0b10, 7), (3, 0b110, 9), (4, 0b1110, 12))
+_DOD_LARGE = 64
+
+
+def _float_bits(value):
+    return _UINT64.unpack(_DOUBLE.pack(value))[0]
+
+
+def _bits_float(bits):
+    return _DOUBLE.unpack(_UINT64.pack(bits))[0]
+
+
+class BitWriter:
+    """Append-only bit stream, most significant bit first"""
+
+    __slots__ = ('_out', '_acc', '_bits')
+
+    def __init__(self):
+        self._out = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value, bits):
+        self._acc = (self._acc << bits) | value
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self._out.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self):
+        if self._bits:
+            return bytes(self._out) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self._out)
+
+
+class BitReader:
+    """Reads a stream written by BitWriter"""
+
+    __slots__ = ('_data', '_pos', '_acc', '_bits')
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        self._acc = 0
+        self._bits = 0
+
+    def read(self, bits):
+        while self._bits < bits:
+            self._acc = (self._acc << 8) | self._data[self._pos]
+            self._pos += 1
+            self._bits += 8
+        self._bits -= bits
+        value = self._acc >> self._bits
+        self._acc &= (1 << self._bits) - 1
+        return value
+
+
+def encode(timestamps, values):
+    """Compress a series into one blob
+
+    Layout: point count (32 bits), first timestamp (64 bits), first value
+    (64 bits), then per point the delta-of-delta of the timestamp ('0',
+    '10'+7, '110'+9, '1110'+12 or '1111'+64 bits) and the XOR of the value
+    with the previous one ('0' if equal, '10' + meaningful bits inside the
+    previous leading/trailing zero window, else '11' + 5 bits leading
+    zeros + 6 bits length + meaningful bits).
+
+    Args:
+        timestamps (sequence): Integer timestamps (e.g. epoch seconds), ascending
+        values (sequence): Floats
+
+    Returns:
+        bytes
+    """
+    count = len(timestamps)
+    writer = BitWriter()
+    writer.write(count, 32)
+    if not count:
+        return writer.getvalue()
+
+    previous_time = int(timestamps[0])
+    previous_bits = _float_bits(float(values[0]))
+    writer.write(previous_time & 0xFFFFFFFFFFFFFFFF, 64)
+    writer.write(previous_bits, 64)
+    previous_delta = 0
+    leading, trailing = 65, 0
+
+    for index in range(1, count):
+        timestamp = int(timestamps[index])
+        delta = timestamp - previous_time
+        dod = delta - previous_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix_bits, prefix, bits in _DOD_CLASSES:
+                if -(1 << (bits - 1)) <= dod < (1 << (bits - 1)):
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod & ((1 << bits) - 1), bits)
+                    break
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod & 0xFFFFFFFFFFFFFFFF, _DOD_LARGE)
+        previous_time, previous_delta = timestamp, delta
+
+        bits = _float_bits(float(values[index]))
+        xor = bits ^ previous_bits
+        previous_bits = bits
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if new_leading >= leading and new_trailing >= trailing:
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            meaningful = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(meaningful - 1, 6)
+            writer.write(xor >> trailing, meaningful)
+
+    return writer.getvalue()
+
+
+def _signed(value, bits):
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+def decode_into(data, timestamps, values):
+    """Decode a blob, appending to two array-like outputs
+
+    Returns:
+        Number of points decoded
+    """
+    reader = BitReader(data)
+    count = reader.read(32)
+    if not count:
+        return 0
+
+    timestamp = _signed(reader.read(64), 64)
+    bits = reader.read(64)
+    timestamps.append(timestamp)
+    values.append(_bits_float(bits))
+    delta = 0
+    leading = trailing = 0
+
+    for _ in range(count - 1):
+        if reader.read(1):
+            if not reader.read(1):
+                dod = _signed(reader.read(7), 7)
+            elif not reader.read(1):
+                dod = _signed(reader.read(9), 9)
+            elif not reader.read(1):
+                dod = _signed(reader.read(12), 12)
+            else:
+                dod = _signed(reader.read(_DOD_LARGE), _DOD_LARGE)
+            delta += dod
+        timestamp += delta
+        timestamps.append(timestamp)
+
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                trailing = 64 - leading - (reader.read(6) + 1)
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        values.append(_bits_float(bits))
+
+    return count
+
+
+def decode(data):
+    """Decode a blob into (timestamps, values)
+
+    Returns NumPy arrays (int64, float64) when NumPy is installed, else
+    array.array('q') and array.array('d'). The arrays are filled by the
+    decoder and wrapped without copying.
+    """
+    timestamps, values = array('q'), array('d')
+    decode_into(data, timestamps, values)
+    return as_arrays(timestamps, values)
+
+
+def as_arrays(timestamps, values):
+    """Wrap array.array buffers as NumPy arrays if NumPy is available"""
+    if np is None:
+        return timestamps, values
+    return np.frombuffer(timestamps, dtype=np.int64), np.frombuffer(values, dtype=np.float64)
@@ -7,6 +7,8 @@ import base64
 import secrets
 import string
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -18,6 +20,14 @@ from flask_jwt_extended import create_access_token, create_refresh_token
 
 logger = logging.getLogger('mikrotik_monitor.security')
 
+# Cache khóa Fernet đã dẫn xuất: (nguồn khóa, Fernet)
+_cipher_cache = None
+_cipher_lock = threading.Lock()
+
+# Cache mật khẩu thiết bị đã giải mã (tùy chọn, giới hạn kích thước)
+_credential_cache = OrderedDict()
+_credential_lock = threading.Lock()
+
 def hash_password(password):
     """Generate a password hash for user authentication"""
     return generate_password_hash(password)
@@ -26,12 +36,40 @@ def verify_password(password, password_hash):
     """Verify a password against a hash for user authentication"""
     return check_password_hash(password_hash, password)
 
-def _get_encryption_key():
-    """Get encryption key from environment or generate one"""
+def _key_source():
+    """Current inputs of the key derivation (ENCRYPTION_KEY, SECRET_KEY)"""
     key = os.environ.get('ENCRYPTION_KEY')
+    if key:
+        return key, None
+    return None, current_app.config['SECRET_KEY']
+
+def _get_cipher():
+    """Get a Fernet cipher, deriving the key only when its source changed"""
+    global _cipher_cache
+    
+    source = _key_source()
+    cached = _cipher_cache
+    if cached is not None and cached[0] == source:
+        return cached[1]
+    
+    with _cipher_lock:
+        cached = _cipher_cache
+        if cached is not None and cached[0] == source:
+            return cached[1]
+        
+        cipher = Fernet(_get_encryption_key(*source))
+        if cached is not None:
+            # Khóa đã đổi: mật khẩu giải mã bằng khóa cũ không còn hợp lệ
+            clear_credential_cache()
+        _cipher_cache = (source, cipher)
+        return cipher
+
+def _get_encryption_key(key=None, secret_key=None):
+    """Get encryption key from environment or generate one"""
+    if key is None and secret_key is None:
+        key, secret_key = _key_source()
     if not key:
         # Use SECRET_KEY with a salt for encryption if no ENCRYPTION_KEY provided
-        secret_key = current_app.config['SECRET_KEY']
         if not secret_key:
             logger.error("No SECRET_KEY configured, using fallback (less secure)")
             secret_key = "mikrotik_monitor_default_key"  # Fallback, less secure
@@ -60,8 +98,7 @@ def encrypt_device_password(password):
         return ''
     
     try:
-        key = _get_encryption_key()
-        cipher = Fernet(key)
+        cipher = _get_cipher()
         encrypted = cipher.encrypt(password.encode())
         return f"enc:{encrypted.decode()}"
     except Exception as e:
@@ -78,15 +115,55 @@ def decrypt_device_password(encrypted_password):
         # Remove the prefix
         encrypted_data = encrypted_password[4:]
         
-        key = _get_encryption_key()
-        cipher = Fernet(key)
-        decrypted = cipher.decrypt(encrypted_data.encode())
-        return decrypted.decode()
+        cipher = _get_cipher()
+        
+        cached = _get_cached_credential(encrypted_password)
+        if cached is not None:
+            return cached
+        
+        decrypted = cipher.decrypt(encrypted_data.encode()).decode()
+        _cache_credential(encrypted_password, decrypted)
+        return decrypted
     except Exception as e:
         logger.error(f"Error decrypting password: {e}")
         # Return a marker so calling code can detect error
         return "dec_failed"
 
+def _credential_cache_size():
+    """Maximum number of cached decrypted passwords (0 disables the cache)"""
+    try:
+        return int(current_app.config.get('CREDENTIAL_CACHE_SIZE', 0))
+    except RuntimeError:
+        # Ngoài application context
+        return 0
+
+def _get_cached_credential(encrypted_password):
+    with _credential_lock:
+        decrypted = _credential_cache.get(encrypted_password)
+        if decrypted is not None:
+            _credential_cache.move_to_end(encrypted_password)
+        return decrypted
+
+def _cache_credential(encrypted_password, decrypted):
+    max_size = _credential_cache_size()
+    if max_size <= 0:
+        return
+    with _credential_lock:
+        _credential_cache[encrypted_password] = decrypted
+        _credential_cache.move_to_end(encrypted_password)
+        while len(_credential_cache) > max_size:
+            _credential_cache.popitem(last=False)
+
+def forget_device_password(encrypted_password):
+    """Drop one decrypted password from the cache (device credentials changed)"""
+    with _credential_lock:
+        _credential_cache.pop(encrypted_password, None)
+
+def clear_credential_cache():
+    """Drop every cached decrypted password"""
+    with _credential_lock:
+        _credential_cache.clear()
+
 def generate_random_password(length=12):
     """Generate a secure random password"""
     alphabet = string.ascii_letters + string.digits + string.punctuation
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark: số lần poll và độ trễ phát hiện vượt ngưỡng của chu kỳ poll thích ứng so với chu kỳ cố định
+
+Mô phỏng (không kết nối router) một fleet gồm thiết bị nhàn rỗi, thiết bị có tải thay đổi
+chậm theo ngày và thiết bị có tải tăng đột biến; mọi thiết bị có rule cpu_load > 90. Chu kỳ thích ứng
+được chạy với giới hạn cho thiết bị có rule (ADAPTIVE_RULE_MAX_INTERVAL) và không giới hạn (chỉ trần
+chung), để thấy đánh đổi giữa số lần poll và cảnh báo bị lỡ hoặc trễ.
+
+Ví dụ:
+    python benchmarks/bench_adaptive_polling.py --devices 2000 --hours 6
+"""
+
+import os
+import sys
+import math
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mik.app.core.adaptive import AdaptivePolling
+
+THRESHOLD = 90.0
+
+
+class SimDevice:
+    """Synthetic CPU/memory/traffic trace of one device"""
+
+    def __init__(self, device_id, profile, rng, duration):
+        self.id = device_id
+        self.profile = profile
+        self.rng = rng
+        self.base_cpu = rng.uniform(2, 15) if profile == 'idle' else rng.uniform(20, 50)
+        self.base_bps = rng.uniform(1e4, 5e5) if profile == 'idle' else rng.uniform(5e6, 5e8)
+        self.phase = rng.uniform(0, 2 * math.pi)
+        self.spikes = []
+        if profile == 'bursty':
+            start = rng.uniform(0, 3600)
+            while start < duration:
+                self.spikes.append((start, start + rng.uniform(60, 900)))
+                start += rng.expovariate(1 / 3600.0)
+        elif profile == 'drifting':
+            # Tải tăng dần tới vượt ngưỡng một lần trong khoảng mô phỏng
+            peak = rng.uniform(0.3, 0.9) * duration
+            self.spikes.append((peak, peak + rng.uniform(600, 1800)))
+
+    def overloaded(self, now):
+        return any(start <= now < end for start, end in self.spikes)
+
+    def cpu(self, now):
+        daily = 10 * math.sin(2 * math.pi * now / 86400 + self.phase)
+        noise = self.rng.gauss(0, 0.5 if self.profile == 'idle' else 2)
+        if self.profile == 'drifting' and self.spikes:
+            start, end = self.spikes[0]
+            if start - 1800 <= now < start:
+                # Đi lên đều trong 30 phút trước khi vượt ngưỡng
+                return self.base_cpu + (THRESHOLD + 1 - self.base_cpu) * (now - start + 1800) / 1800 + noise
+        if self.overloaded(now):
+            return self.rng.uniform(THRESHOLD + 1, 100)
+        return max(0.0, min(THRESHOLD - 5, self.base_cpu + daily + noise))
+
+    def sample(self, now):
+        bps = self.base_bps * (1 + 0.3 * math.sin(2 * math.pi * now / 86400 + self.phase))
+        if self.profile != 'idle':
+            bps *= self.rng.uniform(0.8, 1.2)
+        return {
+            'status': 'online',
+            'cpu': {'load': self.cpu(now)},
+            'memory': {'usage': 40.0},
+            'interface': {'ether1.rx_bps': bps, 'ether1.tx_bps': bps / 4}
+        }
+
+
+def simulate(devices, duration, tick, policy=None, interval=None):
+    polls = 0
+    detected = {}
+    for now in range(0, int(duration), int(tick)):
+        if policy is not None:
+            due = policy.due(devices, now)
+        else:
+            due = [device for device in devices if now % interval == 0]
+        for device in due:
+            polls += 1
+            sample = device.sample(now)
+            if policy is not None:
+                policy.observe(device.id, sample)
+            if sample['cpu']['load'] > THRESHOLD:
+                for start, end in device.spikes:
+                    if start <= now < end:
+                        detected.setdefault((device.id, start), now - start)
+    return polls, detected
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main(args):
+    duration = args.hours * 3600
+    rng = random.Random(args.seed)
+
+    def fleet():
+        rng.seed(args.seed)
+        profiles = ['idle'] * 80 + ['drifting'] * 15 + ['bursty'] * 5
+        return [SimDevice(i, profiles[i % len(profiles)], rng, duration) for i in range(args.devices)]
+
+    devices = fleet()
+    spikes = {(device.id, start) for device in devices for start, _ in device.spikes if start < duration}
+    fixed_polls, fixed_detected = simulate(devices, duration, args.floor, interval=args.interval)
+
+    rule_ceiling = args.rule_ceiling or args.interval
+    results = [(f"fixed {args.interval}s", fixed_polls, fixed_detected)]
+    for name, ceiling in ((f"adaptive {args.floor}-{rule_ceiling}s", rule_ceiling),
+                          (f"uncapped {args.floor}-{args.ceiling}s", args.ceiling)):
+        devices = fleet()
+        policy = AdaptivePolling(base=args.interval, floor=args.floor, ceiling=args.ceiling, margin=0.1,
+                                 rule_ceiling=ceiling)
+        policy.set_rules({'device_id': device.id, 'metric': 'cpu_load', 'condition': '>', 'threshold': THRESHOLD}
+                         for device in devices)
+        polls, detected = simulate(devices, duration, args.floor, policy=policy)
+        results.append((name, polls, detected, policy.stats()))
+
+    profiles = {device.id: device.profile for device in devices}
+    print(f"{args.devices} devices, {args.hours} h, {len(spikes)} threshold crossings")
+    print(f"{'policy':>22} {'polls':>10} {'crossings':>10} {'detected':>9} {'p50 delay':>10} {'p95 delay':>10}")
+    for name, polls, detected, *_ in results:
+        # Tải tăng dần (drifting) được báo trước bởi ngưỡng; tải đột biến (bursty) thì không
+        for profile in ('drifting', 'bursty'):
+            total = sum(1 for device_id, _ in spikes if profiles[device_id] == profile)
+            delays = [delay for (device_id, _), delay in detected.items() if profiles[device_id] == profile]
+            print(f"{name:>22} {polls:>10} {profile + ' ' + str(total):>10} {len(delays):>9} "
+                  f"{percentile(delays, 0.5):>9.0f}s {percentile(delays, 0.95):>9.0f}s")
+    for name, polls, _, stats in results[1:]:
+        print(f"{name}: poll volume {polls / fixed_polls:.0%} of fixed, intervals min {stats['min_interval']:.0f}s "
+              f"avg {stats['avg_interval']:.0f}s max {stats['max_interval']:.0f}s, reasons {stats['reasons']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--hours', type=float, default=6.0)
+    parser.add_argument('--interval', type=int, default=60, help='Fixed polling interval in seconds')
+    parser.add_argument('--floor', type=int, default=15, help='Adaptive floor (tick) in seconds')
+    parser.add_argument('--ceiling', type=int, default=300, help='Adaptive ceiling in seconds')
+    parser.add_argument('--rule-ceiling', type=int, help='Ceiling of devices with alert rules (default --interval)')
+    parser.add_argument('--seed', type=int, default=1)
+    main(parser.parse_args())
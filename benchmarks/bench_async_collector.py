@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark: số lần poll mỗi giây của AsyncCollector với router giả lập
+
+Ví dụ:
+    python benchmarks/bench_async_collector.py --devices 2000 --concurrency 1,50,500 --latency 20
+    python benchmarks/bench_async_collector.py --devices 1000 --loss 0.02 --offline 0.05 --tls
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_router import FakeFleet
+from mik.app.core.mikrotik import circuit_breaker
+from mik.app.core.mikrotik_async import AsyncCollector
+
+
+async def run(args):
+    fleet = FakeFleet(args.devices, latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+                      loss=args.loss, offline=args.offline, tls=args.tls)
+    await fleet.start()
+    devices = fleet.devices()
+
+    print(f"{'concurrency':>12} {'devices':>8} {'online':>7} {'seconds':>8} {'polls/s':>9}")
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        # Mỗi lượt đo bắt đầu với circuit breaker sạch
+        circuit_breaker.reset()
+        collector = AsyncCollector(concurrency=concurrency)
+        started = time.perf_counter()
+        results = await collector.poll(devices)
+        elapsed = time.perf_counter() - started
+        online = sum(1 for r in results.values() if r.get('status') == 'online')
+        print(f"{concurrency:>12} {len(devices):>8} {online:>7} {elapsed:>8.2f} {len(devices) / elapsed:>9.1f}")
+
+    await fleet.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--concurrency', default='1,10,100,500')
+    parser.add_argument('--latency', type=float, default=10.0, help='Per-command latency of the fake router in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability of a retransmission delay per reply')
+    parser.add_argument('--offline', type=float, default=0.0, help='Fraction of unreachable routers')
+    parser.add_argument('--tls', action='store_true', help='Connect over API-SSL')
+    asyncio.run(run(parser.parse_args()))
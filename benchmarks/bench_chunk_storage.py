@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dung lượng đĩa và tốc độ đọc theo khoảng thời gian của metrics dạng dòng so với chunk nén Gorilla
+
+Sinh dữ liệu giống bộ thu thập thật (cpu/memory/disk, uptime và tốc độ interface tính từ bộ đếm,
+mỗi thiết bị poll theo chu kỳ có lệch vài trăm ms), ghi vào hai database SQLite tạm,
+VACUUM rồi so sánh số byte trên mỗi điểm và thời gian đọc.
+
+Ví dụ:
+    python benchmarks/bench_chunk_storage.py --devices 10 --days 2 --interfaces 4
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from mik.app import db
+from mik.app.database.models import Metric
+from mik.app.database.crud import metric_rows
+from mik.app.database.chunks import MetricChunkStore
+
+RATES = ('rx_bps', 'tx_bps', 'rx_pps', 'tx_pps')
+
+
+def generate(rng, device_id, start, samples, interval, interfaces):
+    """Rows of one device, oldest first"""
+    total_memory, total_disk = 256 << 20, 128 << 20
+    load, free_memory, free_disk = rng.randint(1, 20), total_memory // 2, total_disk // 3
+    counters = {f'ether{index + 1}': [0, 0, 0, 0] for index in range(interfaces)}
+    speeds = {name: rng.uniform(1e5, 5e7) for name in counters}
+    offset = rng.uniform(0, interval)
+    uptime = rng.randint(3600, 10 ** 7)
+    previous = None
+    rows = []
+    for index in range(samples):
+        # Thời điểm poll lệch ngẫu nhiên quanh nhịp của thiết bị
+        timestamp = start + timedelta(seconds=index * interval + offset + rng.uniform(0, 0.5))
+        load = min(100, max(0, load + rng.randint(-3, 3)))
+        free_memory = min(total_memory, max(0, free_memory + rng.randint(-64, 64) * 4096))
+        if rng.random() < 0.01:
+            free_disk = max(0, free_disk - rng.randint(1, 16) * 4096)
+        sample = {
+            'cpu': {'load': load, 'cores': 4},
+            'memory': {'total': total_memory, 'free': free_memory,
+                       'usage': round((total_memory - free_memory) / total_memory * 100, 2)},
+            'disk': {'total': total_disk, 'free': free_disk,
+                     'usage': round((total_disk - free_disk) / total_disk * 100, 2)},
+            'system': {'uptime_seconds': uptime + index * interval},
+            'interface': {}
+        }
+        for name, counter in counters.items():
+            speeds[name] = max(0.0, speeds[name] * rng.uniform(0.8, 1.25))
+            bytes_sent = [int(speeds[name] * interval * rng.uniform(0.9, 1.1) / 8) for _ in range(2)]
+            counter[0] += bytes_sent[0]
+            counter[1] += bytes_sent[1]
+            counter[2] += bytes_sent[0] // 800
+            counter[3] += bytes_sent[1] // 800
+        if previous is not None:
+            elapsed = (timestamp - previous[0]).total_seconds()
+            for name, counter in counters.items():
+                before = previous[1][name]
+                sample['interface'][f'{name}.rx_bps'] = (counter[0] - before[0]) * 8 / elapsed
+                sample['interface'][f'{name}.tx_bps'] = (counter[1] - before[1]) * 8 / elapsed
+                sample['interface'][f'{name}.rx_pps'] = (counter[2] - before[2]) / elapsed
+                sample['interface'][f'{name}.tx_pps'] = (counter[3] - before[3]) / elapsed
+        previous = (timestamp, {name: list(counter) for name, counter in counters.items()})
+        rows.extend(metric_rows(device_id, sample, timestamp.replace(microsecond=0)))
+    return rows
+
+
+def create_app(path):
+    app = Flask('bench')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def vacuum_size(app, path):
+    with app.app_context():
+        db.session.remove()
+        with db.engine.connect() as connection:
+            connection.execute(text('VACUUM'))
+    return os.path.getsize(path)
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main(args):
+    rng = random.Random(1)
+    samples = int(args.days * 86400 / args.interval)
+    start = datetime(2026, 1, 1)
+    rows = []
+    for device_id in range(1, args.devices + 1):
+        rows.extend(generate(rng, device_id, start, samples, args.interval, args.interfaces))
+    workdir = tempfile.mkdtemp(prefix='bench_chunks_')
+    print(f"{args.devices} devices x {args.days} days every {args.interval}s: {len(rows)} points")
+
+    # Một dòng cho mỗi giá trị (cách lưu mặc định)
+    rows_path = os.path.join(workdir, 'rows.db')
+    rows_app = create_app(rows_path)
+    started = time.perf_counter()
+    with rows_app.app_context():
+        for offset in range(0, len(rows), 50000):
+            db.session.execute(Metric.__table__.insert(), rows[offset:offset + 50000])
+        db.session.commit()
+    rows_write = time.perf_counter() - started
+    rows_size = vacuum_size(rows_app, rows_path)
+
+    # Chunk nén theo chuỗi
+    chunks_path = os.path.join(workdir, 'chunks.db')
+    chunks_app = create_app(chunks_path)
+    store = MetricChunkStore(chunk_seconds=args.chunk_seconds)
+    started = time.perf_counter()
+    with chunks_app.app_context():
+        store.append(rows)
+        store.flush(now=start + timedelta(days=args.days + 1))
+    chunks_write = time.perf_counter() - started
+    chunks_size = vacuum_size(chunks_app, chunks_path)
+
+    print(f"{'storage':>8} {'bytes':>12} {'bytes/point':>12} {'write s':>8}")
+    print(f"{'rows':>8} {rows_size:>12} {rows_size / len(rows):>12.2f} {rows_write:>8.2f}")
+    print(f"{'chunks':>8} {chunks_size:>12} {chunks_size / len(rows):>12.2f} {chunks_write:>8.2f}")
+    print(f"disk ratio {rows_size / chunks_size:.1f}x")
+
+    # Bytes/điểm của từng nhóm metric, đọc trực tiếp từ các chunk
+    with chunks_app.app_context():
+        groups = {}
+        for metric_type, metric_name, count, size in db.session.execute(text(
+                'SELECT metric_type, metric_name, count, length(data) FROM metric_chunks')):
+            group = 'interface.' + metric_name.split('.')[-1] if metric_type == 'interface' else metric_type
+            totals = groups.setdefault(group, [0, 0])
+            totals[0] += count
+            totals[1] += size
+    print('blob bytes/point: ' + ', '.join(
+        f"{group} {size / count:.2f}" for group, (count, size) in sorted(groups.items())))
+
+    # Đọc một chuỗi trong toàn bộ khoảng thời gian, rồi mọi metric của một thiết bị trong 1 giờ
+    end = start + timedelta(days=args.days)
+    scans = (
+        ('1 series, all days', dict(metric_type='interface', metric_name='ether1.rx_bps',
+                                    start_time=start, end_time=end)),
+        ('1 device, 1 hour', dict(start_time=end - timedelta(hours=1), end_time=end)),
+    )
+    print(f"{'scan':>20} {'points':>8} {'rows ms':>9} {'chunks ms':>10} {'arrays ms':>10}")
+    for label, filters in scans:
+        device_id = args.devices // 2 + 1
+
+        def read_rows():
+            with rows_app.app_context():
+                query = Metric.query.filter(Metric.device_id == device_id,
+                                            Metric.timestamp >= filters['start_time'],
+                                            Metric.timestamp <= filters['end_time'])
+                if 'metric_type' in filters:
+                    query = query.filter_by(metric_type=filters['metric_type'], metric_name=filters['metric_name'])
+                return [metric.to_dict() for metric in query.order_by(Metric.timestamp.desc())]
+
+        def read_chunks():
+            with chunks_app.app_context():
+                return store.query(device_id, limit=None, **filters)
+
+        found, rows_time = timed(read_rows, args.repeat)
+        decoded, chunks_time = timed(read_chunks, args.repeat)
+        assert len(found) == len(decoded), (len(found), len(decoded))
+        arrays_ms = '-'
+        if 'metric_type' in filters:
+            def read_arrays():
+                with chunks_app.app_context():
+                    return store.arrays(device_id, **filters)
+            _, arrays_time = timed(read_arrays, args.repeat)
+            arrays_ms = f"{arrays_time * 1000:.1f}"
+        print(f"{label:>20} {len(found):>8} {rows_time * 1000:>9.1f} {chunks_time * 1000:>10.1f} {arrays_ms:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--days', type=float, default=2)
+    parser.add_argument('--interval', type=int, default=30, help='Seconds between polls')
+    parser.add_argument('--interfaces', type=int, default=4, help='Interfaces per device (4 rates each)')
+    parser.add_argument('--chunk-seconds', type=int, default=7200)
+    parser.add_argument('--repeat', type=int, default=3)
+    main(parser.parse_args())
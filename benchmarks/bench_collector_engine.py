@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: một chu kỳ CollectorEngine (poll đồng bộ bằng librouteros) trên fleet giả lập
+
+Ví dụ:
+    python benchmarks/bench_collector_engine.py --devices 5000 --interval 60 --workers 50 --latency 20
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+from fake_router import FakeFleet, _raise_file_limit
+from mik.app.core.collector import CollectorEngine
+from mik.app.core.mikrotik import collect_device_sample, interface_rate_metrics
+
+
+def start_fleet(args):
+    fleet = FakeFleet(args.devices, latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+                      loss=args.loss, offline=args.offline)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(fleet.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return fleet
+
+
+def main(args):
+    _raise_file_limit()
+    fleet = start_fleet(args)
+    devices = fleet.devices()
+    app = Flask('bench')
+
+    def task(device):
+        with app.app_context():
+            sample = collect_device_sample(device)
+            if sample.get('status') != 'online':
+                return False
+            interface_rate_metrics(device.id, sample)
+            return True
+
+    engine = CollectorEngine(workers=args.workers, interval=args.interval, spread=args.spread)
+    print(f"{'cycle':>6} {'devices':>8} {'ok':>6} {'seconds':>8} {'max lag':>8} {'avg lag':>8} {'overrun':>8}")
+    for cycle_number in range(1, args.cycles + 1):
+        cycle = engine.run_cycle(devices, task)
+        print(f"{cycle_number:>6} {cycle['devices']:>8} {cycle['ok']:>6} {cycle['duration']:>8.1f} "
+              f"{cycle['max_lag']:>8.3f} {cycle['avg_lag']:>8.3f} {str(cycle['overrun']):>8}")
+    engine.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=5000)
+    parser.add_argument('--interval', type=float, default=60.0, help='Collection interval in seconds')
+    parser.add_argument('--spread', type=float, default=0.8, help='Fraction of the interval used to spread devices')
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--cycles', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=20.0, help='Per-command latency of the fake router in ms')
+    parser.add_argument('--jitter', type=float, default=5.0, help='Extra random latency in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability of a retransmission delay per reply')
+    parser.add_argument('--offline', type=float, default=0.0, help='Fraction of unreachable routers')
+    main(parser.parse_args())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chi phí giải mã mật khẩu thiết bị cho mỗi kết nối
+
+So sánh dẫn xuất khóa PBKDF2 mỗi lần (trước đây) với cache khóa Fernet
+và cache mật khẩu đã giải mã.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from cryptography.fernet import Fernet
+
+from mik.app.utils import security
+
+
+def timed(label, func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call = (time.perf_counter() - started) / iterations
+    print(f"{label:<40} {per_call * 1000:>10.3f} ms/connection")
+    return per_call
+
+
+def main(args):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench-secret'
+    os.environ.pop('ENCRYPTION_KEY', None)
+
+    with app.app_context():
+        token = security.encrypt_device_password('router-password')
+
+        def uncached():
+            # Hành vi cũ: dẫn xuất khóa PBKDF2 cho mỗi lần giải mã
+            Fernet(security._get_encryption_key()).decrypt(token[4:].encode())
+
+        app.config['CREDENTIAL_CACHE_SIZE'] = 0
+        before = timed('PBKDF2 on every call (old)', uncached, args.slow_iterations)
+        key_cached = timed('cached Fernet key', lambda: security.decrypt_device_password(token), args.iterations)
+
+        app.config['CREDENTIAL_CACHE_SIZE'] = 1024
+        security.decrypt_device_password(token)
+        both = timed('cached key + cached credential', lambda: security.decrypt_device_password(token), args.iterations)
+
+        print(f"\nspeedup: {before / key_cached:,.0f}x (key cache), {before / both:,.0f}x (key + credential cache)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--slow-iterations', type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tốc độ ghi metrics (dòng/giây) của save_device_metrics so với bộ đệm write-behind
+
+Nhiều worker cùng ghi các mẫu giống mẫu thu thập thật (cpu/memory/disk và tốc độ interface)
+vào một database SQLite tạm hoặc database chỉ định bằng --database.
+
+Ví dụ:
+    python benchmarks/bench_ingest.py --samples 5000 --workers 16 --interfaces 8
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+
+from mik.app import db
+from mik.app.database.models import Metric
+from mik.app.database.crud import save_device_metrics
+from mik.app.database.ingest import MetricBuffer
+
+
+def make_sample(rng, interfaces):
+    sample = {
+        'status': 'online',
+        'cpu': {'load': rng.randint(0, 100), 'cores': 4},
+        'memory': {'total': 1 << 30, 'free': rng.randint(0, 1 << 30), 'usage': rng.uniform(0, 100)},
+        'disk': {'total': 1 << 27, 'free': rng.randint(0, 1 << 27), 'usage': rng.uniform(0, 100)},
+        'interface': {}
+    }
+    for index in range(interfaces):
+        for rate in ('rx_bps', 'tx_bps', 'rx_pps', 'tx_pps'):
+            sample['interface'][f'ether{index + 1}.{rate}'] = rng.uniform(0, 1e9)
+    return sample
+
+
+def create_app(database):
+    app = Flask('bench')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}} if database.startswith('sqlite') else {}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def run_sync(app, samples, workers):
+    def write(item):
+        device_id, sample = item
+        with app.app_context():
+            return save_device_metrics(device_id, sample)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = sum(pool.map(write, samples))
+    return rows, time.perf_counter() - started, None
+
+
+def run_buffered(app, samples, workers, batch_size, flush_interval):
+    buffer = MetricBuffer(batch_size=batch_size, flush_interval=flush_interval, max_pending=10 ** 7)
+    buffer.start(app)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = sum(pool.map(lambda item: buffer.add_sample(*item), samples))
+    enqueued = time.perf_counter() - started
+    buffer.flush(timeout=600)
+    elapsed = time.perf_counter() - started
+    stats = buffer.stats()
+    buffer.stop()
+    stats['enqueue_seconds'] = enqueued
+    return rows, elapsed, stats
+
+
+def count_rows(app):
+    with app.app_context():
+        return db.session.query(Metric).count()
+
+
+def main(args):
+    # Cảnh báo truy vấn chậm của từng lần commit làm rối kết quả
+    logging.getLogger('mikrotik_monitor.crud').setLevel(logging.ERROR)
+    rng = random.Random(1)
+    samples = [(index % args.devices + 1, make_sample(rng, args.interfaces)) for index in range(args.samples)]
+    workdir = tempfile.mkdtemp(prefix='bench_ingest_')
+
+    print(f"{args.samples} samples x {len(next(iter(samples))[1]['interface']) + 8} values, {args.workers} workers")
+    print(f"{'path':>14} {'rows':>9} {'seconds':>8} {'rows/s':>10} {'batches':>8} {'avg flush':>10} {'max depth':>10}")
+    for name in ('sync', 'write-behind'):
+        database = args.database or f"sqlite:///{os.path.join(workdir, name + '.db')}"
+        app = create_app(database)
+        before = count_rows(app)
+        if name == 'sync':
+            rows, elapsed, stats = run_sync(app, samples, args.workers)
+        else:
+            rows, elapsed, stats = run_buffered(app, samples, args.workers, args.batch_size, args.flush_interval)
+        stored = count_rows(app) - before
+        extra = (f"{stats['batches']:>8} {stats['avg_flush_seconds'] * 1000:>8.1f}ms {stats['max_queue_depth']:>10}"
+                 if stats else f"{args.samples:>8} {'-':>10} {'-':>10}")
+        print(f"{name:>14} {stored:>9} {elapsed:>8.2f} {rows / elapsed:>10.0f} {extra}")
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=5000, help='Samples (one per device poll)')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--interfaces', type=int, default=8, help='Interfaces per sample (4 rates each)')
+    parser.add_argument('--workers', type=int, default=16, help='Concurrent collector workers')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--flush-interval', type=float, default=1.0)
+    parser.add_argument('--database', help='SQLAlchemy URI (default: temporary SQLite file)')
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: đọc nhiều bảng tuần tự so với gửi đồng thời có .tag trên một kết nối
+
+Ví dụ:
+    python benchmarks/bench_pipelining.py --latency 20 --repeat 20
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from librouteros import connect
+
+from fake_router import FakeRouter
+from mik.app.core.mikrotik import SNAPSHOT_SECTIONS, VPN_ACTIVE_PATHS
+from mik.app.core.routeros_query import TableQuery, run_pipelined
+from mik.app.core.vpn import VPN_CONFIG_QUERIES
+
+
+def workloads():
+    vpn = [TableQuery(path) for path in VPN_ACTIVE_PATHS.values()] + list(VPN_CONFIG_QUERIES.values())
+    return [
+        ('snapshot', list(SNAPSHOT_SECTIONS.values())),
+        ('clients', [SNAPSHOT_SECTIONS[s] for s in ('wireless', 'dhcp', 'capsman')]),
+        ('vpn stats', vpn),
+    ]
+
+
+def start_router(latency):
+    router = FakeRouter(latency=latency)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(router.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return router
+
+
+def serial(api, queries):
+    results = []
+    for query in queries:
+        try:
+            results.append(query.run(api))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def main(args):
+    router = start_router(args.latency / 1000.0)
+    api = connect(host='127.0.0.1', port=router.port, username='admin', password='admin')
+
+    print(f"{'workload':>10} {'tables':>7} {'serial ms':>10} {'pipelined ms':>13} {'speedup':>8}")
+    for name, queries in workloads():
+        timings = []
+        for read in (serial, run_pipelined):
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                read(api, queries)
+            timings.append((time.perf_counter() - started) / args.repeat * 1000)
+        print(f"{name:>10} {len(queries):>7} {timings[0]:>10.1f} {timings[1]:>13.1f} {timings[0] / timings[1]:>7.1f}x")
+
+    api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=20.0, help='Per-command latency of the fake router in ms')
+    parser.add_argument('--repeat', type=int, default=10)
+    main(parser.parse_args())
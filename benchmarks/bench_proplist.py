@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark: số byte truyền và thời gian phân tích khi đọc cả bảng so với
+dùng .proplist và query lọc trên router
+
+Ví dụ:
+    python benchmarks/bench_proplist.py --interfaces 8 --vlans 500 --leases 1000
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_router import FakeRouter, build_tables
+from mik.app.core.mikrotik import SNAPSHOT_SECTIONS
+from mik.app.core.mikrotik_async import AsyncRouterOSClient
+from mik.app.core.routeros_query import TableQuery
+
+
+def variants():
+    interfaces = SNAPSHOT_SECTIONS['interfaces']
+    dhcp = SNAPSHOT_SECTIONS['dhcp']
+    return [
+        ('interfaces', 'full table', TableQuery(interfaces.path)),
+        ('interfaces', 'proplist', interfaces),
+        ('interfaces', 'proplist + type filter', interfaces.filter(type=['ether', 'wlan', 'bridge'])),
+        ('dhcp', 'full table', TableQuery(dhcp.path)),
+        ('dhcp', 'proplist', dhcp),
+    ]
+
+
+async def run(args):
+    router = FakeRouter(tables=build_tables(args.interfaces, args.leases, args.vlans))
+    await router.start()
+    client = AsyncRouterOSClient('127.0.0.1', 'admin', 'admin', port=router.port)
+    await client.connect()
+
+    print(f"{'table':>10} {'variant':>24} {'rows':>6} {'bytes/read':>11} {'ms/read':>8}")
+    for table, name, query in variants():
+        rows = await query.run_async(client)
+        sent = router.bytes_sent
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            await query.run_async(client)
+        elapsed = time.perf_counter() - started
+        per_read = (router.bytes_sent - sent) / args.repeat
+        print(f"{table:>10} {name:>24} {len(rows):>6} {per_read:>11.0f} {elapsed / args.repeat * 1000:>8.2f}")
+
+    await client.close()
+    router.server.close()
+    await router.server.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--interfaces', type=int, default=8, help='Ethernet interfaces')
+    parser.add_argument('--vlans', type=int, default=500, help='VLAN interfaces (filtered out by type)')
+    parser.add_argument('--leases', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark: đánh giá rule cảnh báo cho cả fleet bằng CompiledRuleEngine (NumPy) so với RuleIndex theo từng mẫu
+
+Sinh N rule ngẫu nhiên (cpu/memory/disk và tốc độ interface, đủ 5 toán tử) cho D thiết bị, nạp một mẫu
+cho mỗi thiết bị rồi đo:
+  - index:       evaluate_sample() trên rule của từng thiết bị (đường đánh giá mặc định)
+  - vectorized:  CompiledRuleEngine.evaluate() một lượt cho mọi thiết bị
+  - reload:      nạp lại toàn bộ so với apply() một số rule thay đổi
+Trước đó kiểm tra cửa sổ của rule có duration đã xoá không được tạo lại sau retain() và update().
+Không cần database.
+
+Ví dụ:
+    python benchmarks/bench_rule_engine.py --rules 100000 --devices 5000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mik.app.core.alerts import IndexedRule, RuleIndex, evaluate_sample
+from mik.app.core.rule_engine import CompiledRuleEngine, OPERATORS
+from mik.app.core.windows import WindowStore
+
+
+def make_rules(rng, count, devices, interfaces, first_id=1):
+    metrics = ['cpu_load', 'memory_usage', 'disk_usage']
+    metrics += [f'interface.ether{index}.{rate}' for index in range(1, interfaces + 1)
+                for rate in ('rx_bps', 'tx_bps')]
+    rules = []
+    for rule_id in range(first_id, first_id + count):
+        condition = rng.choice(OPERATORS)
+        # Ngưỡng thực tế: đa số rule không vượt ngưỡng ở một mẫu bất kỳ
+        if condition in ('>', '>='):
+            threshold = rng.uniform(80, 100)
+        elif condition in ('<', '<='):
+            threshold = rng.uniform(0, 20)
+        else:
+            threshold = float(rng.randint(0, 100))
+        rules.append(IndexedRule({
+            'id': rule_id,
+            'name': f'rule{rule_id}',
+            'device_id': rng.randint(1, devices),
+            'metric': rng.choice(metrics),
+            'condition': condition,
+            'threshold': threshold
+        }))
+    return rules
+
+
+def make_sample(rng, interfaces):
+    return {
+        'status': 'online',
+        'cpu': {'load': rng.randint(0, 100)},
+        'memory': {'usage': rng.uniform(0, 100)},
+        'disk': {'usage': rng.uniform(0, 100)},
+        'interface': {f'ether{index}.{rate}': rng.uniform(0, 100)
+                      for index in range(1, interfaces + 1) for rate in ('rx_bps', 'tx_bps')}
+    }
+
+
+def best_of(repeat, setup, function):
+    best, result = None, None
+    for _ in range(repeat):
+        setup()
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def check_window_retention(rng, interfaces):
+    """Windows of a deleted duration rule stay dropped after retain() and the next update()"""
+    windows = WindowStore()
+    engine = CompiledRuleEngine(windows)
+    rules = [IndexedRule({'id': rule_id, 'name': metric, 'device_id': 1, 'metric': metric,
+                          'condition': '>', 'threshold': 90, 'duration': 60})
+             for rule_id, metric in enumerate(('max:cpu_load', 'memory_usage', 'min:disk_usage'), 1)]
+    engine.load(rules)
+    for now in range(0, 30, 10):
+        engine.update(1, make_sample(rng, interfaces), now)
+    assert windows.stats()['windows'] == 3, windows.stats()
+
+    # Xoá rule memory_usage rồi giữ lại cửa sổ của các rule còn lại, như AlertEvaluator.refresh()
+    engine.apply([], {1, 3})
+    windows.retain((rule.device_id, rule.series, rule.duration) for rule in engine.rules())
+    engine.update(1, make_sample(rng, interfaces), 30)
+    assert not windows.has(1, 'memory_usage', 60), "window of a deleted rule was recreated"
+    assert windows.stats()['windows'] == 2 and engine.stats()['metrics'] == 2, (windows.stats(), engine.stats())
+
+
+def main(args):
+    rng = random.Random(1)
+    check_window_retention(rng, args.interfaces)
+    rules = make_rules(rng, args.rules, args.devices, args.interfaces)
+    samples = {device_id: make_sample(rng, args.interfaces) for device_id in range(1, args.devices + 1)}
+    print(f"{args.rules} rules over {args.devices} devices, {3 + 2 * args.interfaces} metrics per device")
+
+    index = RuleIndex()
+    index.set_rules(rules)
+
+    def run_index():
+        fired = 0
+        for device_id, sample in samples.items():
+            fired += len(evaluate_sample(index.for_device(device_id), sample)[0])
+        return fired
+
+    engine = CompiledRuleEngine()
+    _, load_time = best_of(args.repeat, lambda: None, lambda: engine.load(rules))
+
+    def feed():
+        for device_id, sample in samples.items():
+            engine.update(device_id, sample)
+
+    fired_index, index_time = best_of(args.repeat, lambda: None, run_index)
+    fired_vector, vector_time = best_of(args.repeat, feed, lambda: len(engine.evaluate()))
+    _, feed_time = best_of(args.repeat, lambda: None, feed)
+    engine.evaluate()
+    assert fired_index == fired_vector, (fired_index, fired_vector)
+
+    print(f"{'engine':>12} {'ms/pass':>9} {'ns/rule':>8} {'fired':>7}")
+    print(f"{'index':>12} {index_time * 1000:>9.1f} {index_time / args.rules * 1e9:>8.0f} {fired_index:>7}")
+    print(f"{'vectorized':>12} {vector_time * 1000:>9.1f} {vector_time / args.rules * 1e9:>8.0f} {fired_vector:>7}")
+    print(f"sample ingest into value matrix: {feed_time / args.devices * 1e6:.1f} us/device")
+
+    # Thay đổi rule: sửa một phần, xoá một phần, thêm mới
+    changed = make_rules(rng, args.changes // 2, args.devices, args.interfaces)
+    added = make_rules(rng, args.changes - len(changed), args.devices, args.interfaces, first_id=args.rules + 1)
+    enabled_ids = {rule.id for rule in rules} | {rule.id for rule in added}
+    enabled_ids -= set(range(1, args.changes + 1, 7))
+    started = time.perf_counter()
+    removed, appended = engine.apply(changed + added, enabled_ids)
+    apply_time = time.perf_counter() - started
+    print(f"full load: {load_time * 1000:.1f} ms, incremental apply of {args.changes} changes "
+          f"({removed} removed, {appended} added): {apply_time * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rules', type=int, default=100000)
+    parser.add_argument('--devices', type=int, default=5000)
+    parser.add_argument('--interfaces', type=int, default=4, help='Interfaces per device (rx/tx rate metrics)')
+    parser.add_argument('--changes', type=int, default=100, help='Rules changed for the incremental reload')
+    parser.add_argument('--repeat', type=int, default=5)
+    main(parser.parse_args())
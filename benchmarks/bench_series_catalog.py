@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bảng metrics lưu chuỗi metric_type/metric_name so với metric_points chỉ lưu series_id
+
+Cùng một tập điểm (sinh như bench_chunk_storage) được ghi bằng insert_metric_rows vào hai database
+SQLite tạm: dạng dòng (có index ix_metrics_device_series_time) và dạng series. So sánh số byte trên
+mỗi điểm (sau VACUUM), tốc độ ghi và thời gian đọc lịch sử.
+
+Ví dụ:
+    python benchmarks/bench_series_catalog.py --devices 10 --days 2 --interfaces 4
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from bench_chunk_storage import generate, timed
+from mik.app import db
+from mik.app.config import Config
+from mik.app.database.crud import insert_metric_rows, get_metrics_for_device
+from mik.app.database.series import SeriesCatalog
+import mik.app.database.crud as crud
+
+LAYOUTS = ('rows', 'series')
+
+
+def create_app(path):
+    app = Flask('bench')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def main(args):
+    rng = random.Random(1)
+    samples = int(args.days * 86400 / args.interval)
+    start = datetime(2026, 1, 1)
+    rows = []
+    for device_id in range(1, args.devices + 1):
+        rows.extend(generate(rng, device_id, start, samples, args.interval, args.interfaces))
+    # Ghi theo thứ tự thời gian như bộ thu thập thật
+    rows.sort(key=lambda row: row['timestamp'])
+    workdir = tempfile.mkdtemp(prefix='bench_series_')
+    end = start + timedelta(days=args.days)
+    device_id = args.devices // 2 + 1
+    print(f"{args.devices} devices x {args.days} days every {args.interval}s: {len(rows)} points")
+    print(f"{'layout':>10} {'bytes/point':>12} {'rows/s':>9} {'series 1d ms':>13} {'device 1h ms':>13}")
+
+    for layout in LAYOUTS:
+        Config.METRICS_STORAGE = layout
+        # Cache rỗng cho mỗi lần chạy, như process vừa khởi động
+        crud.series_catalog = SeriesCatalog()
+        path = os.path.join(workdir, f'{layout}.db')
+        app = create_app(path)
+
+        started = time.perf_counter()
+        with app.app_context():
+            for offset in range(0, len(rows), args.batch_size):
+                insert_metric_rows(rows[offset:offset + args.batch_size])
+                db.session.commit()
+        write_rate = len(rows) / (time.perf_counter() - started)
+
+        with app.app_context():
+            db.session.remove()
+            with db.engine.connect() as connection:
+                connection.execute(text('VACUUM'))
+        size = os.path.getsize(path)
+
+        def read_series():
+            with app.app_context():
+                return get_metrics_for_device(device_id, 'interface', 'ether1.rx_bps',
+                                              end - timedelta(days=1), end, limit=None)
+
+        def read_device():
+            with app.app_context():
+                return get_metrics_for_device(device_id, start_time=end - timedelta(hours=1), end_time=end,
+                                              limit=None)
+
+        series_points, series_time = timed(read_series, args.repeat)
+        device_points, device_time = timed(read_device, args.repeat)
+        print(f"{layout:>10} {size / len(rows):>12.1f} {write_rate:>9.0f} "
+              f"{series_time * 1000:>10.1f} ({len(series_points)}) {device_time * 1000:>8.1f} ({len(device_points)})")
+        with app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--days', type=float, default=2)
+    parser.add_argument('--interval', type=int, default=30, help='Seconds between polls')
+    parser.add_argument('--interfaces', type=int, default=4, help='Interfaces per device (4 rates each)')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows per insert_metric_rows call')
+    parser.add_argument('--repeat', type=int, default=3)
+    main(parser.parse_args())
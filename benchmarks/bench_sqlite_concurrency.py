@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SQLite dưới tải đồng thời với cấu hình mặc định, chỉ WAL + pragma, và WAL + cổng ghi tuần tự
+
+Nhiều luồng ghi (tạo cảnh báo và cập nhật thiết bị như API, ghi lô metrics như bộ thu thập) chạy song song
+với nhiều luồng đọc (lịch sử metrics, danh sách cảnh báo) trong một khoảng thời gian cố định.
+Đếm số giao dịch thành công, số lỗi 'database is locked' và độ trễ p50/p99 của mỗi loại.
+
+Ví dụ:
+    python benchmarks/bench_sqlite_concurrency.py --writers 8 --readers 8 --seconds 10
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from mik.app import db
+from mik.app.config import Config
+from mik.app.database import crud
+from mik.app.database.models import Device, AlertRule, Metric
+from mik.app.database.engine import configure_engine, WriteGate
+
+PROFILES = ('default', 'wal', 'wal+gate')
+
+
+def create_app(path, profile, busy_timeout, threads):
+    app = Flask('bench')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    # Cấu hình mặc định: pysqlite chờ khoá tối đa 'timeout' giây; pool đủ kết nối cho mọi luồng
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': busy_timeout / 1000},
+                                               'pool_size': threads}
+    db.init_app(app)
+    gate = None
+    with app.app_context():
+        if profile != 'default':
+            gate = WriteGate()
+            config = {key: getattr(Config, key) for key in dir(Config) if key.startswith('SQLITE_')}
+            config.update(SQLITE_BUSY_TIMEOUT=busy_timeout, SQLITE_WRITE_GATE=profile == 'wal+gate')
+            configure_engine(db.engine, config, gate=gate)
+        db.create_all()
+    return app, gate
+
+
+def seed(app, devices, points):
+    rng = random.Random(1)
+    now = datetime.utcnow()
+    with app.app_context():
+        for device_id in range(1, devices + 1):
+            db.session.add(Device(id=device_id, name=f'router{device_id}', ip_address='192.0.2.1',
+                                  username='admin', password_hash='-'))
+            db.session.add(AlertRule(id=device_id, name='cpu', device_id=device_id, metric='cpu.load',
+                                     condition='>', threshold=90))
+        db.session.flush()
+        db.session.execute(Metric.__table__.insert(), [
+            {'device_id': rng.randint(1, devices), 'metric_type': 'cpu', 'metric_name': 'load',
+             'value': rng.uniform(0, 100), 'timestamp': now - timedelta(seconds=index)}
+            for index in range(points)
+        ])
+        db.session.commit()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(app, args):
+    stop = time.perf_counter() + args.seconds
+    results = {kind: {'ok': 0, 'locked': 0, 'latency': []} for kind in ('write', 'batch', 'read')}
+    lock = threading.Lock()
+
+    def record(kind, started, error=None):
+        elapsed = time.perf_counter() - started
+        with lock:
+            result = results[kind]
+            if error is None:
+                result['ok'] += 1
+                result['latency'].append(elapsed)
+            else:
+                result['locked'] += 1
+
+    def worker(kind, seed_value):
+        rng = random.Random(seed_value)
+        with app.app_context():
+            while time.perf_counter() < stop:
+                device_id = rng.randint(1, args.devices)
+                started = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        # Giao dịch nhỏ kiểu API: một cảnh báo và cập nhật thiết bị
+                        crud.create_alert(device_id, device_id, 'cpu.load', rng.uniform(90, 100), 90, '>')
+                        crud.update_device(device_id, notes=f'checked {started:.3f}')
+                    elif kind == 'batch':
+                        # Lô metrics kiểu bộ thu thập
+                        now = datetime.utcnow()
+                        db.session.execute(Metric.__table__.insert(), [
+                            {'device_id': device_id, 'metric_type': 'cpu', 'metric_name': 'load',
+                             'value': rng.uniform(0, 100), 'timestamp': now}
+                            for _ in range(args.batch_rows)
+                        ])
+                        db.session.commit()
+                    else:
+                        crud.get_metrics_for_device(device_id, 'cpu', 'load', limit=200)
+                        crud.get_recent_alerts(20)
+                    record(kind, started)
+                except OperationalError as e:
+                    db.session.rollback()
+                    if 'locked' not in str(e) and 'busy' not in str(e):
+                        raise
+                    record(kind, started, e)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=('write', index)) for index in range(args.writers)]
+    threads += [threading.Thread(target=worker, args=('batch', 100 + index)) for index in range(args.batch_writers)]
+    threads += [threading.Thread(target=worker, args=('read', 200 + index)) for index in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main(args):
+    # Log lỗi/truy vấn chậm của crud làm rối kết quả
+    logging.getLogger('mikrotik_monitor.crud').setLevel(logging.CRITICAL)
+    workdir = tempfile.mkdtemp(prefix='bench_sqlite_')
+    print(f"{args.writers} API writers, {args.batch_writers} batch writers ({args.batch_rows} rows), "
+          f"{args.readers} readers, {args.seconds}s, busy timeout {args.busy_timeout} ms")
+    print(f"{'profile':>9} {'kind':>6} {'ok/s':>8} {'locked':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for profile in args.profiles:
+        path = os.path.join(workdir, f"{profile.replace('+', '_')}.db")
+        threads = args.writers + args.batch_writers + args.readers
+        app, gate = create_app(path, profile, args.busy_timeout, threads)
+        seed(app, args.devices, args.points)
+        results = run(app, args)
+        for kind, result in results.items():
+            latency = result['latency']
+            print(f"{profile:>9} {kind:>6} {result['ok'] / args.seconds:>8.1f} {result['locked']:>7} "
+                  f"{percentile(latency, 0.5) * 1000:>8.1f} {percentile(latency, 0.99) * 1000:>8.1f} "
+                  f"{max(latency, default=0) * 1000:>8.1f}")
+        if gate is not None:
+            stats = gate.stats()
+            print(f"{'':>9} gate: {stats['writes']} writes, avg wait {stats['avg_wait'] * 1000:.1f} ms, "
+                  f"max queue {stats['max_queue']}")
+        with app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8, help='Threads doing small API-like transactions')
+    parser.add_argument('--batch-writers', type=int, default=2, help='Threads inserting metric batches')
+    parser.add_argument('--batch-rows', type=int, default=500)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--points', type=int, default=200000, help='Metric rows seeded before the run')
+    parser.add_argument('--busy-timeout', type=int, default=5000, help='ms (pysqlite default is 5000)')
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    main(parser.parse_args())
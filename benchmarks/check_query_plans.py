@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra kế hoạch truy vấn (EXPLAIN QUERY PLAN) của các truy vấn metrics/cảnh báo trên SQLite
+
+Mỗi trường hợp gọi hàm crud/store thật trên một database tạm có dữ liệu mẫu, ghi lại các câu SQL
+được phát ra rồi chạy EXPLAIN QUERY PLAN cho từng câu. Trường hợp bị coi là lỗi khi một bảng lớn
+bị quét toàn bộ, khi index mong đợi không được dùng, hoặc khi cần B-tree tạm để sắp xếp mà trường hợp
+không cho phép. Thoát với mã 1 nếu có lỗi, để chạy được trong CI sau mỗi thay đổi schema/truy vấn.
+
+Ví dụ:
+    python benchmarks/check_query_plans.py -v
+"""
+
+import os
+import re
+import sys
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from flask import Flask
+from sqlalchemy import event
+
+from mik.app import db
+from mik.app.config import Config
+from mik.app.database import crud
+from mik.app.database.models import Device, Alert, AlertRule, Metric
+from mik.app.database.schema import ensure_indexes
+from mik.app.database.rollups import MetricRollups
+from mik.app.database.chunks import MetricChunkStore
+from mik.app.database.partitions import MetricPartitions, partition_bounds
+
+# Bảng có thể lớn: không được quét toàn bộ
+LARGE_TABLES = ('metrics', 'metric_points', 'metric_series', 'metric_rollups', 'metric_chunks', 'alerts')
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+_SEARCH = re.compile(r'^SEARCH (\w+) USING (?:COVERING |INTEGER PRIMARY KEY)?(?:INDEX (\w+))?')
+
+NOW = datetime(2026, 1, 2)
+
+
+def rollback_after(function):
+    """Run a write for its SQL only"""
+    def run():
+        try:
+            function()
+        finally:
+            db.session.rollback()
+    return run
+
+
+# (tên, cấu hình, hàm, index mong đợi, cho phép B-tree tạm để sắp xếp)
+CASES = [
+    ('metrics: one series, time range', {},
+     lambda: crud.get_metrics_for_device(1, 'cpu', 'load', NOW - timedelta(hours=6), NOW),
+     {'ix_metrics_device_series_time'}, False),
+    ('metrics: one metric type', {},
+     lambda: crud.get_metrics_for_device(1, 'interface'),
+     {'ix_metrics_device_series_time'}, True),
+    ('metrics: whole device, time range', {},
+     lambda: crud.get_metrics_for_device(1, start_time=NOW - timedelta(hours=1), end_time=NOW),
+     {'ix_metrics_device_series_time'}, True),
+    ('metrics: retention delete', {},
+     rollback_after(lambda: Metric.query.filter(Metric.timestamp < NOW - timedelta(days=1)).delete()),
+     {'ix_metrics_timestamp'}, False),
+    ('series: one series, time range', {'METRICS_STORAGE': 'series'},
+     lambda: crud.get_metrics_for_device(1, 'cpu', 'load', NOW - timedelta(hours=6), NOW),
+     {'sqlite_autoindex_metric_series_1', 'ix_metric_points_series_time'}, False),
+    ('series: whole device, time range', {'METRICS_STORAGE': 'series'},
+     lambda: crud.get_metrics_for_device(1, start_time=NOW - timedelta(hours=1), end_time=NOW),
+     {'ix_metric_points_series_time'}, True),
+    ('alerts: recent', {},
+     lambda: crud.get_recent_alerts(20),
+     {'ix_alerts_timestamp'}, False),
+    ('alerts: unacknowledged count', {},
+     crud.get_alerts_count,
+     {'ix_alerts_acknowledged_time'}, False),
+    ('rollups: one series, time range', {},
+     lambda: MetricRollups().query(1, 300, 'cpu', 'load', NOW - timedelta(days=1), NOW),
+     {'sqlite_autoindex_metric_rollups_1'}, True),
+    ('rollups: retention delete', {},
+     rollback_after(lambda: MetricRollups().prune(now=NOW + timedelta(days=30))),
+     {'ix_metric_rollups_resolution_bucket'}, False),
+    ('chunks: one series, time range', {},
+     lambda: MetricChunkStore(7200).query(1, 'cpu', 'load', NOW - timedelta(hours=6), NOW),
+     {'sqlite_autoindex_metric_chunks_1'}, False),
+    ('chunks: retention delete', {},
+     rollback_after(lambda: MetricChunkStore(7200).prune(NOW - timedelta(hours=12))),
+     {'ix_metric_chunks_start'}, False),
+    ('partitions: one series, time range', {'METRICS_PARTITIONING': 'day'},
+     lambda: crud.get_metrics_for_device(1, 'cpu', 'load', NOW - timedelta(hours=6), NOW),
+     {'ix_metrics_d20260102_device_series_time', 'ix_metrics_d20260101_device_series_time'}, False),
+    ('partitions: whole device, time range', {'METRICS_PARTITIONING': 'day'},
+     lambda: crud.get_metrics_for_device(1, start_time=NOW - timedelta(hours=1), end_time=NOW),
+     {'ix_metrics_d20260102_device_series_time', 'ix_metrics_d20260101_device_series_time'}, True),
+    ('device delete', {},
+     rollback_after(lambda: crud.delete_device(2)),
+     {'sqlite_autoindex_metric_series_1', 'ix_metric_points_series_time', 'ix_metrics_device_series_time',
+      'ix_alerts_device_id'}, False),
+    ('alert rule delete', {},
+     rollback_after(lambda: crud.delete_alert_rule(1)),
+     {'ix_alerts_rule_id'}, False),
+]
+
+
+def seed(app, devices, samples):
+    rng = random.Random(1)
+    rows = []
+    for device_id in range(1, devices + 1):
+        for index in range(samples):
+            timestamp = NOW - timedelta(seconds=60 * index)
+            for metric_type, metric_name in (('cpu', 'load'), ('memory', 'usage'),
+                                             ('interface', 'ether1.rx_bps'), ('interface', 'ether1.tx_bps')):
+                rows.append({'device_id': device_id, 'metric_type': metric_type, 'metric_name': metric_name,
+                             'value': rng.uniform(0, 100), 'timestamp': timestamp})
+    with app.app_context():
+        for device_id in range(1, devices + 1):
+            db.session.add(Device(id=device_id, name=f'router{device_id}', ip_address='192.0.2.1',
+                                  username='admin', password_hash='-'))
+        db.session.add(AlertRule(id=1, name='cpu', device_id=1, metric='cpu.load', condition='>', threshold=90))
+        db.session.flush()
+        db.session.execute(Metric.__table__.insert(), rows)
+        db.session.commit()
+        Config.METRICS_STORAGE = 'series'
+        crud.insert_metric_rows(rows)
+        Config.METRICS_STORAGE = 'rows'
+        db.session.add_all([
+            Alert(rule_id=1, device_id=1, metric='cpu.load', value=95, threshold=90, condition='>',
+                  timestamp=NOW - timedelta(minutes=index), acknowledged=index % 3 == 0)
+            for index in range(2000)
+        ])
+        rollups = MetricRollups(tiers=[300])
+        rollups.add(rows)
+        rollups.flush()
+        chunks = MetricChunkStore(7200)
+        chunks.append(rows)
+        chunks.flush(now=NOW + timedelta(days=1))
+        MetricPartitions('day').insert(rows)
+        db.session.commit()
+
+
+def explain(connection, statement, parameters):
+    cursor = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    return [row[3] for row in cursor]
+
+
+def check(case, statements, plans):
+    """Problems of one case, as a list of messages"""
+    name, _, _, expected, allow_sort = case
+    problems = []
+    used = set()
+    for statement, plan in zip(statements, plans):
+        if 'sqlite_master' in statement:
+            # Đọc danh sách bảng (phân vùng) của SQLite, không phải truy vấn dữ liệu
+            continue
+        for line in plan:
+            scan, search = _SCAN.match(line), _SEARCH.match(line)
+            if scan:
+                table, index = scan.groups()
+                if index:
+                    used.add(index)
+                elif table in LARGE_TABLES or partition_bounds(table) or partition_bounds(table, 'points'):
+                    problems.append(f'full scan of {table}: {statement.strip()[:120]}')
+            elif search and search.group(2):
+                used.add(search.group(2))
+            elif 'TEMP B-TREE' in line and not allow_sort:
+                problems.append(f'{line}: {statement.strip()[:120]}')
+    for index in sorted(expected - used):
+        problems.append(f'index {index} not used')
+    return problems
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix='check_plans_')
+    app = Flask('check')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+    seed(app, args.devices, args.samples)
+
+    failures = 0
+    with app.app_context():
+        engine = db.engine
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(('SELECT', 'DELETE', 'UPDATE')):
+                captured.append((statement, parameters))
+
+        for case in CASES:
+            name, config, function = case[:3]
+            saved = {key: getattr(Config, key) for key in config}
+            for key, value in config.items():
+                setattr(Config, key, value)
+            captured.clear()
+            event.listen(engine, 'before_cursor_execute', capture)
+            try:
+                function()
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+                for key, value in saved.items():
+                    setattr(Config, key, value)
+
+            with engine.connect() as connection:
+                plans = [explain(connection, statement, parameters) for statement, parameters in captured]
+            problems = check(case, [statement for statement, _ in captured], plans)
+            failures += bool(problems)
+            print(f"{'FAIL' if problems else 'ok':>4}  {name}")
+            for problem in problems:
+                print(f"      {problem}")
+            if args.verbose or problems:
+                for (statement, _), plan in zip(captured, plans):
+                    print(f"      {' '.join(statement.split())[:100]}")
+                    for line in plan:
+                        print(f"        {line}")
+
+    print(f"{len(CASES) - failures}/{len(CASES)} query plans ok")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=300, help='Samples per device (one per minute)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print every statement and its plan')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""
+Bộ giả lập RouterOS API chạy trên localhost (dùng cho benchmark và kiểm thử tải)
+
+Mô phỏng một router hoặc cả một fleet hàng nghìn router ảo, có hỗ trợ TLS,
+độ trễ, mất gói và thiết bị offline.
+
+Ví dụ:
+    python benchmarks/fake_router.py --port 8728
+    python benchmarks/fake_router.py --fleet 2000 --latency 20 --jitter 5 --loss 0.01 \\
+        --offline 0.05 --tls --devices-json /tmp/fleet.json
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mik.app.core.routeros_protocol import encode_sentence, parse_sentence, read_sentence
+
+# Thời gian chờ truyền lại tối thiểu của TCP; một gói mất làm trả lời chậm ít nhất chừng này
+RETRANSMIT_DELAY = 0.2
+
+SYSTEM_RESOURCE = {
+    'uptime': '3d4h12m5s',
+    'version': '7.12 (stable)',
+    'build-time': 'Nov/17/2023 11:38:45',
+    'factory-software': '7.0.4',
+    'free-memory': '180000000',
+    'total-memory': '268435456',
+    'cpu': 'ARM64',
+    'cpu-count': '4',
+    'cpu-frequency': '1400',
+    'cpu-load': '12',
+    'free-hdd-space': '90000000',
+    'total-hdd-space': '134217728',
+    'write-sect-since-reboot': '5301',
+    'write-sect-total': '120934',
+    'architecture-name': 'arm64',
+    'board-name': 'RB5009UG+S+',
+    'platform': 'MikroTik',
+}
+
+BOARDS = ('RB5009UG+S+', 'CCR2004-1G-12S+2XS', 'hAP ax3', 'RB4011iGS+', 'CRS326-24G-2S+')
+
+
+def _interface(index, name, iface_type):
+    return {
+        '.id': f'*{index + 1:X}',
+        'name': name,
+        'default-name': name,
+        'type': iface_type,
+        'mtu': '1500',
+        'actual-mtu': '1500',
+        'l2mtu': '1592',
+        'max-l2mtu': '9578',
+        'mac-address': f'48:A9:8A:00:{index // 256:02X}:{index % 256:02X}',
+        'last-link-up-time': '2024-01-01 10:00:00',
+        'link-downs': '0',
+        'rx-byte': str(1000000 * (index + 1)),
+        'tx-byte': str(500000 * (index + 1)),
+        'rx-packet': str(1000 * (index + 1)),
+        'tx-packet': str(800 * (index + 1)),
+        'rx-drop': '0',
+        'tx-drop': '0',
+        'tx-queue-drop': '0',
+        'rx-error': '0',
+        'tx-error': '0',
+        'fp-rx-byte': str(1000000 * (index + 1)),
+        'fp-tx-byte': '0',
+        'fp-rx-packet': str(1000 * (index + 1)),
+        'fp-tx-packet': '0',
+        'running': 'true',
+        'slave': 'false',
+        'disabled': 'false',
+        'comment': '',
+    }
+
+
+def _vpn_session(index, service):
+    return {
+        '.id': f'*{index + 1:X}',
+        'name': f'{service}-user{index}',
+        'service': service,
+        'caller-id': f'203.0.113.{index % 250 + 1}',
+        'address': f'10.10.{index // 250}.{index % 250 + 2}',
+        'uptime': f'{index % 23}h{index % 59}m',
+        'encoding': 'MPPE128 stateless' if service == 'pptp' else 'cbc(aes) + hmac(sha1)',
+    }
+
+
+def build_tables(interface_count=8, lease_count=20, vlan_count=0, wireless_count=0, vpn_count=0):
+    """Tables served by a virtual router"""
+    interfaces = [_interface(i, f'ether{i + 1}', 'ether') for i in range(interface_count)]
+    interfaces.append(_interface(interface_count, 'bridge', 'bridge'))
+    for i in range(vlan_count):
+        interfaces.append(_interface(interface_count + 1 + i, f'vlan{i + 100}', 'vlan'))
+
+    leases = []
+    for i in range(lease_count):
+        leases.append({
+            '.id': f'*{i + 1:X}',
+            'address': f'192.168.88.{i % 240 + 10}',
+            'mac-address': f'AA:BB:CC:00:{i // 256:02X}:{i % 256:02X}',
+            'host-name': f'host-{i}',
+            'status': 'bound',
+            'expires-after': '9m',
+            'server': 'defconf',
+            'dhcp-option': '',
+            'active-address': f'192.168.88.{i % 240 + 10}',
+            'active-mac-address': f'AA:BB:CC:00:{i // 256:02X}:{i % 256:02X}',
+            'active-server': 'defconf',
+            'class-id': 'MSFT 5.0',
+            'last-seen': '1m',
+            'radius': 'false',
+            'dynamic': 'true',
+            'blocked': 'false',
+            'disabled': 'false',
+        })
+
+    registrations = []
+    for i in range(wireless_count):
+        registrations.append({
+            '.id': f'*{i + 1:X}',
+            'interface': 'wlan1',
+            'mac-address': f'DE:AD:BE:EF:{i // 256:02X}:{i % 256:02X}',
+            'signal-strength': f'-{50 + i % 30}dBm@5GHz',
+            'tx-rate': '866.6Mbps-80MHz/2S/SGI',
+            'rx-rate': '650Mbps-80MHz/2S',
+            'uptime': f'{i % 12}h{i % 60}m',
+        })
+
+    vpn = {service: [_vpn_session(i, service) for i in range(vpn_count) if i % 3 == n]
+           for n, service in enumerate(('pptp', 'l2tp', 'sstp'))}
+
+    return {
+        '/system/resource/print': [dict(SYSTEM_RESOURCE)],
+        '/system/identity/print': [{'name': 'fake-router'}],
+        '/interface/print': interfaces,
+        '/ip/dhcp-server/lease/print': leases,
+        '/interface/wireless/registration-table/print': registrations,
+        '/caps-man/registration-table/print': [],
+        '/interface/pptp-server/active/print': vpn['pptp'],
+        '/interface/l2tp-server/active/print': vpn['l2tp'],
+        '/interface/sstp-server/active/print': vpn['sstp'],
+        '/interface/ovpn-server/active/print': [],
+        '/ip/ipsec/active-peers/print': [],
+        '/interface/pptp-server/server/print': [{'enabled': 'false', 'max-mtu': '1450', 'max-mru': '1450',
+                                                 'authentication': 'mschap1,mschap2'}],
+        '/interface/l2tp-server/server/print': [{'enabled': 'true', 'max-mtu': '1450', 'max-mru': '1450',
+                                                 'authentication': 'mschap2'}],
+        '/interface/sstp-server/server/print': [{'enabled': 'false', 'port': '443', 'max-mtu': '1500',
+                                                 'max-mru': '1500', 'authentication': 'mschap2'}],
+        '/interface/ovpn-server/server/print': [{'enabled': 'false', 'port': '1194', 'mode': 'ip'}],
+        '/ip/ipsec/policy/print': [],
+        '/ip/ipsec/proposal/print': [{'name': 'default', 'enc-algorithms': 'aes-256-cbc',
+                                      'auth-algorithms': 'sha256'}],
+    }
+
+
+def match_query(row, queries):
+    """Evaluate RouterOS query words (?name=value, ?name, ?-name, ?#|&!) on a row"""
+    stack = []
+    for word in queries:
+        body = word[1:]
+        if body.startswith('#'):
+            for op in body[1:]:
+                if op == '!':
+                    stack.append(not stack.pop())
+                elif op in '|&':
+                    right, left = stack.pop(), stack.pop()
+                    stack.append(left or right if op == '|' else left and right)
+        elif body.startswith('-'):
+            stack.append(body[1:] not in row)
+        elif '=' in body:
+            key, _, value = body.partition('=')
+            stack.append(row.get(key) == value)
+        else:
+            stack.append(body in row)
+    return all(stack)
+
+
+def _format_uptime(seconds):
+    days, rest = divmod(int(seconds), 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f'{days}d{hours}h{minutes}m{seconds}s' if days else f'{hours}h{minutes}m{seconds}s'
+
+
+def self_signed_context():
+    """Server SSL context with a throw-away self-signed certificate"""
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'fake-router')])
+    now = datetime.utcnow()
+    cert = (x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=365))
+            .sign(key, hashes.SHA256()))
+
+    directory = tempfile.mkdtemp(prefix='fake-router-')
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+class FakeRouter:
+    """One virtual router answering RouterOS API commands
+
+    Interface counters grow at a per-interface rate and cpu-load/free-memory
+    vary between reads when dynamic is set, so rate and alert code sees
+    realistic data.
+    """
+
+    def __init__(self, latency=0.0, tables=None, jitter=0.0, loss=0.0, offline=None,
+                 dynamic=False, seed=0, username='admin', password='admin'):
+        """
+        Args:
+            latency (float): Seconds added to every reply
+            tables (dict, optional): Tables from build_tables()
+            jitter (float): Extra random delay of up to this many seconds
+            loss (float): Probability that a reply is delayed by a TCP
+                retransmission (RETRANSMIT_DELAY)
+            offline (str, optional): 'refuse' (nothing listens) or
+                'blackhole' (accepts but never answers)
+            dynamic (bool): Let counters and load change over time
+            seed (int): Seed of the random generator
+            username/password (str): Accepted credentials
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.offline = offline
+        self.dynamic = dynamic
+        self.username = username
+        self.password = password
+        self.tables = tables or build_tables()
+        self.connections = 0
+        self.commands = 0
+        self.bytes_sent = 0
+        self.listeners = {}
+        self.server = None
+        self._port = None
+        self._random = random.Random(seed)
+        self._rates = {}
+        self._booted_at = time.time() - 3 * 86400
+        self._base = {}
+        if dynamic:
+            self._init_dynamic()
+
+    def _init_dynamic(self):
+        for row in self.tables.get('/interface/print', []):
+            self._rates[row['.id']] = (self._random.uniform(1e3, 12e6), self._random.uniform(1e3, 6e6))
+            self._base[row['.id']] = {key: int(row[key]) for key in ('rx-byte', 'tx-byte', 'rx-packet', 'tx-packet')}
+        resource = self.tables['/system/resource/print'][0]
+        resource['board-name'] = self._random.choice(BOARDS)
+
+    def reboot(self):
+        """Reset uptime and interface counters as a reboot would"""
+        self._booted_at = time.time()
+        for base in self._base.values():
+            for key in base:
+                base[key] = 0
+        for row in self.tables.get('/interface/print', []):
+            for key in ('rx-byte', 'tx-byte', 'rx-packet', 'tx-packet'):
+                row[key] = '0'
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                words = await read_sentence(reader)
+                if not words or self.offline == 'blackhole':
+                    continue
+                asyncio.ensure_future(self.reply(words, writer))
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            for key in [key for key, listener in self.listeners.items() if listener[1] is writer]:
+                del self.listeners[key]
+            writer.close()
+
+    async def reply(self, words, writer):
+        self.commands += 1
+        command, attributes, tag = parse_sentence(words)
+        suffix = (f'.tag={tag}',) if tag is not None else ()
+
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if self.loss and self._random.random() < self.loss:
+            delay += RETRANSMIT_DELAY
+        if delay:
+            await asyncio.sleep(delay)
+
+        if command == '/login':
+            if 'name' not in attributes:
+                # /login không kèm name: cơ chế challenge cũ (trước 6.43) cần token
+                self._send(writer, encode_sentence('!done', '=ret=' + 'ab' * 16, *suffix))
+            elif attributes.get('name') != self.username or (
+                    'password' in attributes and attributes['password'] != self.password):
+                self._send(writer, encode_sentence('!trap', '=message=invalid user name or password (6)', *suffix)
+                           + encode_sentence('!done', *suffix))
+            else:
+                self._send(writer, encode_sentence('!done', *suffix))
+        elif command == '/cancel':
+            listener = self.listeners.pop((writer, attributes.get('tag')), None)
+            if listener is not None:
+                cancelled = (f".tag={attributes['tag']}",)
+                self._send(writer, encode_sentence('!trap', '=category=2', '=message=interrupted', *cancelled)
+                           + encode_sentence('!done', *cancelled))
+            self._send(writer, encode_sentence('!done', *suffix))
+        elif command.endswith('/listen') and command[:-7] + '/print' in self.tables:
+            # Không trả lời cho tới khi bảng thay đổi hoặc bị /cancel
+            self.listeners[(writer, tag)] = (command[:-7] + '/print', writer, tag, attributes.get('.proplist'))
+        elif command in self.tables:
+            queries = [word for word in words[1:] if word.startswith('?')]
+            out = []
+            for row in self._rows(command):
+                if queries and not match_query(row, queries):
+                    continue
+                out.append(self._row_sentence(row, attributes.get('.proplist'), suffix))
+            out.append(encode_sentence('!done', *suffix))
+            self._send(writer, b''.join(out))
+        else:
+            self._send(writer, encode_sentence('!trap', '=message=no such command', *suffix)
+                       + encode_sentence('!done', *suffix))
+
+    def _rows(self, command):
+        rows = self.tables[command]
+        if not self.dynamic:
+            return rows
+
+        now = time.time()
+        if command == '/system/resource/print':
+            resource = rows[0]
+            resource['uptime'] = _format_uptime(now - self._booted_at)
+            resource['cpu-load'] = str(min(100, max(0, int(self._random.gauss(25, 15)))))
+            total = int(resource['total-memory'])
+            resource['free-memory'] = str(int(total * self._random.uniform(0.3, 0.8)))
+        elif command == '/interface/print':
+            elapsed = now - self._booted_at
+            for row in rows:
+                rx_rate, tx_rate = self._rates.get(row['.id'], (0, 0))
+                base = self._base.get(row['.id'], {})
+                row['rx-byte'] = str((base.get('rx-byte', 0) + int(rx_rate * elapsed)) % (1 << 64))
+                row['tx-byte'] = str((base.get('tx-byte', 0) + int(tx_rate * elapsed)) % (1 << 64))
+                row['rx-packet'] = str(base.get('rx-packet', 0) + int(rx_rate * elapsed / 800))
+                row['tx-packet'] = str(base.get('tx-packet', 0) + int(tx_rate * elapsed / 800))
+        return rows
+
+    def set_row(self, path, row):
+        """Insert or update a row (matched by .id) and notify listeners"""
+        rows = self.tables.setdefault(path + '/print', [])
+        for current in rows:
+            if current.get('.id') == row.get('.id'):
+                current.update(row)
+                row = current
+                break
+        else:
+            rows.append(dict(row))
+        self._notify(path, row)
+
+    def remove_row(self, path, row_id):
+        """Delete a row and send a .dead notification to listeners"""
+        rows = self.tables.get(path + '/print', [])
+        rows[:] = [row for row in rows if row.get('.id') != row_id]
+        self._notify(path, {'.id': row_id, '.dead': 'true'})
+
+    def _notify(self, path, row):
+        command = path + '/print'
+        for listen_command, writer, tag, proplist in list(self.listeners.values()):
+            if listen_command == command:
+                keys = proplist + ',.dead' if proplist else None
+                self._send(writer, self._row_sentence(row, keys, (f'.tag={tag}',)))
+
+    @staticmethod
+    def _row_sentence(row, proplist, suffix):
+        keys = proplist.split(',') if proplist else None
+        items = ((k, row[k]) for k in keys if k in row) if keys else row.items()
+        return encode_sentence('!re', *(f'={k}={v}' for k, v in items), *suffix)
+
+    def _send(self, writer, data):
+        self.bytes_sent += len(data)
+        writer.write(data)
+
+    async def start(self, host='127.0.0.1', port=0, ssl_context=None):
+        """Start listening; returns the asyncio server (None when refusing)"""
+        if self.offline == 'refuse':
+            # Giữ một cổng không có ai lắng nghe: kết nối tới sẽ bị từ chối
+            with socket.socket() as sock:
+                sock.bind((host, port))
+                self._port = sock.getsockname()[1]
+            return None
+        self.server = await asyncio.start_server(self.handle, host, port, backlog=4096, ssl=ssl_context)
+        self._port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    @property
+    def port(self):
+        return self._port
+
+
+class FakeFleet:
+    """Thousands of virtual routers on localhost, one listening port each
+
+    Generation is deterministic for a given seed: the same routers get the
+    same tables, latency and offline state on every run.
+    """
+
+    def __init__(self, count, latency=0.0, jitter=0.0, loss=0.0, offline=0.0,
+                 offline_mode='refuse', interfaces=8, leases=20, wireless=0, vpn=0,
+                 tls=False, dynamic=True, seed=1):
+        """
+        Args:
+            count (int): Number of routers
+            latency/jitter (float): Seconds of delay per reply
+            loss (float): Probability of a retransmission delay per reply
+            offline (float): Fraction of routers that are unreachable
+            offline_mode (str): 'refuse' or 'blackhole'
+            interfaces/leases/wireless/vpn (int): Table sizes per router
+                (varied by +-50% per router)
+            tls (bool): Serve API-SSL with a self-signed certificate
+            dynamic (bool): Let counters and load change over time
+            seed (int): Seed of the generator
+        """
+        self.tls = tls
+        self.ssl_context = self_signed_context() if tls else None
+        rng = random.Random(seed)
+        offline_ids = set(rng.sample(range(count), int(round(count * offline))))
+
+        def vary(value):
+            return max(0, int(value * rng.uniform(0.5, 1.5))) if value else 0
+
+        self.routers = []
+        for index in range(count):
+            tables = build_tables(max(1, vary(interfaces)), vary(leases), 0, vary(wireless), vary(vpn))
+            self.routers.append(FakeRouter(
+                latency=latency, tables=tables, jitter=jitter, loss=loss,
+                offline=offline_mode if index in offline_ids else None,
+                dynamic=dynamic, seed=seed * 100003 + index
+            ))
+
+    async def start(self, host='127.0.0.1'):
+        # Cổng của router 'refuse' được cấp sau cùng để không bị router khác dùng lại
+        for router in sorted(self.routers, key=lambda r: r.offline == 'refuse'):
+            await router.start(host, 0, self.ssl_context)
+        return self
+
+    async def stop(self):
+        for router in self.routers:
+            await router.stop()
+
+    def devices(self, host='127.0.0.1'):
+        """Device-like objects for the collector (id, ip_address, api_port, ...)"""
+        return [
+            SimpleNamespace(
+                id=index + 1, name=f'router-{index + 1}', ip_address=host, api_port=router.port,
+                username=router.username, password_hash=router.password, use_ssl=self.tls,
+                model=router.tables['/system/resource/print'][0]['board-name']
+            )
+            for index, router in enumerate(self.routers)
+        ]
+
+    def stats(self):
+        return {
+            'routers': len(self.routers),
+            'offline': sum(1 for router in self.routers if router.offline),
+            'connections': sum(router.connections for router in self.routers),
+            'commands': sum(router.commands for router in self.routers),
+            'bytes_sent': sum(router.bytes_sent for router in self.routers),
+        }
+
+
+def _raise_file_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+async def _main(args):
+    if args.fleet <= 1 and not args.devices_json:
+        router = FakeRouter(latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+                            loss=args.loss, dynamic=True, seed=args.seed)
+        await router.start(args.host, args.port, self_signed_context() if args.tls else None)
+        print(f"Fake RouterOS API{'-SSL' if args.tls else ''} listening on {args.host}:{router.port}")
+        async with router.server:
+            await router.server.serve_forever()
+        return
+
+    _raise_file_limit()
+    fleet = FakeFleet(
+        args.fleet, latency=args.latency / 1000.0, jitter=args.jitter / 1000.0, loss=args.loss,
+        offline=args.offline, offline_mode=args.offline_mode, interfaces=args.interfaces,
+        leases=args.leases, wireless=args.wireless, vpn=args.vpn, tls=args.tls, seed=args.seed
+    )
+    await fleet.start(args.host)
+    devices = fleet.devices(args.host)
+    print(f"Fake fleet of {len(devices)} routers on {args.host} "
+          f"(ports {devices[0].api_port}-{devices[-1].api_port}, {fleet.stats()['offline']} offline)")
+    if args.devices_json:
+        with open(args.devices_json, 'w') as f:
+            json.dump([vars(device) for device in devices], f, indent=2)
+        print(f"Device list written to {args.devices_json}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8728, help='Port of a single router')
+    parser.add_argument('--fleet', type=int, default=1, help='Number of virtual routers')
+    parser.add_argument('--latency', type=float, default=0.0, help='Per-command latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability of a retransmission delay')
+    parser.add_argument('--offline', type=float, default=0.0, help='Fraction of unreachable routers')
+    parser.add_argument('--offline-mode', choices=('refuse', 'blackhole'), default='refuse')
+    parser.add_argument('--interfaces', type=int, default=8)
+    parser.add_argument('--leases', type=int, default=20)
+    parser.add_argument('--wireless', type=int, default=0)
+    parser.add_argument('--vpn', type=int, default=0, help='Active VPN sessions per router')
+    parser.add_argument('--tls', action='store_true', help='Serve API-SSL with a self-signed certificate')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--devices-json', help='Write the device list (for seeding the database) here')
+    asyncio.run(_main(parser.parse_args()))
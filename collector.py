@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Process thu thập metrics độc lập cho MikroTik Monitor
+
+Chạy các tác vụ nền (poll thiết bị, listen, dọn dữ liệu) tách khỏi process web,
+để có thể chạy web với nhiều worker mà không poll trùng. Nhiều process collector
+trên một hoặc nhiều máy dùng chung database sẽ tự chia thiết bị theo shard: mỗi
+process giữ lease của các shard của mình, shard của process bị dừng được process
+khác nhận lại sau tối đa COLLECTOR_LEASE_TTL giây. Cảnh báo được đánh giá trên mẫu
+do chính process thu thập, nên khi chia shard mỗi collector luôn đánh giá rule của
+thiết bị trong shard của mình.
+
+Ví dụ:
+    MONITORING_EMBEDDED=0 gunicorn ...            # web không tự thu thập
+    python collector.py --node-id collector-a
+    python collector.py --node-id collector-b
+    python collector.py --no-sharding --alerts    # một collector duy nhất
+"""
+
+import os
+import sys
+import signal
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('mikrotik_monitor.collector_main')
+
+
+def main(args):
+    from mik.app.config import Config
+
+    # Process collector luôn chia shard, trừ khi chỉ có đúng một process
+    Config.COLLECTOR_SHARDING = not args.no_sharding
+    if args.node_id:
+        Config.COLLECTOR_NODE_ID = args.node_id
+
+    from mik.app import create_app, scheduler
+    from mik.app.core.sharding import shard_coordinator
+    from mik.app.core.subscriptions import subscription_manager
+    from mik.app.database.ingest import metric_buffer
+    from mik.app.database.rollups import metric_rollups
+    from mik.app.database.chunks import metric_chunks
+    from mik.app.tasks.monitoring import initialize_monitoring_tasks
+
+    # Cảnh báo được đánh giá trên mẫu của chính process này: khi chia shard, mỗi collector
+    # phải đánh giá rule của shard mình, nếu không thiết bị của các shard khác không có cảnh báo
+    alerts = args.alerts or Config.COLLECTOR_SHARDING
+    if alerts and not args.alerts:
+        logger.info("Sharding is on: evaluating alert rules on this collector's devices (--alerts implied)")
+
+    app = create_app(start_tasks=False, web=False)
+    with app.app_context():
+        initialize_monitoring_tasks()
+        if alerts:
+            from mik.app.tasks.alerts import initialize_alert_tasks
+            initialize_alert_tasks()
+
+    scheduler.start()
+    logger.info(f"Collector {shard_coordinator.node_id} started "
+                f"(sharding {'on' if Config.COLLECTOR_SHARDING else 'off'}, alerts {'on' if alerts else 'off'})")
+
+    stop = threading.Event()
+
+    def signal_handler(sig, frame):
+        logger.info("Nhận tín hiệu thoát, đang dừng collector...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    stop.wait()
+
+    # Chờ chu kỳ đang chạy xong để các bộ đệm bên dưới nhận đủ mẫu cuối
+    scheduler.shutdown(wait=True)
+    subscription_manager.stop()
+    # Ghi nốt các metrics còn trong hàng đợi
+    metric_buffer.stop()
+    with app.app_context():
+        metric_rollups.flush()
+        if metric_chunks():
+            metric_chunks().flush()
+        if Config.COLLECTOR_SHARDING:
+            # Trả lease ngay để các node khác nhận shard mà không chờ hết hạn
+            shard_coordinator.leave()
+    logger.info("Collector stopped")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--node-id', help='Unique ID of this collector (default <hostname>-<pid>)')
+    parser.add_argument('--alerts', action='store_true', help='Evaluate alert rules on the samples collected by this process '
+                             '(always on with sharding, each collector checks its own devices)')
+    parser.add_argument('--no-sharding', action='store_true', help='Poll every device (single collector)')
+    main(parser.parse_args())